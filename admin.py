@@ -34,11 +34,12 @@ if not server_is_up():
     sys.exit(1)
 # admin.py  – Secure‑Chat Admin GUI (v2.0)
 import customtkinter as ctk
-import sqlite3, time, importlib, win32api, win32file
+import time, importlib, win32api, win32file
 from CTkMessagebox import CTkMessagebox
 from customtkinter import CTkInputDialog
 
-from utils.db_setup import _verify_password, DB_PATH
+from utils import db
+from utils.db_setup import _verify_password
 from utils.usb_auth  import authenticate as usb_authenticate, is_locked_out
 
 # ---------- CLI helpers (from manage_users.py) ----------
@@ -82,9 +83,7 @@ def choose_usb_dialog():
     return None
 
 def serial_in_use(serial):
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("SELECT username FROM users WHERE usb_serial=?", (serial,))
-    row = cur.fetchone(); conn.close()
+    row = db.query_one("SELECT username FROM users WHERE usb_serial=?", (serial,))
     return row[0] if row else None
 
 # ---------- Main GUI ----------
@@ -104,9 +103,7 @@ class AdminApp(ctk.CTk):
 
         def try_login():
             u, p = u_ent.get().strip(), p_ent.get().strip()
-            conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-            cur.execute("SELECT password, role FROM users WHERE username=?", (u,))
-            row = cur.fetchone(); conn.close()
+            row = db.query_one("SELECT password, role FROM users WHERE username=?", (u,))
 
             if not (row and row[1] == "admin" and _verify_password(row[0], p)):
                 CTkMessagebox(title="Login failed", message="Wrong credentials"); return
@@ -148,10 +145,9 @@ class AdminApp(ctk.CTk):
     # ----- helpers -----
     def _refresh_users(self):  # updating a user interface element with a list of usernames retrieved from a database. 
         self.user_list.configure(state="normal"); self.user_list.delete("1.0","end")
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        for (u,) in cur.execute("SELECT username FROM users ORDER BY username"):
+        for (u,) in db.query_all("SELECT username FROM users ORDER BY username"):
             self.user_list.insert("end", u + "\n")
-        conn.close(); self.user_list.configure(state="disabled")
+        self.user_list.configure(state="disabled")
 
     def _prompt(self, title, text):
         dlg = CTkInputDialog(title=title, text=text); val = dlg.get_input()
@@ -196,8 +192,7 @@ class AdminApp(ctk.CTk):
             CTkMessagebox(title="USB in use", message=f"Stick already assigned to '{used}'."); return
 
         # user exists?
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        cur.execute("SELECT usb_serial FROM users WHERE username=?", (u,)); row = cur.fetchone(); conn.close()
+        row = db.query_one("SELECT usb_serial FROM users WHERE username=?", (u,))
         if not row:
             CTkMessagebox(title="Error", message="User not found."); return
         if row[0] and row[0] != serial:
@@ -214,9 +209,7 @@ class AdminApp(ctk.CTk):
     # -- view / unlock locks --
     def _view_locked(self):
         now = int(time.time())
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        cur.execute("SELECT username, usb_locked_until FROM users WHERE usb_locked_until > ?", (now,))
-        rows = cur.fetchall(); conn.close()
+        rows = db.query_all("SELECT username, usb_locked_until FROM users WHERE usb_locked_until > ?", (now,))
         if not rows:
             CTkMessagebox(title="Locked Users", message="No locked accounts."); return
         lines = [f"{u} locked for {((t-now)//60)}m {((t-now)%60)}s" for u,t in rows]
@@ -225,9 +218,7 @@ class AdminApp(ctk.CTk):
     def _unlock(self):
         u = self._prompt("Unlock user","Username to unlock")
         if not u: return
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        cur.execute("UPDATE users SET usb_locked_until=0, usb_fail_count=0 WHERE username=?", (u,))
-        ok = cur.rowcount; conn.commit(); conn.close()
+        ok = db.execute("UPDATE users SET usb_locked_until=0, usb_fail_count=0 WHERE username=?", (u,))
         if ok:
             CTkMessagebox(title="Unlocked", message=f"User '{u}' unlocked.")
         else:
@@ -0,0 +1,148 @@
+# benchmarks/_harness.py
+"""
+Shared plumbing for the Secure-Chat benchmarks.
+
+• Runs a server engine in a child process on a throw-away certificate
+• Replaces the password / USB checks with "always OK" so the numbers
+  measure connection handling and routing, not PBKDF2 or SQLite
+• Minimal blocking client that walks the login state machine
+• Points utils.db at a throw-away users.db, so importing the server
+  (which creates / migrates the user store) leaves the repo's copy alone;
+  logs go to the console only and temp_stores() gives the server its
+  own history / offline directories, so no bench writes into the repo
+"""
+from __future__ import annotations
+import base64, logging, multiprocessing as mp, os, socket, ssl, sys, tempfile, time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import logging_config
+from utils import db
+# both before secure_chat_server is imported
+db.DB_PATH = Path(tempfile.mkdtemp(prefix="scbench_db_")) / "users.db"
+logging_config.setup_logging = lambda level=logging.DEBUG: logging.getLogger("secure_chat")
+
+from security import generate_ecdh_keypair, public_key_pem
+from utils.tls_setup import configure_tls_context, generate_self_signed_cert
+
+# a real (throw-away) key: the server now parses KEYPUB
+DUMMY_KEYPUB = b"KEYPUB " + base64.b64encode(public_key_pem(generate_ecdh_keypair()[1]))
+
+
+def temp_cert(key_type: str = "rsa") -> tuple[str, str]:
+    d = tempfile.mkdtemp(prefix="scbench_")
+    cert, key = os.path.join(d, "cert.pem"), os.path.join(d, "key.pem")
+    generate_self_signed_cert(cert, key, key_type)
+    return cert, key
+
+
+def temp_stores(srv) -> None:
+    """Give an imported server module throw-away history / offline stores."""
+    from utils.history import HistoryStore
+    from utils.offline import OfflineQueue
+    root = tempfile.mkdtemp(prefix="scbench_stores_")
+    srv._history = HistoryStore(os.path.join(root, "history"), page_bytes=srv.MAX_MSG_LEN - 1024)
+    srv._offline = OfflineQueue(os.path.join(root, "offline"))
+
+
+def _server_main(engine: str, port: int, cert: str, key: str, patches: dict) -> None:
+    import secure_chat_server as srv
+    logging.getLogger("secure_chat").setLevel(logging.WARNING)
+    temp_stores(srv)                    # a bench's own stores (patches) still win
+    srv._verify_password = lambda stored, p: True
+    srv._verify_usb = lambda u, s, d: (True, 0, 0)
+    srv.SOCKET_TIMEOUT_SECS = 600
+    for name, value in patches.items():
+        setattr(srv, name, value)
+    ctx = configure_tls_context(certfile=cert, keyfile=key,
+                                purpose=ssl.Purpose.CLIENT_AUTH)
+    srv.ENGINES[engine](ctx, port)
+
+
+def spawn_server(engine: str, port: int, cert: str, key: str,
+                 **patches) -> mp.Process:
+    """Start `engine` in a child process and wait until it accepts TCP."""
+    proc = mp.Process(target=_server_main, args=(engine, port, cert, key, patches),
+                      daemon=True)
+    proc.start()
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"{engine} server did not come up on port {port}")
+
+
+def client_ctx() -> ssl.SSLContext:
+    return configure_tls_context(certfile=None, keyfile=None,
+                                 purpose=ssl.Purpose.SERVER_AUTH)
+
+
+def mem_bytes(pid: int) -> tuple[int, int]:
+    """(resident, virtual) size of `pid` – psutil if present, else /proc."""
+    try:
+        import psutil
+        info = psutil.Process(pid).memory_info()
+        return info.rss, info.vms
+    except ImportError:
+        fields = {}
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                key, _, rest = line.partition(":")
+                fields[key] = rest.split()
+        return int(fields["VmRSS"][0]) * 1024, int(fields["VmSize"][0]) * 1024
+
+
+def cpu_secs(pid: int) -> float:
+    """user + system CPU time of `pid` – psutil if present, else /proc."""
+    try:
+        import psutil
+        t = psutil.Process(pid).cpu_times()
+        return t.user + t.system
+    except ImportError:
+        with open(f"/proc/{pid}/stat") as fh:
+            fields = fh.read().rpartition(")")[2].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+# ── framing ──────────────────────────────────────────────────────────
+def send_frame(sock, payload: bytes) -> None:
+    sock.sendall(len(payload).to_bytes(4, "big") + payload)
+
+
+def _read_exact(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("EOF")
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_frame(sock) -> bytes:
+    return _read_exact(sock, int.from_bytes(_read_exact(sock, 4), "big"))
+
+
+def connect(ctx: ssl.SSLContext, port: int, session=None) -> ssl.SSLSocket:
+    raw = socket.create_connection(("127.0.0.1", port))
+    raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return ctx.wrap_socket(raw, server_hostname="localhost", session=session)
+
+
+def login(sock, username: str, proto: int = 1) -> None:
+    """Walk [HELLO] → creds → USBREQ → USB → SUCCESS → KEYPUB → SUCCESS."""
+    if proto > 1:
+        send_frame(sock, f"HELLO {proto}".encode())
+        assert recv_frame(sock) == f"HELLO {proto}".encode()
+    send_frame(sock, f"{username}:pw".encode())
+    assert recv_frame(sock) == b"USBREQ"
+    send_frame(sock, b"0:00")
+    assert recv_frame(sock) == b"SUCCESS"
+    send_frame(sock, DUMMY_KEYPUB)
+    assert recv_frame(sock) == b"SUCCESS"
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+bench_ack.py – delivery-ack overhead and resend de-duplication
+
+"bob" and "alice" log in with the same wire version; alice sends --msgs
+sequenced private messages (--size bytes of ciphertext each) to bob.  We
+count the cumulative ACKs alice gets back against the messages bob gets,
+in frames and in bytes on the wire – acks are batched (ACK_EVERY /
+ACK_DELAY_SECS in the server), so at a steady rate they stay a small
+fraction.  Then alice reconnects and resends her last --resend messages
+with their old seqs plus as many new ones, as a client does after a
+dropped connection.  That reconnect is a full login, which starts a new
+window on the server, so the repeats reach bob; as a v2 client his
+per-sender window must let only the new ones through.  v1 receivers get
+the legacy CIPH without a seq and cannot tell repeats apart.
+
+    python benchmarks/bench_ack.py --msgs 20000 --engine asyncio
+"""
+from __future__ import annotations
+import argparse, base64, os, shutil, tempfile, threading, time
+
+from _harness import (client_ctx, connect, login, recv_frame, send_frame,
+                      spawn_server, temp_cert)
+from utils import delivery, wire
+from utils.history import HistoryStore
+
+
+def is_cipher(frame: bytes) -> bool:
+    return frame.startswith(b"CIPH ") or frame[0] in (wire.OP_CIPH, wire.OP_SCIPH)
+
+
+def is_ack(frame: bytes) -> bool:
+    return frame.startswith(b"ACK ") or frame[0] == wire.OP_ACK
+
+
+def acked_seq(frame: bytes) -> int:
+    return wire.parse_ack(frame) if frame[0] == wire.OP_ACK else int(frame[4:])
+
+
+def cipher_seq(frame: bytes) -> int:
+    if frame[0] == wire.OP_SCIPH:
+        return wire.parse_cipher_seq(frame)[2]
+    parts = frame.split(b" ", 4)
+    return int(parts[3]) if len(parts) == 5 else 0
+
+
+class Counter(threading.Thread):
+    """Reads one socket in the background, counting frames (and bytes) of one kind."""
+
+    def __init__(self, sock, match):
+        super().__init__(daemon=True)
+        self.sock, self.match = sock, match
+        self.frames = self.bytes = self.last = self.fresh = 0
+        self.window = delivery.SeqWindow()
+
+    def run(self) -> None:
+        try:
+            while True:
+                frame = recv_frame(self.sock)
+                if self.match(frame):
+                    self.frames += 1
+                    self.bytes += len(frame) + 4
+                    if is_ack(frame):
+                        self.last = acked_seq(frame)
+                    else:
+                        seq = cipher_seq(frame)
+                        self.fresh += not seq or self.window.accept(seq)
+        except (ConnectionError, OSError):
+            pass
+
+
+def sign_in(ctx, port: int, user: str, proto: int) -> tuple[object, dict[str, int]]:
+    s = connect(ctx, port)
+    login(s, user, proto)
+    ids = {}
+    if proto > 1:
+        frame = recv_frame(s)
+        while frame[0] != wire.OP_USERS:
+            frame = recv_frame(s)
+        ids = {name: uid for uid, name in wire.parse_users(frame)[1]}
+    return s, ids
+
+
+def frame_for(proto: int, ids: dict[str, int], seq: int, blob: bytes) -> bytes:
+    if proto > 1:
+        return wire.cipher_seq(ids["alice"], ids["bob"], seq, blob)
+    return b"CIPH alice bob %d %s" % (seq, base64.b64encode(blob))
+
+
+def wait_until(cond, secs: float) -> None:
+    deadline = time.monotonic() + secs
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def run(ctx, port: int, proto: int, n: int, size: int, resend: int) -> None:
+    bob, _ = sign_in(ctx, port, "bob", proto)
+    got = Counter(bob, is_cipher)
+    got.start()
+    alice, ids = sign_in(ctx, port, "alice", proto)
+    acks = Counter(alice, is_ack)
+    acks.start()
+
+    blob, seq0 = os.urandom(size), delivery.first_seq()
+    sent_bytes = 0
+    t0 = time.perf_counter()
+    for i in range(1, n + 1):
+        frame = frame_for(proto, ids, seq0 + i, blob)
+        send_frame(alice, frame)
+        sent_bytes += len(frame) + 4
+    wait_until(lambda: acks.last >= seq0 + n and got.frames >= n, 30)
+    secs = time.perf_counter() - t0
+    print(f"v{proto}: {got.frames:,}/{n:,} delivered in {secs:.2f}s; "
+          f"{acks.frames} ACKs = {acks.frames / n:.2%} of frames, "
+          f"{acks.bytes / sent_bytes:.3%} of bytes")
+
+    alice.close()
+    alice, ids = sign_in(ctx, port, "alice", proto)
+    before, fresh = got.frames, got.fresh
+    for seq in range(seq0 + n - resend + 1, seq0 + n + resend + 1):   # old tail + new
+        send_frame(alice, frame_for(proto, ids, seq, blob))
+    wait_until(lambda: got.fresh - fresh >= resend, 10)
+    time.sleep(0.3)                                 # room for duplicates to show up
+    print(f"v{proto}: resent {resend} + {resend} new after reconnect → "
+          f"{got.frames - before} reached bob, {got.fresh - fresh} shown "
+          f"({got.fresh - fresh - resend} duplicates)")
+    alice.close()
+    bob.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--msgs", type=int, default=20_000)
+    ap.add_argument("--size", type=int, default=64, help="ciphertext bytes per message")
+    ap.add_argument("--resend", type=int, default=200)
+    ap.add_argument("--engine", default="threaded")
+    ap.add_argument("--port", type=int, default=46500)
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    root = tempfile.mkdtemp(prefix="scbench_ack_")
+    proc = spawn_server(args.engine, args.port, cert, key, _history=HistoryStore(root))
+    ctx = client_ctx()
+    try:
+        for proto in (1, 2):
+            run(ctx, args.port, proto, args.msgs, args.size, args.resend)
+            time.sleep(0.3)
+    finally:
+        proc.terminate()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
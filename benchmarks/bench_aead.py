@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+bench_aead.py – per-call Cipher() vs cached AEADContext (security.encryption)
+
+Per-message seal/open cost for 64 B, 1 KB and 64 KB payloads: the
+pre-context code path that builds a Cipher for every call, the cached
+context one message at a time, and the seal_many/open_many batch calls,
+plus the cost of one nonce (global lock + urandom vs NonceSequencer).
+Blobs from both paths are checked to decrypt with the other.
+
+    python benchmarks/bench_aead.py --iters 20000
+"""
+from __future__ import annotations
+import argparse, os, threading, time
+
+import _harness  # noqa: F401  (puts the repo root on sys.path)
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from security import get_context, seal_many, open_many
+from security.encryption import NonceSequencer
+
+_iv_lock, _iv_counter = threading.Lock(), 0
+
+
+def _get_unique_iv() -> bytes:
+    """The pre-sequencer IV: global locked counter + 8 random bytes."""
+    global _iv_counter
+    with _iv_lock:
+        _iv_counter += 1
+        counter = _iv_counter.to_bytes(4, 'big')
+    return counter + os.urandom(8)
+
+
+def legacy_seal(key: bytes, data: bytes) -> bytes:
+    iv = _get_unique_iv()
+    enc = Cipher(algorithms.AES(key), modes.GCM(iv), backend=default_backend()).encryptor()
+    ct = enc.update(data) + enc.finalize()
+    return iv + enc.tag + ct
+
+
+def legacy_open(key: bytes, blob: bytes) -> bytes:
+    dec = Cipher(algorithms.AES(key), modes.GCM(blob[:12], blob[12:28]),
+                 backend=default_backend()).decryptor()
+    return dec.update(blob[28:]) + dec.finalize()
+
+
+def us_per(fn, n: int, batch: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n // batch):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iters", type=int, default=20000)
+    ap.add_argument("--batch", type=int, default=64)
+    args = ap.parse_args()
+
+    key = os.urandom(32)
+    ctx = get_context(key)
+    seq = NonceSequencer()
+    print(f"nonce: legacy {us_per(_get_unique_iv, args.iters) * 1e3:.0f} ns, "
+          f"sequencer {us_per(seq.next, args.iters) * 1e3:.0f} ns")
+    print(f"{'size':>6}  {'legacy seal':>11} {'ctx seal':>9} {'seal_many':>9}"
+          f"  {'legacy open':>11} {'ctx open':>9} {'open_many':>9}   (µs/msg)")
+    for size in (64, 1024, 64 * 1024):
+        data = os.urandom(size)
+        assert legacy_open(key, ctx.seal(data)) == data
+        assert ctx.open(memoryview(legacy_seal(key, data))) == data
+        n = max(args.batch, args.iters if size < 65536 else args.iters // 20)
+        blob = ctx.seal(data)
+        items, blobs = [data] * args.batch, [blob] * args.batch
+        row = (us_per(lambda: legacy_seal(key, data), n),
+               us_per(lambda: ctx.seal(data), n),
+               us_per(lambda: seal_many(key, items), n, args.batch),
+               us_per(lambda: legacy_open(key, blob), n),
+               us_per(lambda: ctx.open(blob), n),
+               us_per(lambda: open_many(key, blobs), n, args.batch))
+        label = f"{size // 1024} KB" if size >= 1024 else f"{size} B"
+        print(f"{label:>6}  {row[0]:>11.2f} {row[1]:>9.2f} {row[2]:>9.2f}"
+              f"  {row[3]:>11.2f} {row[4]:>9.2f} {row[5]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+bench_auth.py – message routing latency during a PBKDF2 login storm
+
+Two logged-in users ping CIPH frames at each other while --storm threads
+hammer the server with fresh password logins (real 100k-round PBKDF2);
+storm clients negotiate HELLO and honestly solve any login puzzle.
+Reported: routing latency, and "amplification" – server CPU seconds the
+storm obtained per CPU second it spent itself (this process).
+On a single machine the storm's puzzle solving competes with the server
+(and the routing probe) for the same cores; read routing latency in
+"puzzle" mode with that in mind.
+
+• puzzle    – current server: auth pool + adaptive proof-of-work
+• bounded   – auth pool only (BUSY <secs> when its queue is full)
+• unbounded – every login hashes at once, as each client thread used to
+
+    python benchmarks/bench_auth.py --storm 32 --secs 5
+"""
+from __future__ import annotations
+import argparse, base64, hashlib, os, statistics, threading, time
+
+from _harness import client_ctx, connect, cpu_secs, login, recv_frame, send_frame, spawn_server, temp_cert
+from utils import puzzle
+from utils.auth_pool import AuthPool
+
+
+def pbkdf2_check(stored: bytes, password: str) -> bool:
+    hashlib.pbkdf2_hmac("sha256", password.encode(), b"s" * 16, 100_000)
+    return True
+
+
+def password_login(ctx, port: int, user: bytes) -> str:
+    s = connect(ctx, port)
+    try:
+        send_frame(s, b"HELLO 2")
+        hello = recv_frame(s).split()
+        if len(hello) == 4:
+            send_frame(s, b"SOLVE %d" % puzzle.solve(base64.b64decode(hello[2]), int(hello[3])))
+        send_frame(s, user + b":pw")
+        return recv_frame(s).split(b" ")[0].decode()
+    finally:
+        s.close()
+
+
+def storm(ctx, port: int, stop: threading.Event, counts: dict) -> None:
+    while not stop.is_set():
+        try:
+            reply = password_login(ctx, port, b"mallory")
+        except OSError:
+            reply = "error"
+        counts[reply] = counts.get(reply, 0) + 1
+
+
+def probe(a, b, secs: float) -> list[float]:
+    frame = b"CIPH alice bob " + base64.b64encode(os.urandom(64))
+    lat, deadline = [], time.time() + secs
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        send_frame(a, frame)
+        while not recv_frame(b).startswith(b"CIPH"):
+            pass
+        lat.append((time.perf_counter() - t0) * 1e3)
+        time.sleep(0.02)
+    return sorted(lat)
+
+
+def run(mode: str, port: int, cert: str, key: str, args) -> None:
+    patches = {"_verify_password": pbkdf2_check}
+    if mode != "puzzle":
+        patches["PUZZLE_ENABLED"] = False
+    if mode == "unbounded":
+        patches["_auth_pool"] = AuthPool(workers=args.storm, max_pending=10**6)
+    proc = spawn_server(args.engine, port, cert, key, **patches)
+    ctx = client_ctx()
+    try:
+        a, b = connect(ctx, port), connect(ctx, port)
+        login(a, "alice"); login(b, "bob")
+        idle = probe(a, b, 1.0)
+        stop, counts = threading.Event(), {}
+        threads = [threading.Thread(target=storm, args=(ctx, port, stop, counts), daemon=True)
+                   for _ in range(args.storm)]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)                          # let the storm build up
+        srv0, own0 = cpu_secs(proc.pid), time.process_time()
+        busy = probe(a, b, args.secs)
+        amp = (cpu_secs(proc.pid) - srv0) / max(1e-9, time.process_time() - own0)
+        stop.set()
+        p = lambda l, q: l[min(len(l) - 1, int(q * len(l)))]
+        print(f"{mode:<10} {statistics.median(idle):>8.2f} {statistics.median(busy):>10.2f} "
+              f"{p(busy, .99):>10.2f} {amp:>14.2f}   storm {counts}")
+    finally:
+        proc.terminate(); proc.join()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--storm", type=int, default=32, help="concurrent login threads")
+    ap.add_argument("--secs", type=float, default=5.0)
+    ap.add_argument("--engine", default="threaded")
+    ap.add_argument("--port", type=int, default=46400)
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    print(f"routing latency (ms) with {args.storm} login threads, {os.cpu_count()} CPU(s)")
+    print(f"{'auth':<10} {'idle p50':>8} {'storm p50':>10} {'storm p99':>10} {'amplification':>14}")
+    for n, mode in enumerate(("puzzle", "bounded", "unbounded")):
+        run(mode, args.port + n, cert, key, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+bench_certs.py – full TLS handshake throughput: RSA-2048 vs ECDSA P-256 vs Ed25519
+
+For each certificate key type a server is started on a fresh self-signed
+cert and N clients handshake (no session resumption), --workers at a
+time.  Clients pin the cert like ChatClient.start does (cafile=cert,
+CERT_REQUIRED), so this also checks that pinning works for every type.
+
+    python benchmarks/bench_certs.py --conns 500 --engine threaded
+"""
+from __future__ import annotations
+import argparse, ssl, statistics, time
+from concurrent.futures import ThreadPoolExecutor
+
+from _harness import connect, cpu_secs, spawn_server, temp_cert
+from utils.tls_setup import CERT_KEY_TYPES, configure_tls_context
+
+
+def handshake(ctx, port: int) -> float:
+    t0 = time.perf_counter()
+    connect(ctx, port).close()
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--conns", type=int, default=500)
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--engine", default="threaded")
+    ap.add_argument("--types", nargs="+", default=list(CERT_KEY_TYPES))
+    ap.add_argument("--port", type=int, default=46300)
+    args = ap.parse_args()
+
+    print(f"{args.conns} full handshakes, {args.workers} at a time ({args.engine})")
+    print(f"{'cert':<8} {'handshakes/s':>13} {'server CPU µs':>14} {'p50 ms':>8}")
+    for n, key_type in enumerate(args.types):
+        cert, key = temp_cert(key_type)
+        ctx = configure_tls_context(certfile=None, keyfile=None,
+                                    purpose=ssl.Purpose.SERVER_AUTH, cafile=cert)
+        proc = spawn_server(args.engine, args.port + n, cert, key)
+        try:
+            c0, t0 = cpu_secs(proc.pid), time.perf_counter()
+            with ThreadPoolExecutor(args.workers) as pool:
+                lat = list(pool.map(lambda _: handshake(ctx, args.port + n), range(args.conns)))
+            elapsed, cpu = time.perf_counter() - t0, cpu_secs(proc.pid) - c0
+        finally:
+            proc.terminate(); proc.join()
+        print(f"{key_type:<8} {args.conns / elapsed:>13,.0f} {cpu / args.conns * 1e6:>14,.0f} "
+              f"{statistics.median(lat) * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+bench_db.py – user-store cost of a login, old access pattern vs utils.db
+
+One "login" is what the server does against users.db: the password row
+lookup, the USB row lookup and the USB counter reset.  "legacy" opens a
+fresh sqlite3 connection per statement on a rollback-journal file and
+always runs the UPDATE; "pooled" goes through utils.db (pooled WAL
+connections, cached statements, UPDATE only when the counters are set);
+"cached" reads both rows from utils.userdir.UserDirectory, which only
+polls PRAGMA data_version.
+PBKDF2 is cut to --rounds iterations so the database, not the hash,
+dominates.  --threads threads log in as --users distinct users.
+
+    python benchmarks/bench_db.py --users 1000 --threads 8 --secs 5
+"""
+from __future__ import annotations
+import argparse, os, random, sqlite3, tempfile, threading, time
+from contextlib import closing
+
+import _harness  # noqa: F401  (puts the repo root on sys.path)
+from utils import db, db_setup
+from utils.userdir import UserDirectory
+
+PW_SQL  = "SELECT password FROM users WHERE username=?"
+USB_SQL = ("SELECT usb_serial, usb_hash, usb_fail_count, usb_locked_until "
+           "FROM users WHERE username=?")
+RST_SQL = "UPDATE users SET usb_fail_count=0, usb_locked_until=0 WHERE username=?"
+
+
+def make_db(path: str, users: int) -> None:
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("""CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+            password BLOB NOT NULL, role TEXT NOT NULL DEFAULT 'user',
+            usb_serial TEXT, usb_hash TEXT,
+            usb_fail_count INTEGER DEFAULT 0, usb_locked_until INTEGER DEFAULT 0)""")
+        pw = db_setup._hash_password("pw")
+        conn.executemany("INSERT INTO users (username, password, usb_serial, usb_hash) "
+                         "VALUES (?, ?, '1234', 'ab')",
+                         [(f"user{i}", pw) for i in range(users)])
+
+
+def login_legacy(path: str, user: str) -> None:
+    with closing(sqlite3.connect(path)) as conn:
+        row = conn.execute(PW_SQL, (user,)).fetchone()
+    db_setup._verify_password(row[0], "pw")
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute(USB_SQL, (user,)).fetchone()
+        conn.execute(RST_SQL, (user,))
+
+
+def login_pooled(path: str, user: str) -> None:
+    row = db.query_one(PW_SQL, (user,), path)
+    db_setup._verify_password(row[0], "pw")
+    _, _, fails, locked = db.query_one(USB_SQL, (user,), path)
+    if fails or locked:
+        db.execute(RST_SQL, (user,), path)
+
+
+def login_cached(users: UserDirectory, user: str) -> None:
+    rec = users.get(user)
+    db_setup._verify_password(rec.password, "pw")
+    if rec.usb_fail_count or rec.usb_locked_until:
+        db.execute(RST_SQL, (user,), users.path)
+
+
+def run(variant: str, users: int, threads: int, secs: float) -> float:
+    path = os.path.join(tempfile.mkdtemp(prefix="scbench_db_"), "users.db")
+    make_db(path, users)
+    login = {"legacy": login_legacy, "pooled": login_pooled, "cached": login_cached}[variant]
+    target = UserDirectory(path) if variant == "cached" else path
+    count, stop = [0] * threads, time.perf_counter() + secs
+
+    def work(k: int) -> None:
+        rnd = random.Random(k)
+        while time.perf_counter() < stop:
+            login(target, f"user{rnd.randrange(users)}")
+            count[k] += 1
+
+    ts = [threading.Thread(target=work, args=(k,)) for k in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    if variant == "cached":
+        target.close()
+    db.close_all()
+    return sum(count) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--secs", type=float, default=5.0)
+    ap.add_argument("--rounds", type=int, default=1000, help="PBKDF2 iterations")
+    args = ap.parse_args()
+    db_setup._ROUNDS = args.rounds
+
+    print(f"{args.users:,} users, {args.threads} threads, PBKDF2 {args.rounds:,} rounds")
+    for variant in ("legacy", "pooled", "cached"):
+        rate = run(variant, args.users, args.threads, args.secs)
+        print(f"{variant:<7} {rate:>10,.0f} logins/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+bench_engines.py – threaded vs asyncio server engine
+
+• connections-per-GB : N idle TLS connections parked at the login prompt,
+                       server RSS growth divided into 1 GiB (virtual size
+                       growth is printed too – that is where thread stacks go)
+• messages-per-second: P sender→receiver pairs, each pushing M CIPH frames
+
+    python benchmarks/bench_engines.py --conns 2000 --pairs 20 --msgs 2000
+"""
+from __future__ import annotations
+import argparse, base64, os, threading, time
+
+from _harness import (client_ctx, connect, login, recv_frame, mem_bytes,
+                      send_frame, spawn_server, temp_cert)
+
+GiB = 1024 ** 3
+
+
+def conn_cost(proc, port: int, n: int) -> tuple[float, float]:
+    """Per-connection (resident, virtual) bytes on the server."""
+    ctx = client_ctx()
+    time.sleep(0.5)
+    rss0, vms0 = mem_bytes(proc.pid)
+    socks = [connect(ctx, port) for _ in range(n)]
+    time.sleep(1.0)                                  # let the server settle
+    rss1, vms1 = mem_bytes(proc.pid)
+    for s in socks:
+        s.close()
+    return max(1, rss1 - rss0) / n, max(0, vms1 - vms0) / n
+
+
+def msgs_per_sec(port: int, pairs: int, msgs: int) -> float:
+    ctx = client_ctx()
+    senders, receivers = [], []
+    for i in range(pairs):
+        r = connect(ctx, port); login(r, f"rx{i}"); receivers.append(r)
+        s = connect(ctx, port); login(s, f"tx{i}"); senders.append(s)
+
+    done = threading.Barrier(pairs + 1)
+
+    def drain(sock, me: str):
+        got = 0
+        while got < msgs:
+            if recv_frame(sock).startswith(b"CIPH "):
+                got += 1
+        done.wait()
+
+    for i, r in enumerate(receivers):
+        threading.Thread(target=drain, args=(r, f"rx{i}"), daemon=True).start()
+
+    blob = base64.b64encode(os.urandom(100))
+    frames = [f"CIPH tx{i} rx{i} ".encode() + blob for i in range(pairs)]
+
+    def pump(sock, frame):
+        for _ in range(msgs):
+            send_frame(sock, frame)
+
+    t0 = time.perf_counter()
+    for s, f in zip(senders, frames):
+        threading.Thread(target=pump, args=(s, f), daemon=True).start()
+    done.wait()
+    elapsed = time.perf_counter() - t0
+    for s in senders + receivers:
+        s.close()
+    return pairs * msgs / elapsed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--conns", type=int, default=1000)
+    ap.add_argument("--pairs", type=int, default=10)
+    ap.add_argument("--msgs", type=int, default=2000)
+    ap.add_argument("--port", type=int, default=45444)
+    ap.add_argument("--engines", nargs="+", default=["threaded", "asyncio"])
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    print(f"{'engine':<10} {'RSS/conn':>10} {'VM/conn':>12} {'conns/GB':>10} {'msgs/s':>10}")
+    for n, engine in enumerate(args.engines):
+        port = args.port + n
+        proc = spawn_server(engine, port, cert, key)
+        try:
+            rss, vms = conn_cost(proc, port, args.conns)
+            rate = msgs_per_sec(port, args.pairs, args.msgs)
+        finally:
+            proc.terminate(); proc.join()
+        print(f"{engine:<10} {rss:>10,.0f} {vms:>12,.0f} {GiB / rss:>10,.0f} {rate:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+bench_envelope.py – "Everyone" messages: one CIPH per peer vs one envelope
+
+Client-side cost of sending one message to N peers: AES-GCM CPU and
+upstream bytes (length headers included) for the old per-peer CIPH
+loop and for security.seal_envelope + a single ENV frame, on both wire
+protocols.
+
+    python benchmarks/bench_envelope.py --peers 300 --size 1024
+"""
+from __future__ import annotations
+import argparse, base64, os, time
+
+import _harness  # noqa: F401  (puts the repo root on sys.path)
+from security import encrypt_message, seal_envelope
+from utils import wire
+from utils.framing import encode_frame
+
+
+def per_peer(keys: dict, msg: str, v2: bool) -> int:
+    sent = 0
+    for i, (peer, key) in enumerate(keys.items()):
+        blob = encrypt_message(key, msg)
+        frame = (wire.cipher(0, i + 1, blob) if v2 else
+                 b"CIPH me " + peer.encode() + b" " + base64.b64encode(blob))
+        sent += len(encode_frame(frame))
+    return sent
+
+
+def envelope(keys: dict, msg: str, v2: bool) -> int:
+    body, wraps = seal_envelope(keys, msg)
+    if v2:
+        frame = wire.env(0, [(i + 1, wk) for i, wk in enumerate(wraps.values())], body)
+    else:
+        frame = (b"ENV me " + base64.b64encode(body) + b" " +
+                 b",".join(p.encode() + b":" + base64.b64encode(wk) for p, wk in wraps.items()))
+    return len(encode_frame(frame))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--peers", type=int, default=300)
+    ap.add_argument("--size", type=int, default=1024, help="plaintext characters")
+    ap.add_argument("--rounds", type=int, default=20)
+    args = ap.parse_args()
+
+    keys = {f"user{i:03d}": os.urandom(32) for i in range(args.peers)}
+    msg = "x" * args.size
+    print(f"{args.peers} peers, {args.size} B message")
+    print(f"{'mode':<16} {'upstream bytes':>15} {'client ms/msg':>14}")
+    for name, fn in (("per-peer v1", lambda: per_peer(keys, msg, False)),
+                     ("per-peer v2", lambda: per_peer(keys, msg, True)),
+                     ("envelope v1", lambda: envelope(keys, msg, False)),
+                     ("envelope v2", lambda: envelope(keys, msg, True))):
+        t0 = time.perf_counter()
+        for _ in range(args.rounds):
+            sent = fn()
+        ms = (time.perf_counter() - t0) / args.rounds * 1e3
+        print(f"{name:<16} {sent:>15,} {ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+bench_fanout.py – per-recipient framing vs encode-once + coalesced sends
+
+Drives the server's real routing helpers and per-client ThreadOutbox
+writers against N in-memory TLS sessions (ssl.MemoryBIO, no network) and
+reports, per operation:
+
+• bytes of distinct frame buffers handed to TLS ("copied")
+• TLS records emitted, TLS records per second and operations per second
+
+Operations:  BCAST fan-out to every peer, and the newcomer key sync
+(one KEYPUB per online user delivered to a single socket).
+
+    python benchmarks/bench_fanout.py --users 500 --rounds 20
+"""
+from __future__ import annotations
+import argparse, base64, logging, os, ssl, time
+
+from _harness import DUMMY_KEYPUB, client_ctx, temp_cert, temp_stores
+from utils.outbox import ThreadOutbox
+from utils.tls_setup import configure_tls_context
+import secure_chat_server as srv
+
+logging.getLogger("secure_chat").setLevel(logging.WARNING)
+
+
+class BioPeer:
+    """Server end of an in-memory TLS session that quacks like a socket."""
+
+    def __init__(self, srv_ctx: ssl.SSLContext, cli_ctx: ssl.SSLContext):
+        s_in, s_out, c_in, c_out = (ssl.MemoryBIO() for _ in range(4))
+        self.out = s_out
+        self.tls = srv_ctx.wrap_bio(s_in, s_out, server_side=True)
+        cli = cli_ctx.wrap_bio(c_in, c_out, server_hostname="localhost")
+        done = set()
+        while len(done) < 2:
+            for name, obj in (("c", cli), ("s", self.tls)):
+                if name in done:
+                    continue
+                try:
+                    obj.do_handshake(); done.add(name)
+                except ssl.SSLWantReadError:
+                    pass
+            s_in.write(c_out.read()); c_in.write(s_out.read())
+        self.tls.write(b"")                      # flush session tickets
+        s_out.read()
+        self.reset()
+
+    def reset(self) -> None:
+        self.buffers: list = []                  # kept alive so ids stay unique
+        self.records = 0
+
+    def shutdown(self, how) -> None:
+        pass
+
+    def sendall(self, data) -> None:
+        self.buffers.append(data)
+        self.tls.write(data)
+        out, i = self.out.read(), 0
+        while i < len(out):                      # walk TLS record headers
+            i += 5 + int.from_bytes(out[i + 3:i + 5], "big")
+            self.records += 1
+
+
+def legacy_send(sock, payload: bytes) -> None:
+    sock.sendall(len(payload).to_bytes(4, "big") + payload)
+
+
+def measure(peers, boxes, op, rounds: int) -> tuple[float, float, float, float]:
+    for p in peers:
+        p.reset()
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        op()
+        while any(b.depth() for b in boxes):      # wait for the writers
+            time.sleep(0.0005)
+    elapsed = time.perf_counter() - t0
+    unique = {id(b): len(b) for p in peers for b in p.buffers}
+    records = sum(p.records for p in peers)
+    return sum(unique.values()) / rounds, records / rounds, records / elapsed, rounds / elapsed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=500)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--size", type=int, default=1024, help="ciphertext bytes")
+    args = ap.parse_args()
+    temp_stores(srv)
+
+    cert, key = temp_cert()
+    sctx = configure_tls_context(certfile=cert, keyfile=key, purpose=ssl.Purpose.CLIENT_AUTH)
+    cctx = client_ctx()
+    peers = [BioPeer(sctx, cctx) for _ in range(args.users)]
+    pub = DUMMY_KEYPUB.split(b" ", 1)[1].decode()
+    boxes = [ThreadOutbox(p, f"u{i}") for i, p in enumerate(peers)]
+    sessions = [srv.Session(f"u{i}", b, ("127.0.0.1", i), pub) for i, b in enumerate(boxes)]
+    for s in sessions:
+        srv.connected_clients[s.username] = s
+
+    frame = b"BCAST u0 " + base64.b64encode(os.urandom(args.size))
+    others = peers[1:]
+    newcomer = peers[0]
+    keypubs = [f"KEYPUB u{i} {pub}".encode() for i in range(args.users)]
+
+    def legacy_keysync():
+        for kp in keypubs:
+            legacy_send(newcomer, kp)
+
+    def new_keysync():
+        with srv._clients_lock:
+            wires = srv._existing_keypub_frames(srv.PROTO_V1)
+        boxes[0].put_many(wires)
+
+    cases = [
+        ("bcast legacy",   lambda: [legacy_send(p, frame) for p in others]),
+        ("bcast shared",   lambda: srv._route_broadcast(sessions[0], frame)),
+        ("keysync legacy", legacy_keysync),
+        ("keysync batched", new_keysync),
+    ]
+    print(f"{args.users} users, {args.size} B ciphertext")
+    print(f"{'case':<16} {'bytes copied/op':>15} {'records/op':>11} {'records/s':>11} {'ops/s':>8}")
+    for name, op in cases:
+        built, rec, rps, ops = measure(peers, boxes, op, args.rounds)
+        print(f"{name:<16} {built:>15,.0f} {rec:>11,.1f} {rps:>11,.0f} {ops:>8,.1f}")
+
+
+if __name__ == "__main__":
+    main()
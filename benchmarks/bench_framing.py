@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+bench_framing.py – legacy two-read framing vs utils.framing.FrameReader
+
+Pushes N frames through a TLS socket pair and reports frames/s and
+recv calls per frame for both readers.
+
+    python benchmarks/bench_framing.py --frames 50000 --size 200
+"""
+from __future__ import annotations
+import argparse, os, socket, ssl, threading, time
+
+from _harness import client_ctx, temp_cert
+from utils.framing import FrameReader
+from utils.tls_setup import configure_tls_context
+
+
+class Counting:
+    """Socket proxy that counts recv / recv_into calls."""
+    def __init__(self, sock):
+        self.sock, self.calls = sock, 0
+    def recv(self, n):
+        self.calls += 1
+        return self.sock.recv(n)
+    def recv_into(self, buf, n=0):
+        self.calls += 1
+        return self.sock.recv_into(buf, n)
+
+
+def legacy_read(sock) -> bytes:
+    """The pre-FrameReader _recv_prefixed/_read_exact pair."""
+    def exact(n):
+        data = b""
+        while len(data) < n:
+            chunk = sock.recv(n - len(data))
+            if not chunk:
+                return b""
+            data += chunk
+        return data
+    hdr = exact(4)
+    return exact(int.from_bytes(hdr, "big")) if hdr else b""
+
+
+def tls_pair(cert: str, key: str):
+    a, b = socket.socketpair()
+    srv = configure_tls_context(certfile=cert, keyfile=key, purpose=ssl.Purpose.CLIENT_AUTH)
+    out: list = []
+    t = threading.Thread(target=lambda: out.append(srv.wrap_socket(b, server_side=True)))
+    t.start()
+    w = client_ctx().wrap_socket(a, server_hostname="localhost")
+    t.join()
+    return w, out[0]
+
+
+def run(kind: str, cert: str, key: str, frames: int, size: int) -> tuple[float, float]:
+    writer, reader_sock = tls_pair(cert, key)
+    payload = os.urandom(size)
+    wire = len(payload).to_bytes(4, "big") + payload
+
+    def pump():
+        batch = wire * 64
+        for _ in range(frames // 64):
+            writer.sendall(batch)
+        writer.close()
+    threading.Thread(target=pump, daemon=True).start()
+
+    sock = Counting(reader_sock)
+    got = 0
+    t0 = time.perf_counter()
+    if kind == "legacy":
+        while legacy_read(sock):
+            got += 1
+    else:
+        fr = FrameReader(sock, 64 * 1024)
+        while fr.read_frame() is not None:
+            got += 1
+    elapsed = time.perf_counter() - t0
+    reader_sock.close()
+    return got / elapsed, sock.calls / max(1, got)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--frames", type=int, default=50_000)
+    ap.add_argument("--size", type=int, default=200)
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    print(f"{'reader':<12} {'frames/s':>12} {'recv/frame':>11}")
+    for kind in ("legacy", "FrameReader"):
+        rate, calls = run(kind, cert, key, args.frames, args.size)
+        print(f"{kind:<12} {rate:>12,.0f} {calls:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
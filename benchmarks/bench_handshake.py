@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+bench_handshake.py – accept throughput during a connection storm
+
+• S "stalled" peers open TCP and never send a ClientHello
+• then N real clients connect; we time each TLS handshake on its own
+  and the overall accepted-connections-per-second
+
+With the handshake inside the accept loop a single stalled peer blocks
+everyone behind it; with per-connection handshakes it only costs a slot.
+
+    python benchmarks/bench_handshake.py --stalled 50 --conns 500
+"""
+from __future__ import annotations
+import argparse, socket, time
+
+from _harness import client_ctx, spawn_server, temp_cert
+
+
+def storm(port: int, stalled: int, n: int, timeout: float) -> tuple[float, list[float], int]:
+    ctx = client_ctx()
+    parked = [socket.create_connection(("127.0.0.1", port)) for _ in range(stalled)]
+    lat, failed = [], 0
+    t0 = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        try:
+            raw = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+            s = ctx.wrap_socket(raw, server_hostname="localhost")
+            lat.append(time.perf_counter() - t)
+            s.close()
+        except OSError:
+            failed += 1
+    elapsed = time.perf_counter() - t0
+    for p in parked:
+        p.close()
+    return (n - failed) / elapsed, sorted(lat), failed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--stalled", type=int, default=50)
+    ap.add_argument("--conns", type=int, default=500)
+    ap.add_argument("--timeout", type=float, default=5.0)
+    ap.add_argument("--port", type=int, default=45464)
+    ap.add_argument("--engines", nargs="+", default=["threaded", "asyncio"])
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    print(f"{'engine':<10} {'accepts/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    for n, engine in enumerate(args.engines):
+        port = args.port + n
+        proc = spawn_server(engine, port, cert, key)
+        try:
+            rate, lat, failed = storm(port, args.stalled, args.conns, args.timeout)
+        finally:
+            proc.terminate(); proc.join()
+        p = lambda q: 1000 * lat[min(len(lat) - 1, int(q * len(lat)))] if lat else float("nan")
+        print(f"{engine:<10} {rate:>10,.0f} {p(.5):>8.2f} {p(.99):>8.2f} {failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+bench_history.py – loading scrollback from the server-side message history
+
+One conversation is filled with --msgs messages (--size bytes of
+ciphertext each) in a utils.history.HistoryStore.  Then the newest
+--scroll of them are read back three ways:
+
+  scan      read the whole data column and parse every record, keep the
+            tail – what a plain append-only log would need
+  pages     HistoryStore.page() back from "now", --limit per call
+  wire      the same pages as HISTORY requests to a running server
+
+    python benchmarks/bench_history.py --msgs 200000 --scroll 10000
+"""
+from __future__ import annotations
+import argparse, os, shutil, tempfile, time
+
+from _harness import client_ctx, connect, login, recv_frame, send_frame, spawn_server, temp_cert
+from utils import history
+from utils.history import HistoryStore
+
+NOW = 2 ** 62                       # "before" for the newest page
+
+
+def fill(store: HistoryStore, conv: str, n: int, size: int) -> float:
+    blob = os.urandom(size)
+    t0 = time.perf_counter()
+    for i in range(n):
+        store.append(conv, "alice" if i % 2 else "bob", history.KIND_CIPHER, blob)
+    store.sync()
+    return time.perf_counter() - t0
+
+
+def scan(root: str, conv: str, want: int) -> float:
+    t0 = time.perf_counter()
+    cdir = os.path.join(root, conv.encode().hex())
+    records = []
+    for name in sorted(n for n in os.listdir(cdir) if n.endswith(".dat")):
+        with open(os.path.join(cdir, name), "rb") as fh:
+            records.extend(history.iter_records(fh.read()))
+    assert len(records[-want:]) == want
+    return time.perf_counter() - t0
+
+
+def pages(store: HistoryStore, conv: str, want: int, limit: int) -> tuple[float, int]:
+    t0, got, before, calls = time.perf_counter(), 0, NOW, 0
+    while got < want:
+        count, before, _ = store.page(conv, before, min(limit, want - got))
+        if not count:
+            break
+        got, calls = got + count, calls + 1
+    assert got == want
+    return time.perf_counter() - t0, calls
+
+
+def wire_pages(ctx, port: int, want: int, limit: int) -> tuple[float, int]:
+    s = connect(ctx, port)
+    login(s, "alice")
+    t0, got, before, calls = time.perf_counter(), 0, NOW, 0
+    while got < want:
+        send_frame(s, b"HISTORY bob %d %d" % (before, min(limit, want - got)))
+        frame = recv_frame(s)
+        while not frame.startswith(b"HIST "):
+            frame = recv_frame(s)
+        _, _, count, before = frame.split(b"\n", 1)[0].split(b" ")
+        if not int(count):
+            break
+        got, calls, before = got + int(count), calls + 1, int(before)
+    secs = time.perf_counter() - t0
+    s.close()
+    assert got == want
+    return secs, calls
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--msgs", type=int, default=200_000)
+    ap.add_argument("--scroll", type=int, default=10_000, help="messages of scrollback to load")
+    ap.add_argument("--size", type=int, default=64, help="ciphertext bytes per message")
+    ap.add_argument("--limit", type=int, default=500, help="records per page")
+    ap.add_argument("--engine", default="threaded")
+    ap.add_argument("--port", type=int, default=46400)
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="scbench_history_")
+    conv = history.conversation("alice", "bob")
+    try:
+        store = HistoryStore(root)
+        secs = fill(store, conv, args.msgs, args.size)
+        print(f"stored  {args.msgs:,} × {args.size} B in {secs:.2f}s "
+              f"({args.msgs / secs:,.0f} msgs/s)")
+        store.close()
+
+        secs = scan(root, conv, args.scroll)
+        print(f"scan    last {args.scroll:,} of {args.msgs:,}: {secs * 1000:7.1f} ms")
+        store = HistoryStore(root)
+        secs, calls = pages(store, conv, args.scroll, args.limit)
+        print(f"pages   last {args.scroll:,} of {args.msgs:,}: {secs * 1000:7.1f} ms "
+              f"({calls} pages, store opened cold)")
+        store.close()
+
+        cert, key = temp_cert()
+        proc = spawn_server(args.engine, args.port, cert, key, _history=HistoryStore(root))
+        try:
+            secs, calls = wire_pages(client_ctx(), args.port, args.scroll, args.limit)
+            print(f"wire    last {args.scroll:,} of {args.msgs:,}: {secs * 1000:7.1f} ms "
+                  f"({calls} HISTORY round trips, {args.engine})")
+        finally:
+            proc.terminate()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+bench_iprep.py – cost of the pre-TLS IP reputation check (utils.iprep)
+
+Writes --prefixes random IPv4 deny rules (/16 … /32) plus some IPv6 ones
+to a temp file, loads them, and times IPReputation.allowed() for random
+addresses – the work added to every accept().  A linear scan over the
+same rules with ipaddress is shown for scale on a 1,000-rule subset.
+
+    python benchmarks/bench_iprep.py --prefixes 100000
+"""
+from __future__ import annotations
+import argparse, ipaddress, os, random, tempfile, time
+
+from _harness import mem_bytes
+from utils.iprep import IPReputation
+
+
+def rand_v4(rng: random.Random) -> str:
+    return str(ipaddress.IPv4Address(rng.getrandbits(32)))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--prefixes", type=int, default=100_000)
+    ap.add_argument("--lookups", type=int, default=200_000)
+    args = ap.parse_args()
+    rng = random.Random(7)
+
+    lines = [f"deny {rand_v4(rng)}/{rng.randint(16, 32)}" for _ in range(args.prefixes)]
+    lines += [f"deny {ipaddress.IPv6Address(rng.getrandbits(128))}/{rng.choice((32, 48, 64))}"
+              for _ in range(args.prefixes // 10)]
+    path = os.path.join(tempfile.mkdtemp(prefix="sciprep_"), "ip_rules.txt")
+    with open(path, "w") as fh:
+        fh.write("\n".join(lines))
+
+    rss0 = mem_bytes(os.getpid())[0]
+    t0 = time.perf_counter()
+    rep = IPReputation(path)
+    load = time.perf_counter() - t0
+    rss = (mem_bytes(os.getpid())[0] - rss0) / 2**20
+    print(f"{rep.rule_count():,} prefixes loaded in {load:.2f} s, {rss:.1f} MiB")
+
+    addrs = [rand_v4(rng) for _ in range(args.lookups)]
+    t0 = time.perf_counter()
+    denied = sum(not rep.allowed(a) for a in addrs)
+    per = (time.perf_counter() - t0) / len(addrs) * 1e6
+    print(f"allowed(): {per:.2f} µs per lookup ({denied / len(addrs):.0%} denied)")
+
+    nets = [ipaddress.ip_network(l.split()[1], strict=False) for l in lines[:1000]]
+    sample = [ipaddress.ip_address(a) for a in addrs[:2000]]
+    t0 = time.perf_counter()
+    for a in sample:
+        any(a in n for n in nets if n.version == a.version)
+    per = (time.perf_counter() - t0) / len(sample) * 1e6
+    print(f"linear scan, 1,000 rules: {per:,.0f} µs per lookup")
+
+
+if __name__ == "__main__":
+    main()
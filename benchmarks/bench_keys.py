@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+bench_keys.py – KEYPUB encodings and derive_shared_key caching
+
+Bytes per KEYPUB payload for PEM vs SEC1 point vs X25519, and the cost
+of deriving keys for N known peers the first time (parse + ECDH + HKDF)
+and again after a reconnect storm (parsed-key / shared-key caches hit).
+
+    python benchmarks/bench_keys.py --peers 300
+"""
+from __future__ import annotations
+import argparse, base64, logging, time
+
+import _harness  # noqa: F401  (puts the repo root on sys.path)
+from security import key_management as km
+from security import encode_public_key, generate_ecdh_keypair, public_key_pem
+
+INFO = b"SecureChat AES-GCM"
+
+
+def derive_all(priv, blobs) -> float:
+    t0 = time.perf_counter()
+    for b in blobs:
+        km.derive_shared_key(priv, b, b"", INFO)
+    return (time.perf_counter() - t0) / len(blobs) * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--peers", type=int, default=300)
+    args = ap.parse_args()
+    logging.getLogger("secure_chat").setLevel(logging.WARNING)
+
+    _, p256 = generate_ecdh_keypair()
+    _, x = generate_ecdh_keypair("x25519")
+    print("KEYPUB payload bytes (v1 frames carry base64, v2 raw):")
+    for name, raw in (("P-256 PEM", public_key_pem(p256)),
+                      ("P-256 SEC1 compressed", encode_public_key(p256)),
+                      ("P-256 SEC1 uncompressed", encode_public_key(p256, compressed=False)),
+                      ("X25519 raw", encode_public_key(x))):
+        print(f"  {name:<24} raw {len(raw):>4}   base64 {len(base64.b64encode(raw)):>4}")
+
+    print(f"\nderive_shared_key for {args.peers} peers (µs/peer):")
+    for curve, encode in (("p256", public_key_pem), ("p256", encode_public_key),
+                          ("x25519", encode_public_key)):
+        priv, _ = generate_ecdh_keypair(curve)
+        blobs = [encode(generate_ecdh_keypair(curve)[1]) for _ in range(args.peers)]
+        km._parsed_keys.clear(); km._shared_keys.clear()
+        cold = derive_all(priv, blobs)
+        warm = derive_all(priv, blobs)             # reconnect: same peers again
+        label = f"{curve} {'PEM' if encode is public_key_pem else 'compact'}"
+        print(f"  {label:<16} cold {cold:>8.1f}   cached {warm:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+bench_offline.py – store-and-forward of private messages to an offline user
+
+A sender logs in and sends --msgs CIPH frames (--size bytes of ciphertext
+each) to "bob", who is offline, so every one lands in the server's
+offline queue (utils.offline).  Then bob logs in and we time from his
+SUCCESS to the last queued message arriving – once as a v1 client
+(base64 text frames) and once as v2 (binary frames).
+
+    python benchmarks/bench_offline.py --msgs 50000 --engine threaded
+"""
+from __future__ import annotations
+import argparse, base64, os, shutil, tempfile, time
+
+from _harness import (client_ctx, connect, login, recv_frame, send_frame,
+                      spawn_server, temp_cert)
+from utils import wire
+from utils.history import HistoryStore
+from utils.offline import OfflineQueue
+from utils.userdir import UserDirectory, UserRecord
+
+
+class AnyUser(UserDirectory):
+    """Every name is a user (the harness skips the real password / USB checks)."""
+
+    def get(self, username):
+        return UserRecord(username, b"", "user", None, None, 0, 0)
+
+    def refresh(self, force=False):
+        return 0
+
+
+def fill(ctx, port: int, n: int, size: int) -> float:
+    s = connect(ctx, port)
+    login(s, "alice")
+    blob = base64.b64encode(os.urandom(size))
+    t0 = time.perf_counter()
+    for _ in range(n):
+        send_frame(s, b"CIPH alice bob " + blob)
+    send_frame(s, b"CIPH alice alice " + blob)      # comes back once all of the above were routed
+    while not recv_frame(s).startswith(b"CIPH "):
+        pass
+    secs = time.perf_counter() - t0
+    s.close()
+    return secs
+
+
+def drain(ctx, port: int, n: int, proto: int) -> float:
+    s = connect(ctx, port)
+    login(s, "bob", proto)
+    t0, got = time.perf_counter(), 0
+    while got < n:
+        frame = recv_frame(s)
+        if frame.startswith(b"CIPH ") or (proto > 1 and frame[0] == wire.OP_CIPH):
+            got += 1
+    secs = time.perf_counter() - t0
+    s.close()
+    return secs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--msgs", type=int, default=50_000)
+    ap.add_argument("--size", type=int, default=64, help="ciphertext bytes per message")
+    ap.add_argument("--engine", default="threaded")
+    ap.add_argument("--port", type=int, default=46300)
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    root = tempfile.mkdtemp(prefix="scbench_offline_")
+    queue = OfflineQueue(os.path.join(root, "offline"))
+    proc = spawn_server(args.engine, args.port, cert, key, _user_dir=AnyUser(),
+                        _offline=queue, _history=HistoryStore(os.path.join(root, "history")))
+    ctx = client_ctx()
+    try:
+        for proto in (1, 2):
+            secs = fill(ctx, args.port, args.msgs, args.size)
+            time.sleep(1.1)                         # one sweep: the queue gets its fsync
+            print(f"queued  {args.msgs:,} × {args.size} B in {secs:.2f}s "
+                  f"({args.msgs / secs:,.0f} msgs/s)")
+            secs = drain(ctx, args.port, args.msgs, proto)
+            print(f"drained {args.msgs:,} to a v{proto} client in {secs * 1000:.0f} ms "
+                  f"({args.msgs / secs:,.0f} msgs/s)")
+            time.sleep(0.5)
+    finally:
+        proc.terminate()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+bench_presence.py – full USERS list per login vs snapshot + merged deltas
+
+N clients log in back to back (a server restart / reconnect storm) and
+we count presence bytes queued to all outboxes.  "legacy" sends every
+online client the full USERS list on every login; "delta" is the
+current server: one snapshot to the newcomer, and one merged
+PRESENCE delta per debounce window for everyone (--windows of them).
+Outboxes are in-memory; KEYPUB traffic is left out of both.
+
+    python benchmarks/bench_presence.py --users 1000 --windows 4
+"""
+from __future__ import annotations
+import argparse, logging
+
+import _harness  # (puts the repo root on sys.path)
+import secure_chat_server as srv
+from utils.framing import encode_frame
+from utils.wire import PROTO_V2
+
+
+class CountingBox:
+    name = "count"
+    def __init__(self):
+        self.bytes = 0
+    def put(self, w):
+        self.bytes += len(w)
+        return True
+    def put_many(self, ws):
+        return all([self.put(w) for w in ws])
+
+
+def legacy(n: int) -> int:
+    total, online = 0, []
+    for i in range(n):
+        online.append(f"user{i:05d}")
+        frame = encode_frame(f"USERS {','.join(online)}".encode())
+        total += len(frame) * len(online)
+    return total
+
+
+def delta(n: int, windows: int) -> int:
+    srv.connected_clients.clear()
+    srv._call_later = lambda delay, fn: None          # we flush by hand
+    srv._broadcast_keypub = lambda sess, version: None
+    srv._key_bundles = lambda username, epoch, since: []
+    boxes = []
+    per_window = max(1, n // windows)
+    for i in range(n):
+        box = CountingBox()
+        boxes.append(box)
+        srv._go_online(srv.Session(f"user{i:05d}", box, ("127.0.0.1", i), "", proto=PROTO_V2))
+        if (i + 1) % per_window == 0:
+            srv._flush_presence()
+    srv._flush_presence()
+    success = len(encode_frame(b"SUCCESS"))
+    return sum(b.bytes for b in boxes) - success * n
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--windows", type=int, default=4,
+                    help="debounce windows the storm is spread over")
+    args = ap.parse_args()
+    logging.getLogger("secure_chat").setLevel(logging.WARNING)
+    _harness.temp_stores(srv)
+
+    old, new = legacy(args.users), delta(args.users, args.windows)
+    print(f"{args.users} logins over {args.windows} debounce windows")
+    print(f"  legacy full lists : {old:>14,} bytes")
+    print(f"  snapshot + deltas : {new:>14,} bytes  ({old / new:,.0f}x less)")
+
+
+if __name__ == "__main__":
+    main()
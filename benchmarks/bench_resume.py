@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+bench_resume.py – reconnect latency: full login vs resume token
+
+The server keeps the real PBKDF2 cost (100k rounds, as utils.db_setup)
+but the USB check is patched out.  Each round drops the connection and
+reconnects, timing TCP connect + TLS + login until the final SUCCESS.
+
+    python benchmarks/bench_resume.py --rounds 20 --engine asyncio
+"""
+from __future__ import annotations
+import argparse, hashlib, statistics, time
+
+from _harness import (DUMMY_KEYPUB, client_ctx, connect, recv_frame, send_frame,
+                      spawn_server, temp_cert)
+
+
+def pbkdf2_check(stored: bytes, password: str) -> bool:
+    hashlib.pbkdf2_hmac("sha256", password.encode(), b"s" * 16, 100_000)
+    return True
+
+
+def read_until(sock, prefix: bytes) -> bytes:
+    while True:
+        frame = recv_frame(sock)
+        if frame.startswith(prefix):
+            return frame
+
+
+def full_login(ctx, port: int) -> tuple[object, str]:
+    s = connect(ctx, port)
+    send_frame(s, b"HELLO 2"); recv_frame(s)
+    send_frame(s, b"alice:pw"); recv_frame(s)
+    send_frame(s, b"0:00"); recv_frame(s)
+    send_frame(s, DUMMY_KEYPUB)
+    return s, read_until(s, b"RESUME ")[7:].decode()
+
+
+def resume(ctx, port: int, token: str) -> tuple[object, str]:
+    s = connect(ctx, port)
+    send_frame(s, b"HELLO 2"); recv_frame(s)
+    send_frame(s, f"RESUME alice {token}".encode())
+    assert recv_frame(s) == b"SUCCESS"
+    return s, read_until(s, b"RESUME ")[7:].decode()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--engine", default="threaded")
+    ap.add_argument("--port", type=int, default=46100)
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    proc = spawn_server(args.engine, args.port, cert, key, _verify_password=pbkdf2_check)
+    ctx = client_ctx()
+    try:
+        sock, token = full_login(ctx, args.port)
+        for name, step in (("full login", lambda tok: full_login(ctx, args.port)),
+                           ("resume", lambda tok: resume(ctx, args.port, tok))):
+            times = []
+            for _ in range(args.rounds):
+                sock.close()
+                t0 = time.perf_counter()
+                sock, token = step(token)
+                times.append((time.perf_counter() - t0) * 1e3)
+            print(f"{name:<11} median {statistics.median(times):7.1f} ms   "
+                  f"p90 {sorted(times)[int(len(times) * 0.9) - 1]:7.1f} ms")
+    finally:
+        proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+bench_throttle.py – login-throttle memory under an address-cycling attack
+
+--ips distinct source addresses each fail one login.  "legacy" is the old
+plain dict (ip -> (fails, locked_until), never cleaned); "throttle" is
+utils.throttle.LoginThrottle with its default cap.  Each variant runs in
+its own process; we report entries kept and resident-memory growth, then
+register_fail() throughput from --threads threads with 1 vs 16 stripes.
+
+    python benchmarks/bench_throttle.py --ips 1000000 --threads 8
+"""
+from __future__ import annotations
+import argparse, multiprocessing as mp, os, threading, time
+
+from _harness import mem_bytes
+from utils.throttle import LoginThrottle
+
+
+def addr(i: int) -> str:
+    return f"{10 + (i >> 24) % 200}.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+
+
+def memory(variant: str, n: int) -> None:
+    rss0 = mem_bytes(os.getpid())[0]
+    store = {} if variant == "legacy" else LoginThrottle()
+    marks, t0 = [], time.perf_counter()
+    for i in range(n):
+        ip = addr(i)
+        if variant == "legacy":
+            cnt, locked_until = store.get(ip, (0, 0))
+            store[ip] = (cnt + 1, 0)
+        else:
+            store.register_fail(ip)
+        if (i + 1) % (n // 4) == 0:
+            marks.append((mem_bytes(os.getpid())[0] - rss0) / 2**20)
+    secs = time.perf_counter() - t0
+    curve = "  ".join(f"{m:6.1f}" for m in marks)
+    print(f"{variant:<9} {len(store):>10,} entries  RSS MiB at ¼ ½ ¾ 1: {curve}  "
+          f"{n / secs:>10,.0f} fails/s")
+
+
+def contention(stripes: int, threads: int, per_thread: int) -> float:
+    store = LoginThrottle(stripes=stripes)
+    def work(k: int) -> None:
+        for i in range(per_thread):
+            store.register_fail(addr(k * per_thread + i))
+    ts = [threading.Thread(target=work, args=(k,)) for k in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return threads * per_thread / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--ips", type=int, default=1_000_000)
+    ap.add_argument("--threads", type=int, default=8)
+    args = ap.parse_args()
+
+    print(f"{args.ips:,} distinct IPs, one failed login each")
+    for variant in ("legacy", "throttle"):
+        p = mp.Process(target=memory, args=(variant, args.ips))
+        p.start(); p.join()
+    for stripes in (1, 16):
+        rate = contention(stripes, args.threads, 50_000)
+        print(f"{stripes:>2} stripe(s), {args.threads} threads: {rate:>10,.0f} fails/s")
+
+
+if __name__ == "__main__":
+    main()
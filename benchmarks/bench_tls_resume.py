@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+bench_tls_resume.py – mass reconnect: full TLS handshakes vs session tickets
+
+N clients connect (full handshake), exchange HELLO so the TLS 1.3 ticket
+is read, and keep their SSLSession; then all N reconnect at once – first
+without offering the session, then offering it.  Reports server CPU per
+handshake and the client-side handshake latency for each pass.
+
+    python benchmarks/bench_tls_resume.py --clients 300 --engine threaded
+"""
+from __future__ import annotations
+import argparse, statistics, time
+from concurrent.futures import ThreadPoolExecutor
+
+from _harness import client_ctx, connect, cpu_secs, recv_frame, send_frame, spawn_server, temp_cert
+
+
+def one(ctx, port: int, session=None):
+    t0 = time.perf_counter()
+    s = connect(ctx, port, session)
+    lat = time.perf_counter() - t0
+    send_frame(s, b"HELLO 2"); recv_frame(s)      # reading data pulls in the ticket
+    return s.session, s.session_reused, lat, s
+
+
+def storm(ctx, port: int, pid: int, sessions, workers: int):
+    c0 = cpu_secs(pid)
+    with ThreadPoolExecutor(workers) as pool:
+        out = list(pool.map(lambda sess: one(ctx, port, sess), sessions))
+    cpu = cpu_secs(pid) - c0
+    for *_, s in out:
+        s.close()
+    return out, cpu
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clients", type=int, default=300)
+    ap.add_argument("--workers", type=int, default=16, help="concurrent reconnects")
+    ap.add_argument("--engine", default="threaded")
+    ap.add_argument("--port", type=int, default=46200)
+    args = ap.parse_args()
+
+    cert, key = temp_cert()
+    proc = spawn_server(args.engine, args.port, cert, key)
+    ctx = client_ctx()
+    try:
+        first, _ = storm(ctx, args.port, proc.pid, [None] * args.clients, args.workers)
+        sessions = [sess for sess, *_ in first]
+        print(f"{args.clients} reconnects, {args.workers} at a time ({args.engine})")
+        print(f"{'pass':<10} {'resumed':>8} {'server CPU µs/conn':>19} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, offer in (("full", [None] * args.clients), ("ticket", sessions)):
+            out, cpu = storm(ctx, args.port, proc.pid, offer, args.workers)
+            lat = sorted(l for _, _, l, _ in out)
+            print(f"{name:<10} {sum(r for _, r, _, _ in out):>8} "
+                  f"{cpu / args.clients * 1e6:>19,.0f} "
+                  f"{statistics.median(lat) * 1e3:>8.2f} {lat[int(len(lat) * .99) - 1] * 1e3:>8.2f}")
+    finally:
+        proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+bench_wire.py – ASCII wire protocol v1 vs binary v2 (utils.wire)
+
+Reports bytes on the wire per chat frame and the server's relay CPU per
+message (_dispatch → encoded frame queued), with every online user on
+the same protocol.  Outboxes are in-memory, so only parsing and encoding
+are measured, not TLS or socket writes.
+
+    python benchmarks/bench_wire.py --size 1024 --users 50
+"""
+from __future__ import annotations
+import argparse, base64, logging, os, time
+
+import _harness  # (puts the repo root on sys.path)
+import secure_chat_server as srv
+from utils import wire
+from utils.framing import encode_frame
+from utils.wire import PROTO_V1, PROTO_V2
+
+
+class NullBox:
+    """Outbox stand-in that only counts queued bytes."""
+    name = "null"
+    def __init__(self):
+        self.bytes = 0
+    def put(self, w):
+        self.bytes += len(w)
+        return True
+
+
+def per_op(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=1024, help="ciphertext bytes")
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--iters", type=int, default=20000)
+    args = ap.parse_args()
+    logging.getLogger("secure_chat").setLevel(logging.WARNING)
+    _harness.temp_stores(srv)
+
+    blob = os.urandom(args.size)
+    print(f"{args.size} B ciphertext, {args.users} users")
+    print(f"{'proto':<6} {'CIPH bytes':>11} {'BCAST bytes':>12} "
+          f"{'CIPH µs':>8} {'BCAST µs':>9} {'USERS bytes':>12}")
+    for proto in (PROTO_V1, PROTO_V2):
+        srv.connected_clients.clear()
+        sessions = []
+        for i in range(args.users):
+            s = srv.Session(f"user{i}", NullBox(), ("127.0.0.1", i), "", proto=proto)
+            s.uid = srv._user_id(s.username)
+            srv.connected_clients[s.username] = s
+            sessions.append(s)
+        a, b = sessions[0], sessions[1]
+        if proto == PROTO_V1:
+            ciph  = f"CIPH {a.username} {b.username} ".encode() + base64.b64encode(blob)
+            bcast = f"BCAST {a.username} ".encode() + base64.b64encode(blob)
+        else:
+            ciph, bcast = wire.cipher(a.uid, b.uid, blob), wire.bcast(a.uid, blob)
+        # the chat loop hands _dispatch a memoryview into the reader's buffer
+        ciph_mv, bcast_mv = memoryview(bytearray(ciph)), memoryview(bytearray(bcast))
+        t_ciph  = per_op(lambda: srv._dispatch(a, ciph_mv), args.iters)
+        t_bcast = per_op(lambda: srv._dispatch(a, bcast_mv), max(1, args.iters // args.users))
+        users = len(srv._user_list_frame(proto))
+        print(f"v{proto:<5} {len(encode_frame(ciph)):>11,} {len(encode_frame(bcast)):>12,} "
+              f"{t_ciph:>8.2f} {t_bcast:>9.2f} {users:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+bench_writebehind.py – commits caused by a storm of failed USB attempts
+
+--threads threads record failed USB attempts against --users users for
+--secs seconds.  "legacy" opens a connection and commits one UPDATE per
+attempt on a rollback-journal file (synchronous=FULL: every commit syncs
+the journal and the database); "direct" commits one UPDATE per attempt
+through utils.db (WAL); "write-behind" buffers them in
+utils.writebehind.WriteBehind and flushes once per --flush seconds, as
+the server's sweeper does.  Commits are what turn into syncs, so
+commits/s is the number to watch: it follows the attempt rate for the
+first two and the flush rate for the last.
+
+    python benchmarks/bench_writebehind.py --threads 8 --secs 5
+"""
+from __future__ import annotations
+import argparse, os, random, sqlite3, tempfile, threading, time
+from contextlib import closing
+
+import _harness  # noqa: F401  (puts the repo root on sys.path)
+from bench_db import make_db
+from utils import db
+from utils.writebehind import WriteBehind
+
+FAIL_SQL = "UPDATE users SET usb_fail_count=?, usb_locked_until=? WHERE username=?"
+
+
+def run(variant: str, users: int, threads: int, secs: float, flush: float) -> tuple[float, float]:
+    path = os.path.join(tempfile.mkdtemp(prefix="scbench_wb_"), "users.db")
+    make_db(path, users)
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("ALTER TABLE users ADD COLUMN last_login INTEGER DEFAULT 0")
+        conn.execute("ALTER TABLE users ADD COLUMN last_seen INTEGER DEFAULT 0")
+        conn.commit()
+    wb = WriteBehind(path)
+    attempts, commits = [0] * threads, [0]
+    stop = time.perf_counter() + secs
+
+    def attempt(user: str, fails: int) -> None:
+        if variant == "legacy":
+            with closing(sqlite3.connect(path)) as conn, conn:
+                conn.execute("PRAGMA synchronous=FULL")
+                conn.execute(FAIL_SQL, (fails, 0, user))
+        elif variant == "direct":
+            db.execute(FAIL_SQL, (fails, 0, user), path)
+        else:
+            wb.update(user, usb_fail_count=fails, usb_locked_until=0)
+
+    def work(k: int) -> None:
+        rnd = random.Random(k)
+        while time.perf_counter() < stop:
+            attempt(f"user{rnd.randrange(users)}", rnd.randrange(3))
+            attempts[k] += 1
+
+    def flusher() -> None:
+        while time.perf_counter() < stop:
+            time.sleep(flush)
+            commits[0] += bool(wb.flush())
+
+    ts = [threading.Thread(target=work, args=(k,)) for k in range(threads)]
+    if variant == "write-behind":
+        ts.append(threading.Thread(target=flusher))
+    t0 = time.perf_counter()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    commits[0] += bool(wb.flush())                  # what shutdown() would write
+    elapsed = time.perf_counter() - t0
+    db.close_all()
+    n = sum(attempts)
+    if variant != "write-behind":
+        commits[0] = n
+    return n / elapsed, commits[0] / elapsed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--secs", type=float, default=5.0)
+    ap.add_argument("--flush", type=float, default=1.0, help="write-behind flush interval")
+    args = ap.parse_args()
+
+    print(f"{args.users:,} users, {args.threads} threads, {args.secs:g}s")
+    for variant in ("legacy", "direct", "write-behind"):
+        rate, commits = run(variant, args.users, args.threads, args.secs, args.flush)
+        print(f"{variant:<13} {rate:>10,.0f} attempts/s  {commits:>8,.1f} commits/s")
+
+
+if __name__ == "__main__":
+    main()
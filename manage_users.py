@@ -2,8 +2,9 @@
 """
 manage_users.py – add / update / delete users and program USB sticks (DB‑only)
 """
-import argparse, os, hashlib, secrets, sqlite3, sys, win32api
-from utils.db_setup import _hash_password, DB_PATH
+import argparse, os, hashlib, secrets, sys, win32api
+from utils import db
+from utils.db_setup import _hash_password
 
 def _serial(drive):   
     if not drive.endswith("\\"): drive += "\\"
@@ -16,26 +17,21 @@ def _write_key(drive):
 
 def program_usb(username, drive):
     serial = _serial(drive); h = _write_key(drive)
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("UPDATE users SET usb_serial=?, usb_hash=? WHERE username=?", (serial, h, username))
-    if cur.rowcount==0: sys.exit("User not found in DB.")
-    conn.commit(); conn.close()
+    if db.execute("UPDATE users SET usb_serial=?, usb_hash=? WHERE username=?", (serial, h, username))==0:
+        sys.exit("User not found in DB.")
     print(f"USB programmed. Serial={serial}")
 
 def add(user, pwd, drive):
-    conn=sqlite3.connect(DB_PATH); cur=conn.cursor()
-    cur.execute("INSERT INTO users (username,password) VALUES (?,?)", (user,_hash_password(pwd))); conn.commit(); conn.close()
+    db.execute("INSERT INTO users (username,password) VALUES (?,?)", (user,_hash_password(pwd)))
     program_usb(user, drive)
 
 def update(user, pwd, drive):
     if pwd:
-        conn=sqlite3.connect(DB_PATH); cur=conn.cursor()
-        cur.execute("UPDATE users SET password=? WHERE username=?", (_hash_password(pwd),user)); conn.commit(); conn.close()
+        db.execute("UPDATE users SET password=? WHERE username=?", (_hash_password(pwd),user))
     if drive: program_usb(user, drive)
 
 def delete(user):
-    conn=sqlite3.connect(DB_PATH); cur=conn.cursor()
-    cur.execute("DELETE FROM users WHERE username=?", (user,)); conn.commit(); conn.close()
+    db.execute("DELETE FROM users WHERE username=?", (user,))
     print("User deleted.")
 
 if __name__ == "__main__":
@@ -6,17 +6,22 @@ Secure-Chat Client
 • Login GUI (CustomTkinter)
 • USB 2-factor picker
 • Heartbeat + auto-reconnect (keeps GUI alive)
+• Negotiates the binary wire protocol v2 (utils.wire)
+• Scrollback: one page of server-kept history per conversation (utils.history)
+• Private messages numbered, kept until acknowledged, resent after a reconnect
 """
 
 import os, socket, ssl, sys, threading, time, logging
 from typing import Tuple, Optional, Dict
 
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives import serialization 
 
 import base64, os                                   
 from security import (                              
     encrypt_message, decrypt_message,
-    generate_ecdh_keypair, derive_shared_key
+    seal_envelope, open_envelope, needs_rekey, get_context, forget_key, AEADContext,
+    generate_ecdh_keypair, derive_shared_key, encode_public_key
 )
 
 import customtkinter as ctk
@@ -24,6 +29,9 @@ from tkinter import messagebox
 
 from ui.login_screen import LoginDialog
 from utils.tls_setup  import configure_tls_context
+from utils.framing    import FrameReader, encode_frame
+from utils            import delivery, history, metrics, puzzle, wire
+from utils.wire       import PROTO_V1, PROTO_V2
 from logging_config   import setup_logging
 
 logger = setup_logging()
@@ -31,6 +39,18 @@ ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("dark-blue")
 
 MAX_MSG_LEN = 64 * 1024           # max 64 KB
+KEY_CURVE = "p256"                # "x25519" only if every peer runs wire v2 with it
+ENV_MAX_RECIPIENTS = 256          # wrapped keys per envelope frame (keeps it under MAX_MSG_LEN)
+HISTORY_PAGE = 50                 # records asked for when a conversation is first opened
+
+
+def _open_quietly(key: bytes, blob: bytes, ctx=get_context) -> Optional[bytes]:
+    """AES-GCM open for scrollback: None, not an error log, if it does not authenticate."""
+    try:
+        return ctx(key).open(blob)
+    except (InvalidTag, ValueError):
+        return None
+
 
 class AuthRetryError(Exception):
     """Wrong password / temporary lock - show dialog again."""
@@ -49,12 +69,33 @@ class ChatClient:
         self.username = self.password = ""
         self.tls_ctx: Optional[ssl.SSLContext] = None
         self.sock: Optional[ssl.SSLSocket] = None
+        self.tls_session: Optional[ssl.SSLSession] = None   # offered on reconnect
+        self._reader: Optional[FrameReader] = None
         self.running = False       #for controls loops (heartbeat & recv loop)                
         self.recipient = "Everyone"
 
         # E2E keys
-        self.priv, self.pub = generate_ecdh_keypair()
+        self.priv, self.pub = generate_ecdh_keypair(KEY_CURVE)
         self.peer_keys : Dict[str, bytes] = {} 
+        self.peer_pubs : Dict[str, bytes] = {}     # PEMs, for re-deriving on rekey
+
+        # wire v2: server-assigned user ids
+        self.proto = PROTO_V1
+        self.user_ids : Dict[str, int] = {}
+        self.id_names : Dict[int, str] = {}
+        self.v1_ids : set = set()           # online peers on wire v1: no ENV, send them CIPH
+        self.presence_seq = 0               # last applied snapshot / delta
+        self.key_dir = (0, 0)               # (epoch, version) of the server key directory
+        self.resume_token: Optional[str] = None   # single-use, from the server's RESUME frame
+        self._snapshot_asked = False
+        self.user_labels : Dict[str, ctk.CTkLabel] = {}
+        self._history_asked : set = set()   # conversations whose scrollback was requested
+
+        # sequenced private messages (utils.delivery)
+        self.out_seq = delivery.first_seq()
+        self.unacked = delivery.RetransmitBuffer()          # seq -> (peer, blob)
+        self.seen : Dict[str, delivery.SeqWindow] = {}     # sender -> seqs already shown
+        self._replay_due = False            # resend self.unacked once the user list is in
 
         self.peer_keys[self.username] = b""
 
@@ -98,17 +139,53 @@ class ChatClient:
         self.running = True
         threading.Thread(target=self._recv_loop, daemon=True).start()
         self._restart_heartbeat()
+        self._request_history(self.recipient)
 
     # ── networking ──────────────────────────────────────────────────
     def _open_socket(self):
+        # keep the last connection's TLS session (its ticket arrives after the
+        # handshake, so take it now rather than right after connecting)
+        prev = self.sock.session if self.sock else None
+        if prev is not None and prev.has_ticket:
+            self.tls_session = prev
         raw = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         raw.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)   # login is ping-pong
         raw.bind(("0.0.0.0", self.client_port))
-        self.sock = self.tls_ctx.wrap_socket(raw, server_hostname=self.host)
+        self.sock = self.tls_ctx.wrap_socket(raw, server_hostname=self.host,
+                                             session=self.tls_session)
         self.sock.connect((self.host, self.server_port))
-        logger.info("Connected to %s:%s", self.host, self.server_port)
+        self._reader = FrameReader(self.sock, MAX_MSG_LEN)   # frames may share TLS records
+        resumed = self.sock.session_reused
+        metrics.incr("tls.resumed" if resumed else "tls.full")
+        logger.info("Connected to %s:%s (TLS %s)", self.host, self.server_port,
+                    "resumed" if resumed else "full handshake")
 
     def _authenticate(self):
+        # 0) negotiate the wire protocol
+        self._send_prefixed(f"HELLO {PROTO_V2}".encode())
+        reply = self._recv_prefixed().decode()
+        self._raise_if_refused(reply)               # IP / subnet throttle, full auth queue
+        if not reply.startswith("HELLO "):
+            raise RuntimeError("Server does not support protocol negotiation")
+        fields = reply.split()
+        self.proto = int(fields[1])
+        challenge = (base64.b64decode(fields[2]), int(fields[3])) if len(fields) == 4 else None
+
+        # ½) after a drop: resume in one round trip (no password / USB / KEYPUB)
+        if self.resume_token and self.proto == PROTO_V2:
+            token, self.resume_token = self.resume_token, None     # single use
+            since = "%d:%d" % self.key_dir
+            self._send_prefixed(f"RESUME {self.username} {token} {since}".encode())
+            if self._recv_prefixed() == b"SUCCESS":
+                logger.info("Session resumed")
+                return
+            # RESUMEFAIL – fall through to a full login on this connection
+
+        # ¾) server under load: proof of work before it will hash our password
+        if challenge:
+            self._send_prefixed(f"SOLVE {self._solve_puzzle(*challenge)}".encode())
+
         # 1) send credentials
         self._send_prefixed(f"{self.username}:{self.password}".encode())
         reply = self._recv_prefixed().decode()
@@ -120,11 +197,8 @@ class ChatClient:
             tries = int(reply.split()[1])
             raise AuthRetryError(f"Wrong password - {tries} attempt(s) left.")
 
-        elif reply.startswith("LOCKED"):
-            mins = max(1, int(reply.split()[1]) // 60)
-            raise AuthRetryError(f"Too many failures. Try again in {mins} minute(s).")
-
         else:
+            self._raise_if_refused(reply)
             raise RuntimeError("Login rejected")
 
         # 2) USB loop
@@ -151,6 +225,30 @@ class ChatClient:
                 raise RuntimeError(f"USB locked for {mins} minute(s).")
             raise RuntimeError(f"Unexpected: {reply}")
 
+    @staticmethod
+    def _raise_if_refused(reply: str):
+        """LOCKED / BUSY (possible at any login step) → AuthRetryError with the wait."""
+        if reply.startswith("LOCKED"):
+            mins = max(1, int(reply.split()[1]) // 60)
+            raise AuthRetryError(f"Too many failures. Try again in {mins} minute(s).")
+        if reply.startswith("BUSY"):                # server's auth queue is full
+            secs = int(reply.split()[1])
+            raise AuthRetryError(f"Server busy. Try again in {secs} second(s).")
+
+    def _solve_puzzle(self, nonce: bytes, bits: int) -> int:
+        """Solve on a worker thread; on the Tk thread keep the GUI painting meanwhile."""
+        logger.info("Server busy - solving a %d-bit login puzzle", bits)
+        result = []
+        worker = threading.Thread(target=lambda: result.append(puzzle.solve(nonce, bits)),
+                                  daemon=True)
+        worker.start()
+        on_tk_thread = threading.current_thread() is threading.main_thread()
+        while worker.is_alive():
+            if on_tk_thread:
+                self.master.update()
+            worker.join(0.05)
+        return result[0]
+
     # ── USB picker (unchanged) ───────────────────────────────────────
     @staticmethod
     def _pick_usb_token() -> Optional[Tuple[str, str]]:
@@ -194,6 +292,11 @@ class ChatClient:
 
     # ---------------- announce pubkey
     def _send_keypub(self):
+        if self.proto == PROTO_V2:      # compact SEC1 point; server serves PEM to v1 peers
+            since = "%d:%d" % self.key_dir  # only keys changed since then come back
+            self._send_prefixed(b"KEYPUB " + base64.b64encode(encode_public_key(self.pub))
+                                + b" " + since.encode())
+            return
         pub_b64 = base64.b64encode(
             self.pub.public_bytes(
                 encoding = serialization.Encoding.PEM,
@@ -206,7 +309,7 @@ class ChatClient:
     def _heartbeat(self):      #firewalls will silently drop idle TCP connections after a minute or two so we send a ping every 20 seconds to keep the connection alive
         while self.running:
             try:
-                self._send_prefixed(b"PING")
+                self._send_prefixed(wire.PING if self.proto == PROTO_V2 else b"PING")
             except Exception:
                 break
             time.sleep(self.HEARTBEAT_INTERVAL)
@@ -218,31 +321,37 @@ class ChatClient:
 
     # ── sender / receiver ───────────────────────────────────────────
     def _send_prefixed(self, data: bytes):
-        self.sock.sendall(len(data).to_bytes(4, "big") + data)
+        self.sock.sendall(encode_frame(data))
 
     def _recv_prefixed(self) -> bytes:
-        hdr = self.sock.recv(4)
-        length = int.from_bytes(hdr, "big") if hdr else 0
-        return b"" if not hdr or length <= 0 or length > MAX_MSG_LEN else self.sock.recv(length)
+        return self._reader.read_bytes()
 
     def _recv_loop(self):
         while self.running:
             try:
                 data = self._recv_prefixed()
                 if not data: raise ConnectionError("EOF")
+                if wire.is_v2(data):
+                    self._on_v2_frame(data)
+                    continue
                 # ---- frame types ----
+                if data.startswith(b"RESUME "):     # token for the next reconnect
+                    self.resume_token = data[7:].decode()
+                    continue
+                if data.startswith(b"ACK "):         # everything up to <seq> reached the server
+                    self.unacked.ack(int(data[4:]))
+                    continue
                 if data.startswith(b"USERS "):
                     self._update_user_list(data.split(b" ", 1)[1].decode().split(","))
+                    if self._replay_due:
+                        self._replay_unacked()
+                    continue
+                if data.startswith(b"HIST "):        # scrollback page
+                    self._on_history(data)
                     continue
                 if data.startswith(b"KEYPUB "):      # peer pubkey
                     _, user, blob_b64 = data.decode().split(" ", 2)
-                    if user == self.username: continue
-                    peer_pub = base64.b64decode(blob_b64)
-                    self.peer_keys[user] = derive_shared_key(
-                        self.priv, peer_pub, b"", b"SecureChat AES-GCM")
-                    if user == self.recipient:
-                        self.entry.configure(state="normal")
-    
+                    self._on_keypub(user, base64.b64decode(blob_b64))
                     continue
                 if data.startswith(b"BCAST "):
                     _, sender_b, blob_b64 = data.split(b" ", 2)
@@ -256,10 +365,21 @@ class ChatClient:
                         self._display(f"[{sender}] {pt}")
                     continue
 
+                elif data.startswith(b"ENV "):
+                    _, sender, body_b64, mine = data.split(b" ", 3)
+                    name, _, wrapped = mine.partition(b":")
+                    if name.decode() != self.username:
+                        continue
+                    self._on_envelope(sender.decode(), base64.b64decode(wrapped),
+                                      base64.b64decode(body_b64))
+
                 elif data.startswith(b"CIPH "):
-                    _, sender, recipient, blob_b64 = data.split(b" ", 3)
+                    parts = data.split(b" ", 4)     # CIPH sender recipient [seq] blob
+                    sender, recipient, blob_b64 = parts[1], parts[2], parts[-1]
                     if recipient.decode() != self.username:
                         continue
+                    if len(parts) == 5 and not self._first_time(sender.decode(), int(parts[3])):
+                        continue
                     key = self.peer_keys.get(sender.decode())
                     # we know 'key' is exactly the right one, so decrypt
                     pt = decrypt_message(key, base64.b64decode(blob_b64))
@@ -275,15 +395,234 @@ class ChatClient:
                 messagebox.showerror("Reconnect failed", "Unable to reconnect.")
                 self.master.quit(); return
 
+    def _on_v2_frame(self, data: bytes):
+        op = data[0]
+        if op == wire.OP_USERS:                     # snapshot
+            self.presence_seq, pairs = wire.parse_users(data)
+            self._snapshot_asked = False
+            for uid, name in pairs:
+                self.user_ids[name], self.id_names[uid] = uid, name
+            self.v1_ids &= {uid for uid, _ in pairs}
+            self._update_user_list([name for _, name in pairs])
+            if self._replay_due:
+                self._replay_unacked()
+        elif op == wire.OP_PRESENCE:                # +joined / -left since last seq
+            seq, changes = wire.parse_presence(data)
+            if seq <= self.presence_seq:            # already in our snapshot
+                return
+            if seq != self.presence_seq + 1:        # missed one – ask for a snapshot
+                if not self._snapshot_asked:
+                    self._snapshot_asked = True
+                    self._send_prefixed(wire.USERS_REQ)
+                return
+            self.presence_seq = seq
+            for uid, name in changes:
+                if name:
+                    self.user_ids[name], self.id_names[uid] = uid, name
+                    self._add_user_label(name)
+                elif uid in self.id_names:
+                    self.v1_ids.discard(uid)
+                    self._remove_user_label(self.id_names[uid])
+        elif op == wire.OP_V1PEERS:
+            self.v1_ids.update(wire.parse_v1_peers(data))
+        elif op == wire.OP_KEYDIR:                  # bundle at login / one-entry delta
+            epoch, since, version, entries = wire.parse_keydir(data)
+            if since == 0:                          # fresh bundle (new epoch / below the
+                keep = {name for _, name, _ in entries}     # floor): no tombstones in it
+                for name in (self.peer_pubs.keys() | self.peer_keys.keys()) - keep:
+                    self._forget_peer(name)
+            for uid, name, peer_pub in entries:
+                self.user_ids[name], self.id_names[uid] = uid, name
+                if peer_pub:
+                    self._on_keypub(name, peer_pub)
+                elif name != self.username:         # tombstone: went offline
+                    self._forget_peer(name)
+            cur_epoch, cur_version = self.key_dir
+            if epoch != cur_epoch and since == 0:
+                self.key_dir = (epoch, version)
+            elif epoch == cur_epoch and since <= cur_version:
+                self.key_dir = (epoch, max(version, cur_version))
+        elif op == wire.OP_KEYPUB:
+            uid, peer_pub = wire.parse_keypub(data)
+            if uid in self.id_names:
+                self._on_keypub(self.id_names[uid], peer_pub)
+        elif op == wire.OP_ACK:
+            self.unacked.ack(wire.parse_ack(data))
+        elif op in (wire.OP_CIPH, wire.OP_SCIPH):
+            if op == wire.OP_SCIPH:
+                sid, _, seq, blob = wire.parse_cipher_seq(data)
+            else:
+                (sid, _, blob), seq = wire.parse_cipher(data), 0
+            sender = self.id_names.get(sid)
+            if seq and not self._first_time(sender, seq):
+                return
+            key = self.peer_keys.get(sender)
+            pt = decrypt_message(key, blob) if key else None
+            if pt is not None:
+                self._display(f"[PM from {sender}] {pt}")
+        elif op == wire.OP_BCAST:
+            sid, blob = wire.parse_bcast(data)
+            sender = self.id_names.get(sid)
+            key = self.peer_keys.get(sender)
+            pt = decrypt_message(key, blob) if key else None
+            if pt is not None:
+                self._display(f"[{sender}] {pt}")
+        elif op == wire.OP_ENV:
+            sid, wraps, body = wire.parse_env(data)
+            me = self.user_ids.get(self.username)
+            for rid, wrapped in wraps:
+                if rid == me:
+                    self._on_envelope(self.id_names.get(sid), bytes(wrapped), bytes(body))
+
+    def _on_envelope(self, sender: str, wrapped: bytes, body: bytes):
+        key = self.peer_keys.get(sender)
+        pt = open_envelope(key, wrapped, body) if key else None
+        if pt is not None:
+            self._display(f"[{sender}] {pt}")
+
+    def _request_history(self, peer: str):
+        if peer == self.username or peer in self._history_asked:
+            return
+        self._history_asked.add(peer)
+        before = int(time.time() * 1000) + 1
+        self._send_prefixed(f"HISTORY {peer} {before} {HISTORY_PAGE}".encode())
+
+    def _on_history(self, data: bytes):
+        # b"HIST <peer> <count> <oldest_ts>\n" + records; only what our
+        # current keys open is shown (earlier sessions used other keys),
+        # the rest is counted in one line instead of an error per record
+        head, _, body = data.partition(b"\n")
+        peer = head.split(b" ")[1].decode()
+        lines, sealed = [], 0
+        for ts, kind, sender, payload in history.iter_records(body):
+            if kind == history.KIND_ENV:
+                wraps, env_body = history.parse_envelope_payload(payload)
+                key, wrapped = self.peer_keys.get(sender), dict(wraps).get(self.username)
+                content_key = _open_quietly(key, wrapped) if key and wrapped else None
+                pt = _open_quietly(content_key, env_body, AEADContext) if content_key else None
+            else:           # a private blob is under the pair's key whoever sent it
+                key = self.peer_keys.get(peer if kind == history.KIND_CIPHER else sender)
+                pt = _open_quietly(key, payload) if key else None
+            if pt is None:
+                sealed += 1
+                continue
+            pt = pt.decode("utf-8", "replace")
+            when = time.strftime("%H:%M", time.localtime(ts / 1000))
+            if sender == self.username:
+                lines.append(f"{when} You ➜ {peer}: {pt}")
+            elif kind == history.KIND_CIPHER:
+                lines.append(f"{when} [PM from {sender}] {pt}")
+            else:
+                lines.append(f"{when} [{sender}] {pt}")
+        if sealed:
+            lines.insert(0, f"({sealed} older message{'s' * (sealed != 1)} can't be "
+                            f"decrypted – sent under keys from an earlier session)")
+        if lines:
+            self._display("\n".join([f"── earlier with {peer} ──", *lines, "──"]))
+
+    def _on_keypub(self, user: str, peer_pub: bytes):
+        if user == self.username: return
+        try:
+            key = derive_shared_key(self.priv, peer_pub, b"", b"SecureChat AES-GCM")
+        except Exception as e:              # e.g. peer on a different curve
+            logger.warning("Cannot use key from %s: %s", user, e)
+            return
+        if self.peer_pubs.get(user) != peer_pub:
+            self.seen.pop(user, None)       # new key = new sending session, new numbering
+            if self.peer_keys.get(user):
+                forget_key(self.peer_keys[user])
+        self.peer_pubs[user], self.peer_keys[user] = peer_pub, key
+        if user == self.recipient:
+            self.entry.configure(state="normal")
+
+    def _forget_peer(self, user: str):
+        """Drop a peer's key (and the cipher state cached for it) and its seq window."""
+        self.peer_pubs.pop(user, None)
+        key = self.peer_keys.pop(user, None)
+        if key:
+            forget_key(key)
+        self.seen.pop(user, None)
+
+    def _rekey_if_needed(self, peers):
+        """A peer key is close to running out of GCM nonces: rotate our ECDH key."""
+        if not any(needs_rekey(self.peer_keys[p]) for p in peers):
+            return
+        logger.info("Nonce space nearly used - rotating ECDH key")
+        self.priv, self.pub = generate_ecdh_keypair(KEY_CURVE)
+        for user, peer_pub in self.peer_pubs.items():
+            if self.peer_keys.get(user):
+                forget_key(self.peer_keys[user])
+            self.peer_keys[user] = derive_shared_key(
+                self.priv, peer_pub, b"", b"SecureChat AES-GCM")
+        self._send_keypub()             # peers re-derive from the new KEYPUB
+
+    def _cipher_frame(self, peer: str, blob: bytes, seq: int = 0) -> bytes:
+        if self.proto == PROTO_V2:
+            if seq:
+                return wire.cipher_seq(self.user_ids[self.username], self.user_ids[peer], seq, blob)
+            return wire.cipher(self.user_ids[self.username], self.user_ids[peer], blob)
+        return (
+            b"CIPH " +
+            self.username.encode() + b" " +
+            peer.encode() + b" " +
+            (b"%d " % seq if seq else b"") +
+            base64.b64encode(blob)
+        )
+
+    def _send_private(self, peer: str, blob: bytes) -> bool:
+        """Send a sequenced CIPH, kept for resending until the server acks it; False if
+        the connection is going down (it goes out again after _reconnect)."""
+        self.out_seq += 1
+        if not self.unacked.add(self.out_seq, (peer, blob)):
+            logger.warning("Resend buffer full - oldest unacknowledged message given up")
+        try:
+            self._send_prefixed(self._cipher_frame(peer, blob, self.out_seq))
+        except OSError as e:
+            logger.warning("send failed, message kept for resend: %s", e)
+            return False
+        return True
+
+    def _replay_unacked(self):
+        """After a reconnect: resend what the server never acknowledged, same seqs."""
+        self._replay_due = False
+        for seq, (peer, blob) in self.unacked.pending():
+            if self.proto == PROTO_V2 and peer not in self.user_ids:
+                logger.warning("Not resending message %d: %s is unknown now", seq, peer)
+                continue
+            self._send_prefixed(self._cipher_frame(peer, blob, seq))
+
+    def _first_time(self, sender: str, seq: int) -> bool:
+        """False for a message already shown (its sender resent it after a reconnect)."""
+        win = self.seen.get(sender)
+        if win is None:
+            win = self.seen[sender] = delivery.SeqWindow()
+        return win.accept(seq)
+
+    def _envelope_frame(self, body: bytes, wraps: Dict[str, bytes]) -> bytes:
+        if self.proto == PROTO_V2:
+            return wire.env(self.user_ids[self.username],
+                            [(self.user_ids[p], wk) for p, wk in wraps.items()], body)
+        return (
+            b"ENV " +
+            self.username.encode() + b" " +
+            base64.b64encode(body) + b" " +
+            b",".join(p.encode() + b":" + base64.b64encode(wk) for p, wk in wraps.items())
+        )
+
     def _reconnect(self) -> bool:
         for attempt in range(1, self.RECONNECT_MAX_TRIES + 1):
             wait = self.BACKOFF_BASE_SECS ** (attempt - 1)
+            if attempt == 1 and self.resume_token:
+                wait = 0                        # resuming is one round trip – try at once
             logger.info("Reconnect attempt %s in %ss …", attempt, wait)
             time.sleep(wait)
             try:
-                self.peer_keys.clear()
-                self.priv, self.pub = generate_ecdh_keypair()
-                self._open_socket(); self._authenticate(); self._send_keypub()
+                # keep our key pair and known peer keys: the server then only
+                # sends directory changes since self.key_dir
+                self.user_ids.clear(); self.id_names.clear(); self.presence_seq = 0
+                self.v1_ids.clear()
+                self._open_socket(); self._authenticate()      # sends KEYPUB itself
+                self._replay_due = bool(len(self.unacked))    # resent after the user list
                 self.running = True; self._restart_heartbeat(); return True
             except Exception as e:
                 logger.warning("reconnect failed: %s", e)
@@ -342,17 +681,30 @@ class ChatClient:
 
     def _update_user_list(self, users):
         for w in self.user_list.winfo_children():
-            w.pack_forget()
+            w.destroy()
         self.user_labels = {}
         for u in ["Everyone", self.username] + [x for x in users if x != self.username]:
-            lbl = ctk.CTkLabel(self.user_list, text=u, fg_color="#212121",
-                               text_color="white", anchor="w", padx=10)
-            lbl.pack(pady=2, padx=2, anchor="w", fill="x")
-            lbl.bind("<Button-1>", lambda e, usr=u: self._set_recipient(usr))
-            self.user_labels[u] = lbl
+            self._add_user_label(u)
         if self.recipient not in users + ["Everyone"]:
             self._set_recipient("Everyone")
 
+    def _add_user_label(self, u):
+        if u in self.user_labels:
+            return
+        lbl = ctk.CTkLabel(self.user_list, text=u, fg_color="#212121",
+                           text_color="white", anchor="w", padx=10)
+        lbl.pack(pady=2, padx=2, anchor="w", fill="x")
+        lbl.bind("<Button-1>", lambda e, usr=u: self._set_recipient(usr))
+        self.user_labels[u] = lbl
+
+    def _remove_user_label(self, u):
+        lbl = self.user_labels.pop(u, None) if u != self.username else None
+        if lbl is None:
+            return
+        lbl.destroy()
+        if self.recipient == u:
+            self._set_recipient("Everyone")
+
     def _set_recipient(self, user):
         # de-highlight old label
         if hasattr(self, "user_labels") and self.recipient in self.user_labels:
@@ -363,6 +715,7 @@ class ChatClient:
         # highlight new label
         if user in self.user_labels:
             self.user_labels[user].configure(fg_color="#2A2D2E")
+        self._request_history(user)
 
         # enable Send if allowed
         self.entry.configure(
@@ -389,7 +742,8 @@ class ChatClient:
             if self.recipient == "Everyone":
                 # make sure at least one other key is ready
                 ready = [u for u,k in self.peer_keys.items()
-                        if u != self.username and len(k)==32]
+                        if u != self.username and len(k)==32
+                        and (self.proto != PROTO_V2 or u in self.user_ids)]
                 if not ready:
                     messagebox.showinfo(
                         "Waiting",
@@ -397,17 +751,17 @@ class ChatClient:
                     )
                     return
 
-                # loop, encrypt once per recipient, send via CIPH route
-                for peer in ready:
-                    key = self.peer_keys[peer]
-                    blob = encrypt_message(key, msg)
-                    frame = (
-                        b"CIPH " +
-                        self.username.encode() + b" " +
-                        peer.encode() + b" " +
-                        base64.b64encode(blob)
-                    )
-                    self._send_prefixed(frame)
+                # v1 peers cannot read ENV – they get a private CIPH each
+                legacy = [u for u in ready if self.user_ids.get(u) in self.v1_ids]
+                for u in legacy:
+                    self._send_private(u, encrypt_message(self.peer_keys[u], msg))
+                # encrypt once, wrap the content key per recipient, send via ENV route
+                rest = [u for u in ready if u not in legacy]
+                for i in range(0, len(rest), ENV_MAX_RECIPIENTS):
+                    batch = rest[i:i + ENV_MAX_RECIPIENTS]
+                    body, wraps = seal_envelope({u: self.peer_keys[u] for u in batch}, msg)
+                    self._send_prefixed(self._envelope_frame(body, wraps))
+                self._rekey_if_needed(ready)
 
                 shown = f"You: {msg}"
 
@@ -418,14 +772,11 @@ class ChatClient:
                     messagebox.showerror("Key error", "No key for user")
                     return
                 blob = encrypt_message(key, msg)
-                frame = (
-                    b"CIPH " +
-                    self.username.encode() + b" " +
-                    self.recipient.encode() + b" " +
-                    base64.b64encode(blob)
-                )
-                self._send_prefixed(frame)
+                sent = self._send_private(self.recipient, blob)
+                self._rekey_if_needed([self.recipient])
                 shown = f"You ➜ {self.recipient}: {msg}"
+                if not sent:
+                    shown += "  (will be resent after reconnecting)"
 
             # ── local echo ──
             self._display(shown)
@@ -446,16 +797,11 @@ class ChatClient:
             return
 
         blob  = encrypt_message(key, msg)
-        frame = b"CIPH " + self.username.encode() \
-            + b" " + target.encode() \
-            + b" " + base64.b64encode(blob)
-        self._send_prefixed(frame)
+        self._send_prefixed(self._cipher_frame(target, blob))
 
         # private PM
         blob  = encrypt_message(key, msg)
-        frame = b"CIPH " + self.username.encode() + b" " + target.encode() + b" " + \
-                base64.b64encode(blob)
-        self._send_prefixed(frame)     
+        self._send_prefixed(self._cipher_frame(target, blob))     
 
     def _display(self, text):
         self.textbox.configure(state="normal")
@@ -2,37 +2,120 @@
 """
 Secure-Chat Server
 ──────────────────
-• TLS-wrapped socket
+• CIDR allow/deny rules + temporary lock-out blocks checked before any TLS work
+• TLS per connection (handshake off the accept loop, with deadline + cap)
+• TLS 1.3 session tickets (rotated key) so reconnects skip the cert signature
 • Username/password + USB 2-factor
-• 3-strike login throttle (IP-based, RAM-only)
+• PBKDF2 on a bounded auth pool: BUSY <secs> when saturated, routing unaffected
+• Adaptive proof-of-work before the password check while that pool is loaded
+• 3-strike login throttle per IP and per /24 · /64 (RAM-only, bounded, utils.throttle)
 • Broadcast + private messages
+• Two interchangeable engines: thread-per-client or one asyncio loop
+• Bounded per-client outbound queues, slow consumers evicted
+• Wire protocol v1 (ASCII) and negotiated v2 (binary, utils.wire)
+• Multi-recipient envelopes: one body, one wrapped key per recipient
+• Presence: snapshot at login, then debounced +user/-user deltas
+• Versioned key directory: one bundle at login, only changes on reconnect
+• Single-use resume tokens: reconnect without PBKDF2 / USB / key exchange
+• Ciphertext scrollback per conversation: HISTORY pages sliced from mapped columns
+• Sequenced private messages: batched cumulative ACKs, resends dropped
 """
 from __future__ import annotations
-import errno, signal, socket, ssl, sys, threading, time, sqlite3 #  errno = OS‐level error codes
-from contextlib import closing
-from typing import Dict, Tuple
+import argparse, asyncio, asyncio.sslproto, errno, heapq, itertools, signal, socket, ssl, sys, threading, time #  errno = OS‐level error codes
+from dataclasses import dataclass, replace
+from concurrent.futures import Future
+from typing import Dict, Tuple, Union
 
 import base64, os                                  
 from security import (                              
     encrypt_message, decrypt_message,
-    generate_ecdh_keypair, derive_shared_key
+    generate_ecdh_keypair, derive_shared_key,
+    load_peer_public_key, encode_public_key, public_key_pem
 )
 
 from logging_config import setup_logging
-from utils.tls_setup import ensure_cert_in_cert_dir, configure_tls_context
-from utils.db_setup    import init_user_db, verify_credentials, DB_PATH
+from utils.tls_setup import ensure_cert_in_cert_dir, TicketRotator, CERT_KEY_TYPES
+from utils.db_setup    import init_user_db, _verify_password
 from utils.db_maintenance import ensure_db_ready, backup_db
+from utils import metrics
+from utils.framing import FrameReader, encode_frame
+from utils.outbox  import ThreadOutbox, StreamOutbox
+from utils import wire
+from utils.resume  import ResumeTokens
+from utils.auth_pool import AuthPool, AuthBusy, AUTH_EXECUTORS, AUTH_MAX_PENDING, AUTH_WORKERS
+from utils import puzzle
+from utils.throttle import LoginThrottle
+from utils.iprep import IPReputation
+from utils.userdir import UserDirectory
+from utils.writebehind import WriteBehind
+from utils.offline import OfflineQueue
+from utils import history
+from utils.history import HistoryStore
+from utils.delivery import SeqWindow
+from utils.wire    import PROTO_V1, PROTO_V2
 
 # ── globals ──────────────────────────────────────────────────────────
 logger = setup_logging()
 init_user_db()                                    # ensure users.db exists
 
-connected_clients: Dict[str, Tuple[socket.socket, Tuple[str, int]]] = {}
+Outbox = Union[ThreadOutbox, StreamOutbox]
+
+connected_clients: Dict[str, "Session"] = {}     # username -> Session
 _clients_lock = threading.RLock()
+_user_ids: Dict[str, int] = {}                    # username -> wire-v2 user id
+_id_users: Dict[int, str] = {}                    # wire-v2 user id -> username
 
 PORT_DEFAULT        = 4444
 MAX_MSG_LEN         = 64 * 1024
 SOCKET_TIMEOUT_SECS = 30
+ENGINE_DEFAULT      = "threaded"    # or "asyncio" (see ENGINES)
+_AIO_SSL_READ_BUF   = 32 * 1024     # per-connection TLS read buffer (asyncio engine)
+_HEADER_SCAN        = 160           # bytes searched for "CIPH <from> <to> " style headers
+
+# TLS handshake runs per connection, not in the accept loop
+HANDSHAKE_TIMEOUT_SECS = 10
+MAX_PENDING_HANDSHAKES = 256        # extra connections are closed straight away
+METRICS_LOG_SECS       = 60         # utils.metrics snapshot → log
+TLS_SESSION_TICKETS    = 2          # per full handshake; 0 = no resumption
+TLS_TICKET_ROTATE_SECS = 12 * 3600  # fresh ticket key (older tickets → full handshake)
+CERT_KEY_TYPE          = "ecdsa"    # for a newly generated cert: "rsa" | "ecdsa" | "ed25519"
+
+# outbound queues: routers only enqueue, a writer drains (utils.outbox)
+SLOW_CONSUMER_SECS  = 10            # evict after this long above high-water
+SWEEP_INTERVAL_SECS = 1
+
+# presence: snapshot at login, then merged +user/-user deltas
+PRESENCE_DEBOUNCE_SECS = 0.25
+_presence_seq = 0                                 # bumped once per delta frame
+_presence_pending: Dict[str, bool] = {}           # username -> online, merged until flush
+_presence_flush_due = False
+
+# key directory: latest key per user, versioned so reconnects fetch only changes
+KEYDIR_EPOCH = int.from_bytes(os.urandom(4), "big") >> 1   # new numbering every server run
+_key_dir_version = 0
+_key_dir: Dict[str, Tuple[int, bytes]] = {}       # username -> (version, compact key); b"" = offline
+_key_dir_floor = 0                                # tombstones up to this version were pruned
+KEYDIR_MAX_TOMBSTONES = 1024                      # offline users remembered for deltas
+KEYDIR_FRAME_BYTES = MAX_MSG_LEN - 1024           # one OP_KEYDIR chunk fits the client's limit
+
+# sequenced private messages: one cumulative ACK per batch, repeats dropped (utils.delivery)
+ACK_EVERY      = 64                 # sequenced frames covered by one ACK at most …
+ACK_DELAY_SECS = 1.0                # … or sent this long after the first unacknowledged one
+_seq_windows: Dict[str, SeqWindow] = {}           # sender -> seqs routed since its last full login
+
+# session resumption (wire v2): reconnect in one round trip (utils.resume)
+_resume_tokens = ResumeTokens()
+
+# password checks: bounded pool, fail fast when full (utils.auth_pool)
+AUTH_EXECUTOR = "thread"            # or "process"
+_auth_pool = AuthPool(AUTH_WORKERS, AUTH_MAX_PENDING, AUTH_EXECUTOR)
+PUZZLE_ENABLED = True               # proof-of-work once the pool is loaded (utils.puzzle)
+
+# user rows kept in memory, re-read only when users.db changes (utils.userdir);
+# USB counters and login stamps reach the file in one batch per sweep (utils.writebehind)
+_write_behind = WriteBehind()
+_user_dir = UserDirectory(snapshot=_write_behind.snapshot)
+_NO_SUCH_USER = os.urandom(48)      # salt + hash nothing matches: unknown names cost one PBKDF2 too
 
 # USB 2FA
 _MAX_FAILS_USB      = 3
@@ -41,330 +124,1162 @@ _LOCK_SECS_USB      = 240
 # login-throttling (username/password stage)
 _MAX_LOGIN_FAILS    = 3
 _LOCK_SECS_LOGIN    = 300          # 5 minutes
-_login_fails: dict[str, tuple[int, int]] = {}    # ip -> (fails, locked_until)
-_login_lock = threading.RLock()
+_login_throttle = LoginThrottle(_MAX_LOGIN_FAILS, lock_secs=_LOCK_SECS_LOGIN)
+
+# IP reputation at accept(): rules file (hot-reloaded) + lock-out blocks (utils.iprep)
+IP_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils", "ip_rules.txt")
+_ip_rep = IPReputation(IP_RULES_PATH)
+
+# private messages to offline users: segmented log per recipient, drained at login (utils.offline)
+OFFLINE_DIR          = os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline")
+OFFLINE_BATCH_BYTES  = 256 * 1024   # read per drain step → one outbox batch
+OFFLINE_EXPIRE_SECS  = 60           # how often the sweeper drops expired segments
+_offline = OfflineQueue(OFFLINE_DIR)
+
+# relayed ciphertext per conversation, paged back with HISTORY (utils.history)
+HISTORY_DIR          = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")
+HISTORY_MAX_LIMIT    = 500          # records per HISTORY reply
+_history = HistoryStore(HISTORY_DIR, page_bytes=MAX_MSG_LEN - 1024)
+_ROOM = history.conversation("", history.ROOM)     # where BCAST / ENV broadcasts go
 # ─────────────────────────────────────────────────────────────────────
 
 # ──  helpers ────────────────────────────────────────────────
 def _is_locked(ip: str) -> int:
-    with _login_lock:
-        cnt, locked_until = _login_fails.get(ip, (0, 0))
-    return max(0, locked_until - int(time.time()))
+    return _login_throttle.locked(ip)
 
 def _register_fail(ip: str) -> int:
     """Increment fail count, return tries_left (0 if now locked)."""
-    now = int(time.time())
-    with _login_lock:
-        cnt, locked_until = _login_fails.get(ip, (0, 0)) # cnt = count of failed attempts, locked_until = time when the user will be unlocked :( 
-        if locked_until > now:             # still locked
-            return 0
-        cnt += 1
-        if cnt >= _MAX_LOGIN_FAILS:
-            _login_fails[ip] = (0, now + _LOCK_SECS_LOGIN) # reset count to 0, set a new lockout window (now + LOCK_SECS)
-            return 0
-        _login_fails[ip] = (cnt, 0)
-        return _MAX_LOGIN_FAILS - cnt
+    return _login_throttle.register_fail(ip)
 
 def _clear_fail(ip: str) -> None:
-    with _login_lock:
-        _login_fails.pop(ip, None)
+    _login_throttle.clear(ip)
 
 # ── bootstrap ───────────────────────────────────────────────────────
-def start_server(port: int = PORT_DEFAULT) -> None:
+def start_server(port: int = PORT_DEFAULT, engine: str = ENGINE_DEFAULT,
+                 cert_type: str = CERT_KEY_TYPE, auth_executor: str = AUTH_EXECUTOR) -> None:
+    global _auth_pool
     ensure_db_ready()
     backup_db()
+    _user_dir.load()
 
     # keep existing cert; generate only if missing
     cert_path, key_path = ensure_cert_in_cert_dir("server_cert.pem",
-                                                  "server_key.pem")
-    tls_ctx = configure_tls_context(certfile=cert_path, keyfile=key_path,
-                                    purpose=ssl.Purpose.CLIENT_AUTH)
+                                                  "server_key.pem", cert_type)
+    tls_ctx = TicketRotator(TLS_TICKET_ROTATE_SECS,
+                            certfile=cert_path, keyfile=key_path,
+                            purpose=ssl.Purpose.CLIENT_AUTH,
+                            session_tickets=TLS_SESSION_TICKETS)
+    if auth_executor != _auth_pool.kind:
+        _auth_pool.shutdown()
+        _auth_pool = AuthPool(AUTH_WORKERS, AUTH_MAX_PENDING, auth_executor)
+    metrics.start_reporter(logger, METRICS_LOG_SECS)
+    try:
+        ENGINES[engine](tls_ctx, port)
+    finally:                            # both engines, however they stop
+        _flush_bookkeeping()
+        _auth_pool.shutdown()
+        _user_dir.close()
+        _offline.close()                # fsyncs what is still unsynced
+        _history.close()
+
+TLSSource = Union[ssl.SSLContext, TicketRotator]
 
-    raw = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    raw.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    raw.bind(("0.0.0.0", port))
-    raw.listen(100)
-    logger.info("Secure-Chat Server listening on 0.0.0.0:%s", port)
+def _server_ctx(tls: TLSSource) -> ssl.SSLContext:
+    """Context for a new connection (a TicketRotator may hand out a fresh one)."""
+    return tls.current() if isinstance(tls, TicketRotator) else tls
 
-    server_sock = tls_ctx.wrap_socket(raw, server_side=True)
+def _count_handshake(sslobj, secs: float) -> None:
+    resumed = sslobj.session_reused
+    metrics.incr("tls.resumed" if resumed else "tls.full")
+    metrics.observe("handshake.resumed" if resumed else "handshake.full", secs)
+
+# ── threaded engine (one thread per client) ─────────────────────────
+def run_threaded_engine(tls_ctx: TLSSource, port: int) -> None:
+    server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_sock.bind(("0.0.0.0", port))
+    server_sock.listen(100)
+    logger.info("Secure-Chat Server listening on 0.0.0.0:%s (threaded)", port)
+    _start_sweeper()
+
+    # the listener stays plain TCP – TLS happens in the per-client thread
     signal.signal(signal.SIGINT, lambda *_: shutdown(server_sock))
+    handshake_slots = threading.BoundedSemaphore(MAX_PENDING_HANDSHAKES)
 
     while True:
         try:
-            cli_sock, cli_addr = server_sock.accept()
-        except ssl.SSLError as e:
-            logger.warning("TLS handshake failed: %s", e);  continue
+            raw, cli_addr = server_sock.accept()
         except OSError as e:
             if e.errno == errno.EBADF: break       # listener closed (shutdown()), a socket.timeout will be raised.
             logger.error("Accept failed: %s", e);  continue
+        if not _ip_rep.allowed(cli_addr[0]):
+            metrics.incr("iprep.refused")
+            raw.close();  continue
+        raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)   # as asyncio does; login is ping-pong
+
+        if not handshake_slots.acquire(blocking=False):
+            metrics.incr("handshake.rejected_busy")
+            logger.warning("Too many pending TLS handshakes – dropping %s", cli_addr)
+            raw.close();  continue
 
         logger.info("Connection from %s", cli_addr)
-        threading.Thread(target=handle_client,
-                         args=(cli_sock, cli_addr),
+        threading.Thread(target=_tls_then_handle,
+                         args=(_server_ctx(tls_ctx), raw, cli_addr, handshake_slots),
                          daemon=True).start()
 
-# ── per-client thread ───────────────────────────────────────────────
-def handle_client(sock: ssl.SSLSocket, addr) -> None:
-    sock.settimeout(SOCKET_TIMEOUT_SECS) # client is idle for 30 seconds
-    ip = addr[0] # IP address of the client 
-    username = None
+def _tls_then_handle(tls_ctx: ssl.SSLContext, raw: socket.socket, addr,
+                     slots: threading.BoundedSemaphore) -> None:
+    """TLS handshake under its own deadline, then the normal client loop."""
+    t0 = time.perf_counter()
     try:
-        # 0) lock-out check before reading anything
-        wait = _is_locked(ip)
+        raw.settimeout(HANDSHAKE_TIMEOUT_SECS)
+        sock = tls_ctx.wrap_socket(raw, server_side=True)
+    except (ssl.SSLError, OSError) as e:          # socket.timeout is an OSError
+        metrics.incr("handshake.failed")
+        logger.warning("TLS handshake with %s failed: %s", addr, e)
+        raw.close()
+        return
+    finally:
+        slots.release()
+    _count_handshake(sock, time.perf_counter() - t0)
+    handle_client(sock, addr)
+
+# ── login state machine (shared by both engines) ────────────────────
+_RECV = object()                    # login flow wants the next frame
+
+def _login_flow(ip: str):
+    """
+    HELLO? → creds → USBREQ → USB → SUCCESS → KEYPUB, written once as a
+    generator and driven by either engine.  After HELLO a client may send
+    "RESUME <user> <token> <epoch>:<version>" instead of its credentials;
+    a valid token skips straight to SUCCESS, otherwise RESUMEFAIL and the
+    normal flow continues on the same connection.  While the auth pool is
+    loaded the HELLO reply carries a puzzle ("HELLO <v> <nonce> <bits>")
+    and the credentials must be preceded by "SOLVE <n>".
+
+
+        yield b"…"          send this frame
+        yield _RECV         → next frame (b"" on EOF)
+        yield (fn, *args)   → fn(*args)  (blocking work; asyncio runs it off-loop)
+        yield future        → future.result()  (auth pool work)
+
+    Returns (username, (pub_b64, pub_raw), proto, (epoch, version)) once the
+    client may go online,
+    or None when the connection should simply be closed.
+    """
+    # 0) lock-out check before reading anything
+    wait = _is_locked(ip)
+    if wait:
+        yield f"LOCKED {wait}".encode()
+        return None
+
+    # ½) optional wire-protocol negotiation – v1 clients start with creds
+    proto, bits = PROTO_V1, _puzzle_bits()
+    creds = yield _RECV
+    if creds.startswith(b"HELLO "):
+        proto = PROTO_V2 if creds[6:].strip().isdigit() and int(creds[6:]) >= PROTO_V2 else PROTO_V1
+        if bits:
+            nonce = puzzle.new_nonce()
+            metrics.incr("puzzle.issued")
+            yield f"HELLO {proto} {base64.b64encode(nonce).decode()} {bits}".encode()
+        else:
+            yield f"HELLO {proto}".encode()
+        creds = yield _RECV
+    elif bits:                          # no HELLO, no way to hand out a puzzle
+        yield f"BUSY {_auth_pool.retry_after()}".encode()
+        return None
+
+    # ¾) session resumption – no PBKDF2, USB or key exchange
+    if creds.startswith(b"RESUME "):
+        fields = creds.decode(errors="replace").split(" ")
+        old = _resume_tokens.redeem(fields[1], fields[2]) if len(fields) >= 3 else None
+        if old is not None:
+            metrics.incr("login.resumed")
+            yield b"SUCCESS"
+            return (old.username, (old.pub_b64, old.pub_raw), proto,
+                    _parse_key_since(fields[3].encode() if len(fields) > 3 else b""))
+        yield b"RESUMEFAIL"
+        creds = yield _RECV
+
+    # ⅞) proof of work – checked with one SHA-256, before any PBKDF2
+    if bits:
+        answer = creds[6:] if creds.startswith(b"SOLVE ") else b""
+        if not (answer.isdigit() and puzzle.check(nonce, bits, int(answer))):
+            metrics.incr("puzzle.failed")
+            yield b"FAIL";  return None
+        creds = yield _RECV
+
+    # 1) username / password -------------------------------------
+    if not creds or b":" not in creds:
+        yield b"FAIL";  return None
+    username, password = creds.decode().split(":", 1)
+    user = _user_dir.get(username)
+    try:
+        checked = _auth_pool.submit(_verify_password,
+                                    user.password if user else _NO_SUCH_USER, password)
+    except AuthBusy as busy:
+        yield f"BUSY {busy.retry_after}".encode()
+        return None
+    if not (yield checked):
+        left = _register_fail(ip)
+        if left:
+            yield f"LOGINFAIL {left}".encode()
+        else:
+            _ip_rep.block(ip, _LOCK_SECS_LOGIN)     # further connects refused before TLS
+            yield f"LOCKED {_LOCK_SECS_LOGIN}".encode()
+        return None
+    _clear_fail(ip)                     # good credentials
+
+    # 2) USB 2-factor loop ---------------------------------------
+    yield b"USBREQ"
+    while True:
+        usb = yield _RECV
+        if not usb or b":" not in usb:
+            yield b"FAIL";  return None
+        serial, digest = usb.decode().split(":", 1)
+        ok, wait, tries_left = yield (_verify_usb, username, serial, digest) # USB check from DB
+        if ok:
+            break
         if wait:
-            _send_prefixed(sock, f"LOCKED {wait}".encode())
-            return
+            _ip_rep.block(ip, wait)
+            yield f"LOCKED {wait}".encode()
+            return None
+        yield f"USBFAIL {tries_left}".encode()
+
+    yield b"SUCCESS"                    # USB OK
+
+    # 3) expect KEYPUB
+    pubpkt = yield _RECV
+    if not pubpkt.startswith(b"KEYPUB "):
+        logger.error("Keypub missing from %s", username);  return None
+    fields = pubpkt.split(b" ")                       # KEYPUB <b64 key> [<epoch>:<version>]
+    keys = _keypub_forms(fields[1])                   # [1] base64-encoded public key
+    if keys is None:
+        logger.error("Invalid public key from %s", username);  return None
+    metrics.incr("login.full")
+    _seq_windows.pop(username, None)    # new device / clock: new numbering; only resume keeps it
+    return username, keys, proto, _parse_key_since(fields[2] if len(fields) > 2 else b"")
 
-        # 1) username / password -------------------------------------
-        creds = _recv_prefixed(sock)
-        if not creds or b":" not in creds:
-            _send_prefixed(sock, b"FAIL");  return
-        username, password = creds.decode().split(":", 1)
-        if not verify_credentials(username, password):
-            left = _register_fail(ip)
-            if left:
-                _send_prefixed(sock, f"LOGINFAIL {left}".encode())
+def _puzzle_bits() -> int:
+    """Puzzle difficulty for a new login, from the auth pool's current load."""
+    return puzzle.difficulty(_auth_pool.load()) if PUZZLE_ENABLED else 0
+
+# ── per-client thread ───────────────────────────────────────────────
+def _drive_login(sock: ssl.SSLSocket, reader: FrameReader, ip: str):
+    flow, reply = _login_flow(ip), None
+    try:
+        while True:
+            step = flow.send(reply)
+            if step is _RECV:
+                reply = reader.read_bytes()
+            elif isinstance(step, tuple):
+                reply = step[0](*step[1:])
+            elif isinstance(step, Future):
+                reply = step.result()
             else:
-                _send_prefixed(sock, f"LOCKED {_LOCK_SECS_LOGIN}".encode())
+                _send_prefixed(sock, step);  reply = None
+    except StopIteration as done:
+        return done.value
+
+def handle_client(sock: ssl.SSLSocket, addr) -> None:
+    sock.settimeout(SOCKET_TIMEOUT_SECS) # client is idle for 30 seconds
+    reader = FrameReader(sock, MAX_MSG_LEN)
+    sess = None
+    try:
+        login = _drive_login(sock, reader, addr[0]) # addr[0] = IP address of the client
+        if not login:
             return
-        _clear_fail(ip)                     # good credentials
 
-        # 2) USB 2-factor loop ---------------------------------------
-        _send_prefixed(sock, b"USBREQ")
-        while True:
-            usb = _recv_prefixed(sock)
-            if not usb or b":" not in usb:
-                _send_prefixed(sock, b"FAIL");  return
-            serial, digest = usb.decode().split(":", 1)
-            ok, wait, tries_left = _verify_usb(username, serial, digest) # USB check from DB
-            if ok:
-                break
-            if wait:
-                _send_prefixed(sock, f"LOCKED {wait}".encode())
-                return
-            _send_prefixed(sock, f"USBFAIL {tries_left}".encode())
-
-        _send_prefixed(sock, b"SUCCESS")    # USB OK
-        
-        # 3) expect KEYPUB
-        pubpkt = _recv_prefixed(sock)
-        if not pubpkt.startswith(b"KEYPUB "):
-            logger.error("Keypub missing from %s", username); return
-        pub_b64 = pubpkt.split(b" ",1)[1].decode() # [1] base64-encoded public key 
-      
-        # 3) mark online / notify others -----------------------------
-        with _clients_lock:
-            """
-              Once a user passes both password and USB checks, 
-              add them to the server's active-clients map,
-              tell their client 'you're in,' update everyone's user list, and log it.
-            """
-            connected_clients[username] = (sock, addr, pub_b64)       
-        _send_prefixed(sock, b"SUCCESS")    # full login OK
-        _broadcast_user_list()
-        _send_existing_keypubs(sock)                # give newcomer others
-        _broadcast_keypub(username, pub_b64)        # tell others newcomer
-        logger.info("[%s] logged in as '%s'", addr, username)
-        logger.info("[%s] authenticated as '%s'", addr, username)
+        # 3) mark online / notify others – from here on, writes go through the outbox
+        username, keys, proto, since = login
+        sess = Session(username, ThreadOutbox(sock, username), addr, *keys, proto=proto)
+        _go_online(sess, since)
 
-        # 4) chat loop -----------------------------------------------
+        # 4) chat loop – frames are memoryviews into reader's buffer ----
         while True:
-            frame = _recv_prefixed(sock)
-            if not frame: break
-            if frame == b"PING": continue
-            if frame.startswith(b"BCAST "):
-                _route_broadcast(frame); continue
-            if frame.startswith(b"CIPH "):
-                _route_cipher(frame); continue
-            
+            frame = reader.read_frame()
+            if frame is None: break
+            _dispatch(sess, frame)
 
     except socket.timeout:
-        logger.info("%s timed out.", username or addr)
+        logger.info("%s timed out.", sess.username if sess else addr)
     except (ConnectionResetError, BrokenPipeError):
-        logger.info("%s disconnected abruptly.", username or addr)
+        logger.info("%s disconnected abruptly.", sess.username if sess else addr)
     except Exception as e:
         logger.error("Unhandled error with %s: %s", addr, e)
     finally:
-        with _clients_lock:
-            connected_clients.pop(username, None)
-        _broadcast_user_list()
+        if sess:
+            _go_offline(sess)
+            sess.box.close()
         try:
             sock.shutdown(socket.SHUT_RDWR)
         except Exception:
             pass
         sock.close()
-        logger.info("Client '%s' disconnected.", username or addr)
+        logger.info("Client '%s' disconnected.", sess.username if sess else addr)
+
+# ── asyncio engine (all clients multiplexed on one event loop) ──────
+class _StreamSock:
+    """
+    Socket-shaped adapter around an asyncio StreamWriter so _send_prefixed()
+    works during the login phase.  Only ever touched from the event-loop thread.
+    """
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+
+    def sendall(self, data: bytes) -> None:
+        if self._writer.is_closing():
+            raise BrokenPipeError("stream closed")
+        self._writer.write(data)
 
-def _send_existing_keypubs(sock):
+    def shutdown(self, how: int) -> None:
+        if self._writer.can_write_eof():
+            self._writer.write_eof()
+
+    def close(self) -> None:
+        self._writer.close()
+
+async def _aio_recv_prefixed(reader: asyncio.StreamReader) -> bytes:
+    """One length-prefixed frame, or b"" on EOF or a bad length."""
+    try:
+        hdr = await asyncio.wait_for(reader.readexactly(4), SOCKET_TIMEOUT_SECS)
+        length = int.from_bytes(hdr, "big")
+        if length <= 0 or length > MAX_MSG_LEN:
+            return b""
+        return await asyncio.wait_for(reader.readexactly(length), SOCKET_TIMEOUT_SECS)
+    except asyncio.IncompleteReadError:
+        return b""
+
+async def _aio_drive_login(sock: "_StreamSock", reader: asyncio.StreamReader, ip: str):
+    loop = asyncio.get_running_loop()
+    flow, reply = _login_flow(ip), None
+    try:
+        while True:
+            step = flow.send(reply)
+            if step is _RECV:
+                reply = await _aio_recv_prefixed(reader)
+            elif isinstance(step, tuple):       # PBKDF2 / SQLite – keep them off the loop
+                reply = await loop.run_in_executor(None, step[0], *step[1:])
+            elif isinstance(step, Future):
+                reply = await asyncio.wrap_future(step)
+            else:
+                _send_prefixed(sock, step);  reply = None
+    except StopIteration as done:
+        return done.value
+
+async def _aio_handle_client(reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter) -> None:
+    """Same login state machine as handle_client(), one task per client."""
+    addr = writer.get_extra_info("peername")
+    sess = None
+    try:
+        login = await _aio_drive_login(_StreamSock(writer), reader, addr[0])
+        if not login:
+            return
+        username, keys, proto, since = login
+        sess = Session(username, StreamOutbox(writer, username), addr, *keys, proto=proto)
+        _go_online(sess, since)
+
+        # 4) chat loop -----------------------------------------------
+        while True:
+            frame = await _aio_recv_prefixed(reader)
+            if not frame: break
+            _dispatch(sess, frame)
+
+    except asyncio.TimeoutError:
+        logger.info("%s timed out.", sess.username if sess else addr)
+    except (ConnectionResetError, BrokenPipeError):
+        logger.info("%s disconnected abruptly.", sess.username if sess else addr)
+    except Exception as e:
+        logger.error("Unhandled error with %s: %s", addr, e)
+    finally:
+        if sess:
+            _go_offline(sess)
+        writer.close()
+        logger.info("Client '%s' disconnected.", sess.username if sess else addr)
+
+async def _aio_tls_then_handle(tls_ctx: ssl.SSLContext,
+                               reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+    """Per-connection task: TLS upgrade under its own deadline, then login."""
+    global _aio_pending_handshakes
+    peer = writer.get_extra_info("peername")
+    if peer and not _ip_rep.allowed(peer[0]):
+        metrics.incr("iprep.refused")
+        writer.close();  return
+    if _aio_pending_handshakes >= MAX_PENDING_HANDSHAKES:
+        metrics.incr("handshake.rejected_busy")
+        logger.warning("Too many pending TLS handshakes – dropping %s",
+                       writer.get_extra_info("peername"))
+        writer.close();  return
+
+    _aio_pending_handshakes += 1
+    logger.info("Connection from %s", writer.get_extra_info("peername"))
+    t0 = time.perf_counter()
+    try:
+        await writer.start_tls(tls_ctx, ssl_handshake_timeout=HANDSHAKE_TIMEOUT_SECS)
+    except (ssl.SSLError, OSError, asyncio.TimeoutError) as e:
+        metrics.incr("handshake.failed")
+        logger.warning("TLS handshake with %s failed: %s",
+                       writer.get_extra_info("peername"), e)
+        writer.close();  return
+    finally:
+        _aio_pending_handshakes -= 1
+    _count_handshake(writer.get_extra_info("ssl_object"), time.perf_counter() - t0)
+    await _aio_handle_client(reader, writer)
+
+_aio_pending_handshakes = 0         # only touched from the event-loop thread
+
+def run_asyncio_engine(tls_ctx: TLSSource, port: int) -> None:
+    # asyncio's TLS transport preallocates a 256 KiB read buffer per
+    # connection; one TLS record (≤16 KiB) is all it ever needs at once.
+    # max_size is a CPython internal (the 3.11+ SSLProtocol allocates its
+    # buffer from it in __init__); where it is missing, keep the stock size.
+    if hasattr(asyncio.sslproto.SSLProtocol, "max_size"):
+        asyncio.sslproto.SSLProtocol.max_size = _AIO_SSL_READ_BUF
+    _start_sweeper()
+
+    async def _serve() -> None:
+        global _call_later
+        loop = asyncio.get_running_loop()       # presence flushes run on the loop too
+        _call_later = lambda delay, fn: loop.call_soon_threadsafe(loop.call_later, delay, fn)
+        # accept plain TCP; each task upgrades its own stream to TLS
+        server = await asyncio.start_server(
+            lambda r, w: _aio_tls_then_handle(_server_ctx(tls_ctx), r, w),
+            "0.0.0.0", port, backlog=100)
+        logger.info("Secure-Chat Server listening on 0.0.0.0:%s (asyncio)", port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        logger.info("Shutting down server …")
+
+ENGINES = {"threaded": run_threaded_engine, "asyncio": run_asyncio_engine}
+
+# ── sessions (shared by both engines) ───────────────────────────────
+@dataclass(eq=False)
+class Session:
+    """One online client as the routers see it."""
+    username: str
+    box: Outbox                     # all writes after login go through here
+    addr: Tuple[str, int]
+    pub_b64: str                    # v1 KEYPUB form (base64 of PEM)
+    pub_raw: bytes = b""            # v2 KEYPUB form (SEC1 point / raw X25519)
+    proto: int = PROTO_V1           # negotiated wire protocol
+    uid: int = 0                    # v2 user id (see _user_id)
+    resume_id: bytes = b""          # current resume token (utils.resume)
+    draining: bool = False          # offline backlog still being handed over
+    key_since: Tuple[int, int] = (0, 0)   # (epoch, version) of the key directory it last reported
+    ack_seq: int = 0                # highest sequenced frame routed from this connection
+    acked: int = 0                  # highest seq acknowledged to the client
+    ack_count: int = 0              # sequenced frames since that ACK
+    ack_armed: bool = False         # an ACK_DELAY_SECS timer is pending
+
+def _user_id(username: str) -> int:
+    """Stable v2 id for `username`; never reused while the server runs."""
+    with _clients_lock:
+        uid = _user_ids.get(username)
+        if uid is None:
+            uid = _user_ids[username] = len(_user_ids) + 1
+            _id_users[uid] = username
+        return uid
+
+def _go_online(sess: Session, since: Tuple[int, int] = (0, 0)) -> None:
+    """
+    Once a user passes both password and USB checks,
+    add them to the server's active-clients map,
+    tell their client 'you're in,' update everyone's user list, and log it.
+    """
+    sess.uid = _user_id(sess.username)
+    sess.key_since = since
+    with _clients_lock:
+        connected_clients[sess.username] = sess
+        version = _publish_key(sess)
+        if sess.proto == PROTO_V2:                         # keys changed since `since`, one frame
+            token, sess.resume_id = _resume_tokens.issue(sess.username, sess)
+            keypubs = [*_key_bundles(sess.username, *since),
+                       encode_frame(f"RESUME {token}".encode())]
+            legacy = [s.uid for s in connected_clients.values() if s.proto == PROTO_V1]
+            if legacy:                                     # they get CIPH, not ENV
+                keypubs.append(encode_frame(wire.v1_peers(legacy)))
+        else:
+            keypubs = _existing_keypub_frames(PROTO_V1)    # give newcomer others
+            w = encode_frame(wire.v1_peers([sess.uid]))
+            for s in connected_clients.values():
+                if s.proto == PROTO_V2:
+                    _deliver(s.box, w)
+        # newcomer: full login OK + presence snapshot + keys, drained as one write
+        # (queued under the lock so no presence delta can overtake the snapshot)
+        sess.box.put_many([encode_frame(b"SUCCESS"), _user_list_frame(sess.proto), *keypubs])
+        _broadcast_keypub(sess, version)                   # tell others newcomer
+    _presence_changed(sess.username, True)                 # others: merged delta
+    _write_behind.update(sess.username, last_login=int(time.time()))
+    if _offline.pending(sess.username):
+        _kick_drain(sess)
+    logger.info("[%s] logged in as '%s' (wire v%d)", sess.addr, sess.username, sess.proto)
+    logger.info("[%s] authenticated as '%s'", sess.addr, sess.username)
+
+def _go_offline(sess: Session) -> None:
+    _resume_tokens.release(sess.resume_id)                 # TTL clock starts now
+    _write_behind.update(sess.username, last_seen=int(time.time()))
     with _clients_lock:
-        for user, (_,_,pub) in connected_clients.items():
-            _send_prefixed(sock, f"KEYPUB {user} {pub}".encode())
+        # a newer login under the same name may already own the slot
+        if connected_clients.get(sess.username) is not sess:
+            return
+        connected_clients.pop(sess.username, None)
+        metrics.clear_gauge(f"outbox.{sess.username}")
+        version = _retire_key(sess.username)
+        if version is not None:                            # v2 peers drop the key
+            w = encode_frame(wire.keydir(KEYDIR_EPOCH, version - 1, version,
+                                         [(sess.uid, sess.username, b"")]))
+            for s in connected_clients.values():
+                if s.proto == PROTO_V2:
+                    _deliver(s.box, w)
+    _presence_changed(sess.username, False)
+
+# ── offline messages ────────────────────────────────────────────────
+def _queue_offline(sender: str, recipient: str, blob, seq: int = 0) -> None:
+    """Keep a private message for a known user who is not (fully) online yet."""
+    if _user_dir.get(recipient) is None:
+        return
+    try:
+        queued = _offline.append(recipient, sender, blob, seq)
+    except OSError as e:                # a failing disk never stops the relay
+        metrics.incr("offline.failed")
+        logger.error("Offline message for %s not written: %s", recipient, e)
+        return
+    if queued:
+        metrics.incr("offline.queued")
+    else:
+        metrics.incr("offline.refused")
+        logger.warning("Offline queue for '%s' is full – message from %s dropped",
+                       recipient, sender)
 
-def _broadcast_keypub(user, pub_b64):
-    pkt = f"KEYPUB {user} {pub_b64}".encode()
+def _kick_drain(sess: Session) -> None:
     with _clients_lock:
-        for u,(s,_,_) in connected_clients.items(): # u = username, s = socket, _ _ ignore the rest of the tuple
-            if u != user: _send_prefixed(s, pkt) # ensures that the public key is not sent back to the user who owns it
+        if sess.draining:
+            return
+        sess.draining = True
+    _drain_step(sess)
+
+def _drain_step(sess: Session) -> None:
+    """
+    Hand one batch of the backlog to the client's outbox, then wait for it
+    to reach the socket (_drain_ack).  Messages routed to the client
+    meanwhile are queued behind the backlog (see _route_cipher), so order
+    is kept.
+    """
+    if connected_clients.get(sess.username) is not sess:
+        sess.draining = False           # logged out – the rest waits for the next login
+        return
+    if sess.box.depth() > sess.box.high_water // 2:
+        _call_later(0.005, lambda: _drain_step(sess));  return
+    records, end = _offline.read(sess.username, max_bytes=OFFLINE_BATCH_BYTES)
+    if not records:
+        with _clients_lock:
+            sess.draining = False
+        if _offline.pending(sess.username):        # a router queued after our last read
+            _kick_drain(sess)
+        return
+    ids: Dict[str, int] = {}
+    frames = []
+    for _, sender, blob, seq in records:
+        if sess.proto == PROTO_V2:
+            sid = ids.get(sender) or ids.setdefault(sender, _user_id(sender))
+            frames.append(encode_frame(wire.cipher_seq(sid, sess.uid, seq, blob) if seq else
+                                       wire.cipher(sid, sess.uid, blob)))
+        else:
+            frames.append(encode_frame(_v1_cipher(sender, sess.username, blob)))
+    if not sess.box.put_many(frames):
+        sess.draining = False           # connection closing; resent at the next login
+        return
+    _drain_ack(sess, sess.box.mark(), end, len(records))
+
+def _drain_ack(sess: Session, mark: int, end: int, n: int) -> None:
+    """Acknowledge a drained batch once the outbox has written it, then go on."""
+    if connected_clients.get(sess.username) is not sess:
+        sess.draining = False           # not flushed: resent at the next login
+        return
+    if sess.box.written() < mark:
+        _call_later(0.005, lambda: _drain_ack(sess, mark, end, n));  return
+    _offline.ack(sess.username, end)
+    metrics.incr("offline.delivered", n)
+    _call_later(0, lambda: _drain_step(sess))
+
+# ── delivery acks ───────────────────────────────────────────────────
+def _accept_seq(sess: Session, seq: int) -> bool:
+    """
+    Count a sequenced frame (routed by the caller) towards the next
+    cumulative ACK; False if its sender had it routed before – a resend.
+    """
+    win = _seq_windows.get(sess.username)
+    if win is None:
+        win = _seq_windows.setdefault(sess.username, SeqWindow())
+    fresh = win.accept(seq)
+    if not fresh:
+        metrics.incr("delivery.duplicates")
+    sess.ack_seq = max(sess.ack_seq, seq)
+    sess.ack_count += 1
+    if sess.ack_count >= ACK_EVERY:
+        _send_ack(sess)
+    elif not sess.ack_armed:
+        sess.ack_armed = True
+        _call_later(ACK_DELAY_SECS, lambda: _send_ack(sess))
+    return fresh
 
-def _route_cipher(frame: bytes):
-        # frame = b"CIPH <sender> <recipient> <base64_blob>"
-    parts = frame.split(b" ", 3) # parts = [b"CIPH", b"sender", b"recipient", b"blob"]
+def _send_ack(sess: Session) -> None:
+    sess.ack_armed = False
+    seq = sess.ack_seq
+    if seq <= sess.acked:
+        return
+    sess.acked, sess.ack_count = seq, 0
+    _deliver(sess.box, encode_frame(wire.ack(seq) if sess.proto == PROTO_V2 else b"ACK %d" % seq))
+    metrics.incr("delivery.acks")
+
+def _v1_cipher(sender: str, recipient: str, blob) -> bytes:
+    """CIPH for a v1 session – always the legacy 4-field form, without seq."""
+    return b"CIPH %s %s %s" % (sender.encode(), recipient.encode(), base64.b64encode(blob))
+
+# ── history ─────────────────────────────────────────────────────────
+def _record(conv: str, sender: str, kind: bytes, payload) -> None:
+    """Keep a relayed message for scrollback; a failing disk never stops the relay."""
+    try:
+        _history.append(conv, sender, kind, payload)
+    except OSError as e:
+        metrics.incr("history.failed")
+        logger.error("History not written for %s: %s", sender, e)
+
+def _record_private(sender: str, recipient: str, blob) -> None:
+    if recipient in connected_clients or _user_dir.get(recipient) is not None:
+        _record(history.conversation(sender, recipient), sender, history.KIND_CIPHER, blob)
+
+def _route_history(sess: Session, frame) -> None:
+    # frame = b"HISTORY <peer> <before_ts> <limit>"   (peer "Everyone" = the broadcast room)
+    # reply = b"HIST <peer> <count> <oldest_ts>\n" + records (utils.history), v1 and v2 alike
+    parts = bytes(frame[:_HEADER_SCAN]).split(b" ")
     if len(parts) != 4:
         return
-    _, sender_b, recipient_b, blob_b64 = parts
-    sender    = sender_b.decode()
+    try:
+        peer, before, limit = parts[1].decode(), int(parts[2]), int(parts[3])
+    except ValueError:
+        return
+    count, oldest, body = _history.page(history.conversation(sess.username, peer),
+                                        before, max(0, min(limit, HISTORY_MAX_LIMIT)))
+    metrics.incr("history.pages")
+    _deliver(sess.box, encode_frame(b"HIST %s %d %d\n" % (parts[1], count, oldest) + body))
+
+# ── presence ────────────────────────────────────────────────────────
+# one scheduler thread for every timer: drain polls and ACK windows fire
+# often enough that a threading.Timer (a new thread) each would add up
+_timers: list = []                      # heap of (due, tiebreak, fn)
+_timers_cond = threading.Condition()
+_timers_seq = itertools.count()
+_timers_thread: threading.Thread | None = None
+
+def _thread_call_later(delay: float, fn) -> None:
+    global _timers_thread
+    with _timers_cond:
+        heapq.heappush(_timers, (time.monotonic() + delay, next(_timers_seq), fn))
+        if _timers_thread is None:
+            _timers_thread = threading.Thread(target=_run_timers, daemon=True, name="timers")
+            _timers_thread.start()
+        _timers_cond.notify()
+
+def _run_timers() -> None:
+    while True:
+        with _timers_cond:
+            while True:
+                wait = _timers[0][0] - time.monotonic() if _timers else None
+                if wait is not None and wait <= 0:
+                    fn = heapq.heappop(_timers)[2]
+                    break
+                _timers_cond.wait(wait)
+        try:
+            fn()
+        except Exception:
+            logger.exception("Timer callback failed")
+
+_call_later = _thread_call_later        # the asyncio engine swaps in loop.call_later
+
+def _presence_changed(username: str, online: bool) -> None:
+    """Record a join/leave; everything inside one debounce window goes out as one frame."""
+    global _presence_flush_due
+    with _clients_lock:
+        _presence_pending[username] = online            # last state in the window wins
+        if _presence_flush_due:
+            return
+        _presence_flush_due = True
+    _call_later(PRESENCE_DEBOUNCE_SECS, _flush_presence)
+
+def _flush_presence() -> None:
+    global _presence_seq, _presence_flush_due
+    with _clients_lock:
+        changes = dict(_presence_pending)
+        _presence_pending.clear()
+        _presence_flush_due = False
+        if not changes:
+            return
+        _presence_seq += 1
+        wires: Dict[int, bytes] = {}
+        for s in connected_clients.values():
+            w = wires.get(s.proto)
+            if w is None:
+                w = wires[s.proto] = _presence_frame(s.proto, changes)
+            _deliver(s.box, w)
+
+def _presence_frame(proto: int, changes: Dict[str, bool]) -> bytes:
+    """
+    v2: one delta (+user with id/name, -user by id) under _presence_seq.
+    v1 clients have no delta support, so they get the merged full list.
+    """
+    if proto == PROTO_V2:
+        return encode_frame(wire.presence(
+            _presence_seq, [(_user_ids[u], u if online else "") for u, online in changes.items()]))
+    return _user_list_frame(PROTO_V1)
+
+def _route_users_v2(sess: Session, frame) -> None:
+    # client saw a gap in presence seq numbers – send a fresh snapshot
+    with _clients_lock:
+        _deliver(sess.box, _user_list_frame(sess.proto))
+
+def _deliver(box: Outbox, wire: bytes) -> None:
+    """Enqueue an encoded frame; never blocks the router."""
+    if not box.put(wire):
+        metrics.incr("outbox.dropped")
+        logger.debug("outbox for %s full/closed – frame dropped", box.name)
+
+def _fanout(sender: Session, make) -> None:
+    """Deliver to everyone but `sender`; make(proto) is built once per protocol."""
+    wires: Dict[int, bytes] = {}
+    with _clients_lock:
+        for s in connected_clients.values():
+            if s is sender:
+                continue      # don't send back to the originator
+            w = wires.get(s.proto)
+            if w is None:
+                w = wires[s.proto] = make(s.proto)
+            if w:
+                _deliver(s.box, w)
+
+def queue_depths() -> Dict[str, int]:
+    """Bytes waiting in each online client's outbox (for monitoring)."""
+    with _clients_lock:
+        sessions = list(connected_clients.values())
+    return {s.username: s.box.depth() for s in sessions}
+
+def _sweep_outboxes() -> None:
+    """Publish queue depths; evict clients stuck above high-water too long.
+    Also expires login-throttle buckets and IP blocks, reloads IP rules,
+    flushes buffered users.db writes and picks up edits made by other processes,
+    and fsyncs / expires the offline message queue and the message history."""
+    last_expire = time.monotonic()
+    while True:
+        time.sleep(SWEEP_INTERVAL_SECS)
+        _login_throttle.sweep()
+        _ip_rep.sweep()
+        try:
+            if _ip_rep.reload_if_changed():
+                logger.info("IP rules reloaded: %d prefixes", _ip_rep.rule_count())
+        except (OSError, ValueError) as e:
+            logger.error("IP rules not reloaded, keeping the old ones: %s", e)
+        _flush_bookkeeping()
+        _offline.sync()                 # group commit: one fsync per written segment
+        _history.sync()
+        if time.monotonic() - last_expire > OFFLINE_EXPIRE_SECS:
+            last_expire = time.monotonic()
+            _offline.expire()
+            _history.expire()
+        try:
+            _user_dir.refresh()
+        except Exception as e:
+            logger.error("User directory refresh failed: %s", e)
+        metrics.set_gauge("throttle.entries", len(_login_throttle))
+        now = time.monotonic()
+        with _clients_lock:
+            sessions = list(connected_clients.values())
+        total = 0
+        for s in sessions:
+            depth = s.box.depth()
+            total += depth
+            metrics.set_gauge(f"outbox.{s.username}", depth)
+            since = s.box.over_since
+            if since is not None and now - since > SLOW_CONSUMER_SECS:
+                logger.warning("Evicting slow consumer '%s' (%d bytes queued for %.0fs)",
+                               s.username, depth, now - since)
+                metrics.incr("outbox.evicted")
+                s.box.abort()
+        metrics.set_gauge("outbox.total", total)
+
+def _flush_bookkeeping() -> None:
+    """Write buffered USB counters / login stamps (kept for the next try on error)."""
+    try:
+        _write_behind.flush()
+    except Exception as e:
+        logger.error("users.db write-behind flush failed (%d rows kept): %s",
+                     len(_write_behind), e)
+
+def _start_sweeper() -> None:
+    threading.Thread(target=_sweep_outboxes, daemon=True, name="outbox-sweeper").start()
+
+# ── frame dispatch ──────────────────────────────────────────────────
+def _dispatch(sess: Session, frame) -> None:
+    """Route one chat-loop frame (bytes or a memoryview from FrameReader)."""
+    if wire.is_v2(frame):
+        handler = _V2_ROUTES.get(frame[0])
+    else:
+        handler = _V1_ROUTES.get(bytes(frame[:8]).split(b" ", 1)[0])
+    if handler:
+        handler(sess, frame)
+
+def _frame_fields(frame, n: int) -> list[bytes]:
+    """First `n` space-separated header fields of a frame, without copying the body."""
+    head = bytes(frame[:_HEADER_SCAN])
+    fields = head.split(b" ", n)
+    return fields[:n] if len(fields) > n else []
+
+def _keypub_forms(blob_b64: bytes) -> tuple[str, bytes] | None:
+    """
+    Client key in whatever encoding it sent → (base64 PEM for v1 peers,
+    compact point for v2 peers); None if it is not a usable public key.
+    """
+    try:
+        pub = load_peer_public_key(base64.b64decode(blob_b64, validate=True))
+    except Exception:
+        return None
+    return base64.b64encode(public_key_pem(pub)).decode(), encode_public_key(pub)
+
+def _keypub_frame(owner: Session, proto: int) -> bytes:
+    if proto == PROTO_V2:
+        return encode_frame(wire.keypub(owner.uid, owner.pub_raw))
+    return encode_frame(f"KEYPUB {owner.username} {owner.pub_b64}".encode())
+
+def _existing_keypub_frames(proto: int) -> list[bytes]:
+    """One encoded KEYPUB per online user (call with _clients_lock)."""
+    return [_keypub_frame(s, proto) for s in connected_clients.values()]
+
+def _broadcast_keypub(owner: Session, version: int | None) -> None:
+    """
+    v1 peers get the KEYPUB on every login, as before; v2 peers only when
+    the key changed (version), as a one-entry directory delta.
+    """
+    def make(proto: int) -> bytes:
+        if proto == PROTO_V1:
+            return _keypub_frame(owner, PROTO_V1)
+        if version is None:
+            return b""                                  # unchanged – v2 peers have it
+        return encode_frame(wire.keydir(KEYDIR_EPOCH, version - 1, version,
+                                        [(owner.uid, owner.username, owner.pub_raw)]))
+    _fanout(owner, make)                                # encoded once per protocol
+
+# ── key directory ───────────────────────────────────────────────────
+def _parse_key_since(token: bytes) -> Tuple[int, int]:
+    """b"<epoch>:<version>" from a v2 KEYPUB; (0, 0) means "send everything"."""
+    epoch, _, version = token.partition(b":")
+    try:
+        return int(epoch), int(version)
+    except ValueError:
+        return 0, 0
+
+def _publish_key(sess: Session) -> int | None:
+    """Record sess's key (call with _clients_lock); new version, or None if unchanged."""
+    global _key_dir_version
+    entry = _key_dir.get(sess.username)
+    if entry and entry[1] == sess.pub_raw:
+        return None
+    _key_dir_version += 1
+    _key_dir[sess.username] = (_key_dir_version, sess.pub_raw)
+    return _key_dir_version
+
+def _retire_key(username: str) -> int | None:
+    """Tombstone an offline user's key (call with _clients_lock); new version, or None."""
+    global _key_dir_version, _key_dir_floor
+    entry = _key_dir.get(username)
+    if not entry or not entry[1]:
+        return None
+    _key_dir_version += 1
+    _key_dir[username] = (_key_dir_version, b"")
+    tombs = sorted((ver, u) for u, (ver, raw) in _key_dir.items() if not raw)
+    for ver, u in tombs[:max(0, len(tombs) - KEYDIR_MAX_TOMBSTONES)]:
+        del _key_dir[u]                                 # clients behind this start over
+        _key_dir_floor = max(_key_dir_floor, ver)
+    return _key_dir_version
+
+def _key_bundles(username: str, epoch: int, since: int) -> list[bytes]:
+    """
+    OP_KEYDIR frames with every key newer than `since` (call with
+    _clients_lock), split at KEYDIR_FRAME_BYTES; a fresh start gets
+    online users only, an update also the tombstones since.
+    """
+    if epoch != KEYDIR_EPOCH or since < _key_dir_floor:
+        since = 0                                       # other server run / pruned – start over
+    entries = sorted((ver, _user_ids[u], u, raw) for u, (ver, raw) in _key_dir.items()
+                     if ver > since and u != username and (raw or since))
+    frames, chunk, size, lo, top = [], [], 0, since, since
+    for ver, uid, name, raw in entries:
+        n = 12 + len(name.encode()) + len(raw)         # varints at their widest
+        if chunk and size + n > KEYDIR_FRAME_BYTES:
+            frames.append(encode_frame(wire.keydir(KEYDIR_EPOCH, lo, top, chunk)))
+            chunk, size, lo = [], 0, top
+        chunk.append((uid, name, raw))
+        size, top = size + n, ver
+    frames.append(encode_frame(wire.keydir(KEYDIR_EPOCH, lo, _key_dir_version, chunk)))
+    return frames
+
+def _route_ping(sess: Session, frame) -> None:
+    pass
+
+def _route_keypub(sess: Session, frame) -> None:
+    # frame = b"KEYPUB <base64 key> [<epoch>:<version>]" – client rotated its ECDH key mid-session
+    parts = bytes(frame).split(b" ")
+    keys = _keypub_forms(parts[1]) if len(parts) in (2, 3) else None
+    if keys is None:
+        return
+    if len(parts) == 3:
+        since = _parse_key_since(parts[2])
+        if since[0] == sess.key_since[0] and since[1] < sess.key_since[1]:
+            logger.warning("Stale KEYPUB from '%s' ignored (directory version went back)",
+                           sess.username)
+            return
+        sess.key_since = since
+    with _clients_lock:
+        sess.pub_b64, sess.pub_raw = keys
+        _broadcast_keypub(sess, _publish_key(sess))
+    logger.info("'%s' rotated its public key", sess.username)
+
+def _route_cipher(sess: Session, frame) -> None:
+        # frame = b"CIPH <sender> <recipient> [<seq>] <base64_blob>"
+    parts = _frame_fields(frame, 4) # sequenced: [b"CIPH", b"sender", b"recipient", b"seq"]
+    seq = 0
+    if parts:
+        if not parts[3].isdigit():
+            return
+        seq = int(parts[3])
+    else:
+        parts = _frame_fields(frame, 3) # parts = [b"CIPH", b"sender", b"recipient"]
+        if not parts:
+            return
+    sender_b, recipient_b = parts[1], parts[2]
     recipient = recipient_b.decode()
-    # ───────── NEW logging ─────────
+    if seq and not _accept_seq(sess, seq):
+        return                          # resent after a reconnect, routed already
     logger.info(
-        "Relaying E2E private message from %s to %s: %s",
-        sender, recipient, blob_b64.decode()
+        "Relaying E2E private message from %s to %s (%d bytes)",
+        sender_b.decode(), recipient, len(frame)
     )
-    # ───────── existing relay ─────────
+    try:
+        blob = base64.b64decode(frame[sum(len(p) + 1 for p in parts):])
+    except ValueError:
+        return
+    _record_private(sess.username, recipient, blob)
     tgt = connected_clients.get(recipient)
-    if not tgt:
+    if not tgt or tgt.draining:
+        _queue_offline(sess.username, recipient, blob, seq)
+        if tgt and not tgt.draining:    # its drain finished while we queued
+            _kick_drain(tgt)
         return
-    _send_prefixed(tgt[0], frame)
+    if tgt.proto == PROTO_V1 and seq:   # legacy v1 clients read exactly 4 fields
+        _deliver(tgt.box, encode_frame(b"CIPH %s %s " % (sender_b, recipient_b) +
+                                       frame[sum(len(p) + 1 for p in parts):]))
+    elif tgt.proto == PROTO_V1:
+        _deliver(tgt.box, encode_frame(frame))
+    elif seq:
+        _deliver(tgt.box, encode_frame(wire.cipher_seq(sess.uid, tgt.uid, seq, blob)))
+    else:
+        _deliver(tgt.box, encode_frame(wire.cipher(sess.uid, tgt.uid, blob)))
 
-def _route_broadcast(frame: bytes):
+def _route_broadcast(sess: Session, frame) -> None:
     # frame = b"BCAST sender blob"
-    parts = frame.split(b" ", 2) # parts = [b"BCAST", b"sender", b"blob"]
-    if len(parts) != 3:
+    parts = _frame_fields(frame, 2) # parts = [b"BCAST", b"sender"]
+    if not parts:
         return
-    _, sender_b, blob_b64 = parts
-    sender = sender_b.decode()
+    body = frame[len(parts[1]) + 7:]
+    try:
+        _record(_ROOM, sess.username, history.KIND_BCAST, base64.b64decode(body))
+    except ValueError:
+        return
+    _fanout(sess, lambda proto: encode_frame(frame) if proto == PROTO_V1 else
+                                encode_frame(wire.bcast(sess.uid, base64.b64decode(body))))
 
-    with _clients_lock:
-        for uname, (sock, _, _) in connected_clients.items():
-            if uname == sender:
-                continue      # don't send back to the originator
-            _send_prefixed(sock, frame)
+def _route_cipher_v2(sess: Session, frame) -> None:
+    # frame = OP_CIPH | sender_id | recipient_id | raw ciphertext
+    #      or OP_SCIPH | sender_id | recipient_id | seq | raw ciphertext
+    try:
+        if frame[0] == wire.OP_SCIPH:
+            sid, rid, seq, blob = wire.parse_cipher_seq(frame)
+        else:
+            (sid, rid, blob), seq = wire.parse_cipher(frame), 0
+    except ValueError:
+        return
+    recipient = _id_users.get(rid)
+    if sid != sess.uid or not recipient:
+        return
+    if seq and not _accept_seq(sess, seq):
+        return                          # resent after a reconnect, routed already
+    _record_private(sess.username, recipient, blob)
+    tgt = connected_clients.get(recipient)
+    if not tgt or tgt.draining:
+        _queue_offline(sess.username, recipient, blob, seq)
+        if tgt and not tgt.draining:    # its drain finished while we queued
+            _kick_drain(tgt)
+        return
+    logger.info("Relaying E2E private message from %s to %s (%d bytes)",
+                sess.username, recipient, len(frame))
+    if tgt.proto == PROTO_V2:
+        _deliver(tgt.box, encode_frame(frame))
+    else:
+        _deliver(tgt.box, encode_frame(_v1_cipher(sess.username, recipient, blob)))
+
+def _route_broadcast_v2(sess: Session, frame) -> None:
+    # frame = OP_BCAST | sender_id | raw ciphertext
+    try:
+        sid, blob = wire.parse_bcast(frame)
+    except ValueError:
+        return
+    if sid != sess.uid:
+        return
+    _record(_ROOM, sess.username, history.KIND_BCAST, blob)
+    _fanout(sess, lambda proto: encode_frame(frame) if proto == PROTO_V2 else
+                                encode_frame(f"BCAST {sess.username} ".encode() + base64.b64encode(blob)))
+
+def _relay_envelope(sess: Session, body, wraps) -> None:
+    """Forward the shared body to each recipient with only its own wrapped key."""
+    wraps = [(name, wk) for name, wk in wraps if name]
+    _record(_ROOM, sess.username, history.KIND_ENV, history.envelope_payload(wraps, body))
+    body_b64 = None                         # v1 form, built on first use
+    sent = 0
+    for recipient, wrapped in wraps:
+        tgt = connected_clients.get(recipient)
+        if not tgt or tgt is sess:
+            continue
+        if tgt.proto == PROTO_V2:
+            payload = wire.env(sess.uid, ((tgt.uid, wrapped),), body)
+        elif sess.proto == PROTO_V2:
+            metrics.incr("envelope.v1_skipped")     # legacy client: the sender sends it CIPH
+            continue
+        else:
+            if body_b64 is None:
+                body_b64 = base64.b64encode(body)
+            payload = b"ENV %s %s %s:%s" % (sess.username.encode(), body_b64,
+                                            recipient.encode(), base64.b64encode(wrapped))
+        _deliver(tgt.box, encode_frame(payload))
+        sent += 1
+    logger.info("Relaying E2E envelope from %s to %d recipients (%d bytes body)",
+                sess.username, sent, len(body))
+
+def _route_envelope(sess: Session, frame) -> None:
+    # frame = b"ENV <sender> <b64 body> <name>:<b64 key>,<name>:<b64 key>,…"
+    parts = bytes(frame).split(b" ", 3)
+    if len(parts) != 4:
+        return
+    try:
+        body = base64.b64decode(parts[2])
+        wraps = []
+        for item in parts[3].split(b","):
+            name, _, wrapped = item.partition(b":")
+            wraps.append((name.decode(), base64.b64decode(wrapped)))
+    except ValueError:
+        return
+    _relay_envelope(sess, body, wraps)
+
+def _route_envelope_v2(sess: Session, frame) -> None:
+    # frame = OP_ENV | sender_id | n | (recipient_id, wrapped key) * n | body
+    try:
+        sid, wraps, body = wire.parse_env(frame)
+    except ValueError:
+        return
+    if sid != sess.uid:
+        return
+    _relay_envelope(sess, body, [(_id_users.get(rid), wk) for rid, wk in wraps])
+
+# first word of a v1 frame / first byte of a v2 frame → handler
+_V1_ROUTES = {b"PING": _route_ping, b"CIPH": _route_cipher, b"BCAST": _route_broadcast,
+              b"ENV": _route_envelope, b"KEYPUB": _route_keypub, b"HISTORY": _route_history}
+_V2_ROUTES = {wire.OP_PING: _route_ping, wire.OP_CIPH: _route_cipher_v2,
+              wire.OP_SCIPH: _route_cipher_v2, wire.OP_BCAST: _route_broadcast_v2,
+              wire.OP_ENV: _route_envelope_v2, wire.OP_USERS: _route_users_v2}
 
 # ── USB verification ────────────────────────────────────────────────
 def _verify_usb(user: str, serial: str, digest: str) -> tuple[bool, int, int]:
     """Return (ok, seconds_left_if_locked, tries_left_if_fail)."""
     now = int(time.time())
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        cur = conn.cursor()
-        cur.execute("""SELECT usb_serial, usb_hash,
-                              usb_fail_count, usb_locked_until
-                       FROM users WHERE username=?""", (user,))
-        row = cur.fetchone()
-        if not row or not row[0]:
-            return False, 0, 0
-        exp_serial, exp_hash, fails, locked = row
-        if locked and locked > now:
-            return False, locked - now, 0
-
-        # success?
-        if serial == exp_serial and digest.lower() == exp_hash.lower():
-            cur.execute("""UPDATE users
-                             SET usb_fail_count=0, usb_locked_until=0
-                           WHERE username=?""", (user,))
-            return True, 0, 0
-
-        # failure
-        fails += 1
-        new_lock = now + _LOCK_SECS_USB if fails >= _MAX_FAILS_USB else 0
-        cur.execute("""UPDATE users
-                         SET usb_fail_count=?, usb_locked_until=?
-                       WHERE username=?""",
-                    (fails % _MAX_FAILS_USB, new_lock, user))
-        tries_left = 0 if new_lock else (_MAX_FAILS_USB - fails)
-        return False, new_lock - now if new_lock else 0, tries_left
+    rec = _user_dir.get(user)
+    if not rec or not rec.usb_serial:
+        return False, 0, 0
+    fails, locked = rec.usb_fail_count, rec.usb_locked_until
+    if locked and locked > now:
+        return False, locked - now, 0
 
-# ── tiny helpers ----------------------------------------------------
-def _read_exact(sock: socket.socket, n: int) -> bytes:   # n = number of bytes to read.
-    """Ensure you read exactly n bytes from the socket (looping on partial reads), 
-       or return an empty bytes object if the connection closes.
-       
-       (Reads exactly n bytes from the socket Keep reading until you have all n bytes.(or returns empty if the connection closed).
-       """
-    data = b""
-    while len(data) < n:
-        chunk = sock.recv(n - len(data))
-        if not chunk:
-            return b""
-        data += chunk
-    return data
+    # success? (the common case reads only – nothing to reset, nothing to write)
+    if serial == rec.usb_serial and digest.lower() == rec.usb_hash.lower():
+        if fails or locked:
+            _set_usb_state(rec, 0, 0)
+        return True, 0, 0
 
-def _recv_prefixed(sock: socket.socket) -> bytes:
-    """
-        Read a 4-byte big-endian length header, validate it,  
-        then read that many bytes—delivering one complete framed message.
-        (Reads a 4-byte length, then reads exactly that many bytes to get one complete message.)
-        >>First read 4 bytes to know how big the message is.
-        >>Then read exactly that many bytes to get the full message.
-        >>If anything is wrong (invalid size), return empty b"".
-    """
-    hdr = _read_exact(sock, 4)  # hdr =  4-byte length prefix of the message.
-    if not hdr:
-        return b""
-    length = int.from_bytes(hdr, "big")
-    if length <= 0 or length > MAX_MSG_LEN:
-        return b""
-    return _read_exact(sock, length)
+    # failure – enforced from memory at once, written with the next flush
+    fails += 1
+    new_lock = now + _LOCK_SECS_USB if fails >= _MAX_FAILS_USB else 0
+    _set_usb_state(rec, fails % _MAX_FAILS_USB, new_lock)
+    tries_left = 0 if new_lock else (_MAX_FAILS_USB - fails)
+    return False, new_lock - now if new_lock else 0, tries_left
 
+def _set_usb_state(rec, fails: int, locked_until: int) -> None:
+    _write_behind.update(rec.username, usb_fail_count=fails, usb_locked_until=locked_until)
+    _user_dir.put(replace(rec, usb_fail_count=fails, usb_locked_until=locked_until))
+
+# ── tiny helpers ----------------------------------------------------
 def _send_prefixed(sock: socket.socket, payload: bytes) -> None:
     """
         Prepend a 4-byte big-endian length header to payload and send it in one sendall() call,
         ensuring the receiver can parse message boundaries.
 
         (Sends your data with a 4-byte length header so the receiver knows where the message ends.)
-        Goal: Send a message with a 4-byte length prefix.
-
-        First attach the message size (4 bytes).
-
-        Then send both together in one sendall() call.
+        Only used during login – once online, frames go through the client's outbox.
     """
     try:
-        sock.sendall(len(payload).to_bytes(4, "big") + payload)
+        sock.sendall(encode_frame(payload))
     except Exception as e:
         logger.debug("send failed: %s", e)
 
-def _broadcast_user_list() -> None:
-    with _clients_lock:
-        users_csv = ",".join(connected_clients.keys())
-        targets   = [t[0] for t in connected_clients.values()]   # take only the socket
-    msg = f"USERS {users_csv}".encode()
-    for s in targets:
-        _send_prefixed(s, msg)
+def _user_list_frame(proto: int) -> bytes:
+    """Encoded presence snapshot for one wire protocol (call with _clients_lock)."""
+    if proto == PROTO_V2:
+        return encode_frame(wire.users(_presence_seq, ((s.uid, s.username)
+                                                       for s in connected_clients.values())))
+    return encode_frame(f"USERS {','.join(connected_clients.keys())}".encode())
 
 def broadcast(msg: str, *, exclude: str | None = None) -> None: # * = no more positional arguments after this, 
     """
     Send a message to all clients (except maybe one client if exclude is given)
     For each connected client:
 
-    If it's not the excluded user, send the message.
+    If it's not the excluded user, queue the message.
 
-    If sending fails, mark them as "dead" (disconnected).
+    If their outbox refuses it, mark them as "dead" (disconnected or hopelessly behind).
 
-    If any clients are "dead," close their sockets and remove them from the connected users list.
-
-    Then update everyone again with the new user list.
+    If any clients are "dead," close their outboxes and take them offline
+    (_go_offline: key tombstone, presence delta, resume token released).
     """
     dead = []
+    frame = encode_frame(msg.encode())
     with _clients_lock:
         items = list(connected_clients.items())
-    for user, (s, _) in items:
+    for user, sess in items:
         if user == exclude:
             continue
+        if not sess.box.put(frame):
+            logger.warning("Broadcast to %s failed: outbox full/closed", user)
+            dead.append(sess)
+    for sess in dead:
         try:
-            _send_prefixed(s, msg.encode())
-        except Exception as e:
-            logger.warning("Broadcast to %s failed: %s", user, e)
-            dead.append(user)
-    if dead:
-        with _clients_lock:
-            for u in dead:
-                try:
-                    connected_clients[u][0].close()
-                except Exception:
-                    pass
-                connected_clients.pop(u, None)
-        _broadcast_user_list()
+            sess.box.close()
+        except Exception:
+            pass
+        _go_offline(sess)
 
 # ── graceful shutdown ----------------------------------------------
-def shutdown(server_sock: ssl.SSLSocket) -> None:
+def shutdown(server_sock: socket.socket) -> None:
     logger.info("Shutting down server …")
     try:
         server_sock.shutdown(socket.SHUT_RDWR)
@@ -372,15 +1287,22 @@ def shutdown(server_sock: ssl.SSLSocket) -> None:
         pass
     server_sock.close()
     with _clients_lock:
-        for s, _ in connected_clients.values():
+        for sess in connected_clients.values():
             try:
-                s.close()
+                sess.box.close()
             except Exception:
                 pass
         connected_clients.clear()
-    sys.exit(0)
+    sys.exit(0)                         # start_server's finally releases the rest
 
 # ── entrypoint ------------------------------------------------------
 if __name__ == "__main__":
-    port = int(sys.argv[1]) if len(sys.argv) == 2 else PORT_DEFAULT
-    start_server(port)
+    ap = argparse.ArgumentParser(description="Secure-Chat server")
+    ap.add_argument("port", nargs="?", type=int, default=PORT_DEFAULT)
+    ap.add_argument("--engine", choices=sorted(ENGINES), default=ENGINE_DEFAULT)
+    ap.add_argument("--cert-type", choices=CERT_KEY_TYPES, default=CERT_KEY_TYPE,
+                    help="key type if a new server certificate has to be generated")
+    ap.add_argument("--auth-executor", choices=AUTH_EXECUTORS, default=AUTH_EXECUTOR,
+                    help="run PBKDF2 password checks on threads or processes")
+    args = ap.parse_args()
+    start_server(args.port, args.engine, args.cert_type, args.auth_executor)
@@ -1,5 +1,11 @@
 # python/security/__init__.py
-from .encryption import encrypt_message, decrypt_message
-from .key_management import generate_ecdh_keypair, derive_shared_key
-__all__ = ["encrypt_message", "decrypt_message",
-           "generate_ecdh_keypair", "derive_shared_key"]
+from .encryption import (encrypt_message, decrypt_message, seal_envelope, open_envelope,
+                         AEADContext, get_context, forget_key, seal_many, open_many,
+                         needs_rekey, NonceExhaustedError)
+from .key_management import (generate_ecdh_keypair, derive_shared_key, encode_public_key,
+                             load_peer_public_key, public_key_pem)
+__all__ = ["encrypt_message", "decrypt_message", "seal_envelope", "open_envelope",
+           "AEADContext", "get_context", "forget_key", "seal_many", "open_many",
+           "needs_rekey", "NonceExhaustedError",
+           "generate_ecdh_keypair", "derive_shared_key", "encode_public_key",
+           "load_peer_public_key", "public_key_pem"]
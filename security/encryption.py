@@ -1,36 +1,172 @@
 # security/encryption.py
 
 import os
+import hashlib
+import itertools
 import threading
 import logging
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.exceptions import InvalidTag
 
 # Configure logger for this module
 logger = logging.getLogger('secure_chat.encryption')
 
-# Global variables for IV generation to ensure uniqueness
-_iv_counter = int.from_bytes(os.urandom(4), 'big')
-_iv_lock = threading.Lock()
+# Size of one envelope key wrap: IV + tag + 32-byte content key
+WRAPPED_KEY_LEN = 12 + 16 + 32
 
-def _get_unique_iv() -> bytes:
+# Cached AEAD contexts (one per peer key)
+_CONTEXT_CACHE_SIZE = 256
+_contexts: "OrderedDict[bytes, AEADContext]" = OrderedDict()
+_contexts_lock = threading.Lock()
+
+# Nonce state outlives its context: a rebuilt context continues the key's
+# sequencer.  Sequencers sit in their own, larger LRU keyed by a key
+# fingerprint (no key material kept); one that does fall out is replaced
+# by a fresh random prefix, which keeps nonces apart all the same – only
+# its usage count restarts.  forget_key() drops both on rekey.
+_SEQUENCER_CACHE_SIZE = 16 * _CONTEXT_CACHE_SIZE
+_sequencers: "OrderedDict[bytes, NonceSequencer]" = OrderedDict()
+
+_IV_LEN, _TAG_LEN = 12, 16
+
+# Nonce space per key: 8-byte random prefix + 32-bit counter.  Both ends of
+# a pair share the ECDH key, each with its own prefix; 64 random bits keep
+# their streams apart.
+NONCE_LIMIT = 2 ** 32
+REKEY_MARGIN = 2 ** 20          # needs_rekey turns True this many messages before the limit
+
+class NonceExhaustedError(RuntimeError):
+    """The key has used up its nonce space and must be replaced."""
+
+class NonceSequencer:
     """
-    Generates a unique 12-byte Initialization Vector (IV) for AES-GCM encryption.
-    
-    The IV consists of:
-    - 4 bytes from an incrementing counter to ensure uniqueness across sessions.
-    - 8 bytes of random data to add unpredictability.
-    
-    Returns:
-        bytes: A unique 12-byte IV.
+    Deterministic 12-byte GCM nonces for one key: a random 8-byte prefix
+    chosen once, followed by a 32-bit big-endian counter.
+
+    next() is lock-free (itertools.count advances atomically under the
+    GIL) and reads no randomness per message. needs_rekey turns True
+    REKEY_MARGIN messages before the counter would wrap; past the limit
+    next() raises NonceExhaustedError rather than reuse a nonce.
+    """
+
+    __slots__ = ("_prefix", "_count", "_used", "limit", "rekey_at")
+
+    def __init__(self, limit: int = NONCE_LIMIT, margin: int = REKEY_MARGIN):
+        self._prefix = os.urandom(8)
+        self._count = itertools.count()
+        self._used = 0
+        self.limit = limit
+        self.rekey_at = max(0, limit - margin)
+
+    def next(self) -> bytes:
+        n = next(self._count)
+        if n >= self.limit:
+            raise NonceExhaustedError("nonce space exhausted - rekey required")
+        self._used = n + 1
+        return self._prefix + n.to_bytes(4, 'big')
+
+    @property
+    def needs_rekey(self) -> bool:
+        return self._used >= self.rekey_at
+
+class AEADContext:
     """
-    global _iv_counter
-    with _iv_lock:
-        _iv_counter += 1
-        counter_bytes = _iv_counter.to_bytes(4, 'big')  # 4-byte counter in big-endian
-    random_bytes = os.urandom(8)  # 8 bytes of random data
-    return counter_bytes + random_bytes  # Total IV length: 12 bytes
+    AES-256-GCM bound to one key, so the key schedule is set up once
+    instead of on every message.
+
+    Blobs keep the original layout, IV (12) + tag (16) + ciphertext, and
+    both seal() and open() accept bytes, bytearray or memoryview.
+    """
+
+    __slots__ = ("_aead", "nonces")
+
+    def __init__(self, key: bytes, nonces: Optional[NonceSequencer] = None):
+        self._aead = AESGCM(key)
+        self.nonces = nonces or NonceSequencer()
+
+    @property
+    def needs_rekey(self) -> bool:
+        return self.nonces.needs_rekey
+
+    def seal(self, data, aad: Optional[bytes] = None) -> bytes:
+        iv = self.nonces.next()
+        out = self._aead.encrypt(iv, data, aad)          # ciphertext + tag
+        return b"".join((iv, out[-_TAG_LEN:], out[:-_TAG_LEN]))
+
+    def open(self, blob, aad: Optional[bytes] = None) -> bytes:
+        """Raises InvalidTag / ValueError on tampered or malformed input."""
+        if len(blob) < _IV_LEN + _TAG_LEN:
+            raise ValueError("encrypted blob too short to contain IV and Tag")
+        view = memoryview(blob)
+        ct_tag = b"".join((view[_IV_LEN + _TAG_LEN:], view[_IV_LEN:_IV_LEN + _TAG_LEN]))
+        return self._aead.decrypt(view[:_IV_LEN], ct_tag, aad)
+
+    def seal_many(self, items: Iterable) -> List[bytes]:
+        return [self.seal(d) for d in items]
+
+    def open_many(self, blobs: Iterable) -> List[Optional[bytes]]:
+        """Like open(), but a failed blob yields None instead of raising."""
+        out = []
+        for b in blobs:
+            try:
+                out.append(self.open(b))
+            except (InvalidTag, ValueError):
+                out.append(None)
+        return out
+
+def get_context(key: bytes) -> AEADContext:
+    """
+    Returns the cached AEADContext for `key`, creating it on first use.
+
+    The cache is a bounded LRU of _CONTEXT_CACHE_SIZE entries, so peers that
+    have gone away fall out on their own; a rebuilt context continues the
+    key's nonce sequence (see _sequencers).
+    """
+    key = bytes(key)
+    with _contexts_lock:
+        ctx = _contexts.get(key)
+        if ctx is not None:
+            _contexts.move_to_end(key)
+            return ctx
+    fp = _fingerprint(key)
+    with _contexts_lock:
+        nonces = _sequencers.get(fp)
+        if nonces is None:
+            nonces = _sequencers[fp] = NonceSequencer()
+            if len(_sequencers) > _SEQUENCER_CACHE_SIZE:
+                _sequencers.popitem(last=False)
+        else:
+            _sequencers.move_to_end(fp)
+    ctx = AEADContext(key, nonces)
+    with _contexts_lock:
+        _contexts[key] = ctx
+        if len(_contexts) > _CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+    return ctx
+
+def forget_key(key: bytes) -> None:
+    """Drop the cached context and nonce state of a key that was replaced."""
+    key = bytes(key)
+    with _contexts_lock:
+        _contexts.pop(key, None)
+        _sequencers.pop(_fingerprint(key), None)
+
+def _fingerprint(key: bytes) -> bytes:
+    return hashlib.sha256(key).digest()[:16]
+
+def needs_rekey(key: bytes) -> bool:
+    """True once `key` is close to running out of nonces (see NonceSequencer)."""
+    return get_context(key).needs_rekey
+
+def seal_many(key: bytes, items: Iterable) -> List[bytes]:
+    """Encrypts several byte payloads under one key; one blob per item."""
+    return get_context(key).seal_many(items)
+
+def open_many(key: bytes, blobs: Iterable) -> List[Optional[bytes]]:
+    """Decrypts several blobs under one key; None for any that fail."""
+    return get_context(key).open_many(blobs)
 
 def encrypt_message(key: bytes, plaintext: str) -> bytes:
     """
@@ -49,24 +185,7 @@ def encrypt_message(key: bytes, plaintext: str) -> bytes:
         Exception: If encryption fails for any reason.
     """
     try:
-        # Generate a unique IV for this encryption operation
-        iv = _get_unique_iv()
-        
-        # Initialize the AES-GCM cipher
-        encryptor = Cipher(
-            algorithms.AES(key),
-            modes.GCM(iv),
-            backend=default_backend()
-        ).encryptor()
-        
-        # Encrypt the plaintext
-        ciphertext = encryptor.update(plaintext.encode('utf-8')) + encryptor.finalize()
-        
-        # Concatenate IV, Tag, and Ciphertext for transmission/storage
-        encrypted_message = iv + encryptor.tag + ciphertext  # Total length: 12 + 16 + len(ciphertext)
-        
-        #logger.debug(f"Encryption successful. IV: {iv.hex()}, Tag: {encryptor.tag.hex()}, Ciphertext: {ciphertext.hex()}")
-        return encrypted_message
+        return get_context(key).seal(plaintext.encode('utf-8'))
     except Exception as e:
         logger.error(f"Encryption failed: {e}")
         raise
@@ -104,26 +223,8 @@ def decrypt_message(key: bytes, encrypted_message: bytes) -> str:
             logger.error("Encrypted message is too short to contain IV and Tag.")
             return None
 
-        # Extract IV (12 bytes), Tag (16 bytes), and Ciphertext
-        iv = encrypted_message[:12]
-        tag = encrypted_message[12:28]
-        ciphertext = encrypted_message[28:]              #      abcdefghijklmnopqrstuvwxyz1234
-
-        # Initialize the AES-GCM cipher for decryption with the extracted IV and Tag
-        decryptor = Cipher(
-            algorithms.AES(key),
-            modes.GCM(iv, tag),
-            backend=default_backend()
-        ).decryptor()
-
-        # Decrypt the ciphertext
-        decrypted_padded = decryptor.update(ciphertext) + decryptor.finalize()
-        
-        # Decode the decrypted bytes to a UTF-8 string
-        decrypted_message = decrypted_padded.decode('utf-8')
-        
-        
-        return decrypted_message
+        # IV (12 bytes), Tag (16 bytes) and Ciphertext are split inside open()
+        return get_context(key).open(encrypted_message).decode('utf-8')
     except InvalidTag:
         # The authentication tag does not match; the message has been tampered with or corrupted
         logger.error("Invalid authentication tag. Decryption failed.")
@@ -135,10 +236,55 @@ def decrypt_message(key: bytes, encrypted_message: bytes) -> str:
         return None
 
 
+def seal_envelope(peer_keys: Dict[str, bytes], plaintext: str) -> Tuple[bytes, Dict[str, bytes]]:
+    """
+    Encrypts one message for many recipients.
+
+    The plaintext is encrypted once under a fresh 32-byte content key, and
+    only that key is encrypted (wrapped) under each recipient's shared key.
+
+    Args:
+        peer_keys (Dict[str, bytes]): Recipient name -> 32-byte key from derive_shared_key.
+        plaintext (str): The message to be encrypted.
+
+    Returns:
+        Tuple[bytes, Dict[str, bytes]]: The shared body (IV + tag + ciphertext) and
+        a WRAPPED_KEY_LEN-byte wrapped content key per recipient.
+    """
+    try:
+        content_key = os.urandom(32)
+        body = AEADContext(content_key).seal(plaintext.encode('utf-8'))   # one-shot key: not cached
+        wrapped = {peer: get_context(key).seal(content_key) for peer, key in peer_keys.items()}
+        return body, wrapped
+    except Exception as e:
+        logger.error(f"Envelope encryption failed: {e}")
+        raise
+
+def open_envelope(key: bytes, wrapped_key: bytes, body: bytes) -> Optional[str]:
+    """
+    Unwraps the content key with our shared key, then decrypts the body.
+
+    Returns:
+        str or None: The plaintext, or None if either layer fails to authenticate.
+    """
+    try:
+        content_key = get_context(key).open(wrapped_key)
+        return AEADContext(content_key).open(body).decode('utf-8')
+    except InvalidTag:
+        logger.error("Invalid authentication tag. Envelope decryption failed.")
+        return None
+    except Exception as e:
+        logger.error(f"Envelope decryption failed: {e}")
+        return None
+
+
 """
 1. AES-GCM Encryption: Provides both confidentiality (hides the data) and integrity (ensures the data hasn’t been altered).
-2. Thread Safety: Ensures the IV is unique even when multiple threads are running.
+   One AEADContext per key (bounded LRU) avoids re-running the key schedule per message.
+2. Thread Safety: Ensures the IV is unique even when multiple threads are running
+   (per-key 64-bit random prefix + counter kept for the whole process, no global lock,
+   no randomness per message).
 3. Error Logging: Logs detailed errors for debugging if encryption or decryption fails.
 4. Secure Key Handling: Requires a 32-byte key, ensuring strong encryption.
 
-"""
\ No newline at end of file
+"""
@@ -1,22 +1,52 @@
 # security/key_management.py
 
+import hashlib
 import logging
-from cryptography.hazmat.primitives.asymmetric import ec
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives.asymmetric import ec, x25519
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
-from typing import Tuple
+from typing import Tuple, Union
 
 # Configure logger for this module
 logger = logging.getLogger('secure_chat.key_management')
 
+PublicKey = Union[ec.EllipticCurvePublicKey, x25519.X25519PublicKey]
+PrivateKey = Union[ec.EllipticCurvePrivateKey, x25519.X25519PrivateKey]
 
-def generate_ecdh_keypair() -> Tuple[ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey]:
+# Bounded caches so reconnect storms skip re-parsing and re-running ECDH
+_CACHE_SIZE = 1024
+_parsed_keys: "OrderedDict[bytes, PublicKey]" = OrderedDict()     # fingerprint -> key
+_shared_keys: "OrderedDict[tuple, bytes]" = OrderedDict()         # (own id, peer fp, salt, info) -> key
+_cache_lock = threading.Lock()
+
+
+def _cache_get(cache: OrderedDict, key):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _cache_put(cache: OrderedDict, key, value) -> None:
+    with _cache_lock:
+        cache[key] = value
+        if len(cache) > _CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def generate_ecdh_keypair(curve: str = "p256") -> Tuple[PrivateKey, PublicKey]:
     """
     Generates an Elliptic Curve Diffie-Hellman (ECDH) key pair using the SECP256R1 curve.
     
     ECDH is used for establishing a shared secret between two parties, which can then be used
     to derive symmetric keys for encryption and decryption.
+
+    Args:
+        curve (str): "p256" (default) or "x25519". Both peers must use the same curve.
     
     Returns:
         Tuple[ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey]: A tuple containing the
@@ -26,7 +56,10 @@ def generate_ecdh_keypair() -> Tuple[ec.EllipticCurvePrivateKey, ec.EllipticCurv
         Exception: If key pair generation fails for any reason.
     """
     try:
-        private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        if curve == "x25519":
+            private_key = x25519.X25519PrivateKey.generate()
+        else:
+            private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
         public_key = private_key.public_key()
         #print("Private Key:", private_key)
         #print("Public Key:", public_key)
@@ -37,8 +70,58 @@ def generate_ecdh_keypair() -> Tuple[ec.EllipticCurvePrivateKey, ec.EllipticCurv
         raise e
 
 
+def encode_public_key(public_key: PublicKey, compressed: bool = True) -> bytes:
+    """
+    Compact wire form of a public key for KEYPUB frames.
+
+    P-256 keys become a SEC1 point (33 bytes compressed, 65 uncompressed)
+    instead of a ~180-byte PEM. X25519 keys are their raw 32 bytes.
+    """
+    if isinstance(public_key, x25519.X25519PublicKey):
+        return public_key.public_bytes(serialization.Encoding.Raw,
+                                       serialization.PublicFormat.Raw)
+    fmt = (serialization.PublicFormat.CompressedPoint if compressed
+           else serialization.PublicFormat.UncompressedPoint)
+    return public_key.public_bytes(serialization.Encoding.X962, fmt)
+
+
+def public_key_pem(public_key: PublicKey) -> bytes:
+    """SubjectPublicKeyInfo PEM, the original KEYPUB encoding."""
+    return public_key.public_bytes(serialization.Encoding.PEM,
+                                   serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+def key_fingerprint(data: bytes) -> bytes:
+    """Short stable id for an encoded public key (cache key)."""
+    return hashlib.sha256(data).digest()[:16]
+
+
+def load_peer_public_key(data: bytes) -> PublicKey:
+    """
+    Parses a peer public key in any KEYPUB encoding: PEM, SEC1 point
+    (compressed or uncompressed, P-256) or raw X25519. Results are cached
+    by fingerprint.
+
+    Raises:
+        ValueError: If the data is not a supported public key.
+    """
+    data = bytes(data)
+    fp = key_fingerprint(data)
+    key = _cache_get(_parsed_keys, fp)
+    if key is not None:
+        return key
+    if data.startswith(b"-----BEGIN"):
+        key = serialization.load_pem_public_key(data, backend=default_backend())
+    elif len(data) == 32:
+        key = x25519.X25519PublicKey.from_public_bytes(data)
+    else:
+        key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), data)
+    _cache_put(_parsed_keys, fp, key)
+    return key
+
+
 def derive_shared_key(
-    private_key: ec.EllipticCurvePrivateKey,
+    private_key: PrivateKey,
     peer_public_key_bytes: bytes,
     salt: bytes,
     info: bytes
@@ -48,13 +131,13 @@ def derive_shared_key(
     the HMAC-based Extract-and-Expand Key Derivation Function (HKDF).
     
     This function performs the following steps:
-    1. Deserializes the peer's public key from PEM format.
+    1. Deserializes the peer's public key (PEM, SEC1 point or raw X25519 – cached).
     2. Exchanges keys using ECDH to obtain the shared secret.
     3. Derives a symmetric key from the shared secret using HKDF with the provided salt and info.
     
     Args:
         private_key (ec.EllipticCurvePrivateKey): The user's private ECDH key.
-        peer_public_key_bytes (bytes): The peer's public ECDH key in PEM format.
+        peer_public_key_bytes (bytes): The peer's public ECDH key (any load_peer_public_key encoding).
         salt (bytes): A non-secret random value used with HKDF to ensure uniqueness.
         info (bytes): Contextual information for key derivation.
     
@@ -65,14 +148,21 @@ def derive_shared_key(
         Exception: If shared key derivation fails due to invalid peer key or other issues.
     """
     try:
-        # Deserialize the peer's public key from PEM format
-        peer_public_key = serialization.load_pem_public_key(
-            peer_public_key_bytes,
-            backend=default_backend()
-        )
+        # Same own key + same peer key + same HKDF inputs → same result
+        own_id = key_fingerprint(encode_public_key(private_key.public_key()))
+        cache_key = (own_id, key_fingerprint(bytes(peer_public_key_bytes)), salt, info)
+        cached = _cache_get(_shared_keys, cache_key)
+        if cached is not None:
+            return cached
+
+        # Deserialize the peer's public key
+        peer_public_key = load_peer_public_key(peer_public_key_bytes)
 
         # Perform ECDH key exchange to obtain the shared secret
-        shared_secret = private_key.exchange(ec.ECDH(), peer_public_key)
+        if isinstance(private_key, x25519.X25519PrivateKey):
+            shared_secret = private_key.exchange(peer_public_key)
+        else:
+            shared_secret = private_key.exchange(ec.ECDH(), peer_public_key)
 
         # Derive the shared symmetric key using HKDF with SHA-256
         derived_key = HKDF(
@@ -83,6 +173,7 @@ def derive_shared_key(
             backend=default_backend()
         ).derive(shared_secret)
 
+        _cache_put(_shared_keys, cache_key, derived_key)
         logger.info("Shared key derived successfully")
         return derived_key
     except Exception as e:
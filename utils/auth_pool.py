@@ -0,0 +1,98 @@
+# utils/auth_pool.py
+"""
+Bounded executor for password verification (PBKDF2) on the Secure-Chat server.
+
+A login burst would otherwise run 100k-round PBKDF2 in every client
+thread at once and starve message routing.  All checks go through one
+pool instead:
+
+• `workers` checks run at a time – threads (hashlib drops the GIL while
+  hashing) or processes; the rest of the CPU is left to routing
+• at most `max_pending` checks queued or running; past that submit()
+  raises AuthBusy at once, carrying a retry-after estimate in seconds
+• per-stage latency in utils.metrics: auth.queue_wait, auth.verify
+  (and the auth.pending gauge)
+"""
+from __future__ import annotations
+import math, os, threading, time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils import metrics
+
+AUTH_WORKERS     = max(1, (os.cpu_count() or 2) // 2)
+AUTH_MAX_PENDING = 64
+AUTH_EXECUTORS   = ("thread", "process")
+
+
+class AuthBusy(Exception):
+    """The auth queue is full; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"auth queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn, *args):
+    """Runs in the worker; returns (result, started, finished) on the monotonic clock."""
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+
+class AuthPool:
+    """submit(fn, *args) → Future, or AuthBusy when saturated; thread-safe."""
+
+    def __init__(self, workers: int = AUTH_WORKERS, max_pending: int = AUTH_MAX_PENDING,
+                 kind: str = "thread"):
+        if kind not in AUTH_EXECUTORS:
+            raise ValueError(f"unknown auth executor {kind!r} (one of {AUTH_EXECUTORS})")
+        self.workers, self.max_pending, self.kind = workers, max_pending, kind
+        self._executor = (ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor)(workers)
+        self._pending = 0
+        self._avg_verify = 0.1                   # seconds, moving average
+        self._lock = threading.Lock()
+
+    def load(self) -> float:
+        """Fraction of the queue in use (0.0 … 1.0)."""
+        with self._lock:
+            return self._pending / self.max_pending
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has probably drained."""
+        with self._lock:
+            return max(1, math.ceil(self._pending / self.workers * self._avg_verify))
+
+    def submit(self, fn, *args) -> Future:
+        """Queue fn(*args) (picklable for kind="process"); raises AuthBusy when full."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                busy = True
+            else:
+                busy, self._pending = False, self._pending + 1
+                metrics.set_gauge("auth.pending", self._pending)
+        if busy:
+            metrics.incr("auth.rejected_busy")
+            raise AuthBusy(self.retry_after())
+        out: Future = Future()
+        submitted = time.monotonic()
+        inner = self._executor.submit(_timed_call, fn, *args)
+        inner.add_done_callback(lambda f: self._done(f, out, submitted))
+        return out
+
+    def _done(self, inner: Future, out: Future, submitted: float) -> None:
+        with self._lock:
+            self._pending -= 1
+            metrics.set_gauge("auth.pending", self._pending)
+        exc = inner.exception()
+        if exc is not None:
+            out.set_exception(exc)
+            return
+        result, started, finished = inner.result()
+        metrics.observe("auth.queue_wait", started - submitted)
+        metrics.observe("auth.verify", finished - started)
+        with self._lock:
+            self._avg_verify += 0.2 * (finished - started - self._avg_verify)
+        out.set_result(result)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
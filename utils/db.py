@@ -0,0 +1,103 @@
+# utils/db.py
+"""
+Shared SQLite access for the Secure-Chat user store.
+
+Every module that touches users.db goes through here instead of calling
+sqlite3.connect() per operation:
+
+• pooled connections (check_same_thread=False), handed out by
+  connection() and returned afterwards; at most POOL_IDLE kept open
+• WAL journal, synchronous=NORMAL, busy_timeout: readers never wait for
+  the writer and concurrent logins do not serialize on file locks
+• autocommit; multi-statement writes use transaction() (BEGIN IMMEDIATE)
+• prepared statements are reused through sqlite3's per-connection
+  statement cache, so callers keep their SQL as constant strings
+"""
+from __future__ import annotations
+import sqlite3, threading
+from contextlib import contextmanager
+from pathlib import Path
+
+DB_PATH = Path(__file__).resolve().parent / "users.db"
+
+POOL_IDLE        = 8                 # idle connections kept per database file
+BUSY_TIMEOUT_MS  = 5000
+STATEMENT_CACHE  = 128
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",     # durable at checkpoints; safe with WAL
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-4096",       # KiB
+)
+
+_pools: dict[str, list[sqlite3.Connection]] = {}
+_pool_lock = threading.Lock()
+
+
+def connect(path: str | Path | None = None) -> sqlite3.Connection:
+    """A dedicated (unpooled) connection with the same settings, owned by the caller."""
+    conn = sqlite3.connect(str(path or DB_PATH), isolation_level=None, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE,
+                           timeout=BUSY_TIMEOUT_MS / 1000)
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@contextmanager
+def connection(path: str | Path | None = None):
+    """A pooled autocommit connection to `path` (default DB_PATH)."""
+    key = str(path or DB_PATH)
+    with _pool_lock:
+        idle = _pools.setdefault(key, [])
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = connect(key)
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        with _pool_lock:
+            idle = _pools.setdefault(key, [])
+            if len(idle) < POOL_IDLE:
+                idle.append(conn);  conn = None
+        if conn is not None:
+            conn.close()
+
+
+@contextmanager
+def transaction(path: str | Path | None = None):
+    """BEGIN IMMEDIATE … COMMIT on a pooled connection (ROLLBACK on error)."""
+    with connection(path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.execute("COMMIT")
+
+
+def query_one(sql: str, params=(), path=None):
+    with connection(path) as conn:
+        return conn.execute(sql, params).fetchone()
+
+
+def query_all(sql: str, params=(), path=None) -> list:
+    with connection(path) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def execute(sql: str, params=(), path=None) -> int:
+    """Run one write statement; returns the number of rows changed."""
+    with connection(path) as conn:
+        return conn.execute(sql, params).rowcount
+
+
+def close_all() -> None:
+    """Close idle pooled connections (before the file is replaced, e.g. a restore)."""
+    with _pool_lock:
+        conns = [c for idle in _pools.values() for c in idle]
+        _pools.clear()
+    for conn in conns:
+        conn.close()
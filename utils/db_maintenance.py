@@ -14,30 +14,48 @@ Behaviour on server start:
         DB is corrupted or deleted	Latest backup is restored (if found).
         No backup exists	New DB is created and admin/admin is inserted.
         All admins are deleted	admin/admin is reinserted automatically.
+
+users.db runs in WAL mode (utils.db), so recent commits may live only in
+users.db-wal: backups go through SQLite's online-backup API rather than a
+file copy, and a restore drops the pooled connections and the stale
+-wal / -shm files before putting the backup in place.
 """
 
 import os, shutil, datetime, glob, sqlite3
-from utils.db_setup import DB_PATH, init_user_db, _hash_password
+from contextlib import closing
+from utils import db
+from utils.db_setup import init_user_db, _hash_password
 
 MAX_BACKUPS = 5  # maximum number of backups
-BACKUP_DIR = os.path.join(os.path.dirname(DB_PATH), "backup")
-os.makedirs(BACKUP_DIR, exist_ok=True)
+
+# db.DB_PATH is read on every call, never bound at import: whoever repoints
+# it (e.g. the benchmarks) gets backups and restores of the file in use
+def _backup_dir() -> str:
+    path = os.path.join(os.path.dirname(db.DB_PATH), "backup")
+    os.makedirs(path, exist_ok=True)
+    return path
 
 def _latest_backup() -> str | None:
-    files = sorted(glob.glob(os.path.join(BACKUP_DIR, "users_*.sqlite")))
+    files = sorted(glob.glob(os.path.join(_backup_dir(), "users_*.sqlite")))
     return files[-1] if files else None
 
 def _is_db_valid() -> bool:
-    if not os.path.exists(DB_PATH):
+    if not os.path.exists(db.DB_PATH):
         return False
     try:
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-        ok = cur.fetchone() is not None
-        conn.close(); return ok
+        return db.query_one("SELECT name FROM sqlite_master WHERE type='table' AND name='users'") is not None
     except Exception:
         return False
 
+def _restore(bk: str) -> None:
+    db.close_all()
+    for side in ("-wal", "-shm"):            # belong to the broken file, not to the backup
+        try:
+            os.remove(f"{db.DB_PATH}{side}")
+        except FileNotFoundError:
+            pass
+    shutil.copy2(bk, db.DB_PATH)
+
 def ensure_db_ready():
     # 1) try current db
     if _is_db_valid():
@@ -46,7 +64,8 @@ def ensure_db_ready():
         print("users.db missing or corrupted.")
         bk = _latest_backup()
         if bk:
-            shutil.copy2(bk, DB_PATH)
+            _restore(bk)
+            init_user_db()               # bring an older backup up to the current schema
             print(f" Restored latest backup → {bk}")
         else:
             print(" No backup found >> creating fresh DB with admin/admin.")
@@ -57,34 +76,32 @@ def ensure_db_ready():
     _ensure_bootstrap_exists()
 
 def _insert_bootstrap_account():
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute(
+    db.execute(
         "INSERT INTO users (username,password,role) VALUES (?,?,?)",
         ("admin", _hash_password("admin"), "admin"),
     )
-    conn.commit(); conn.close()
 
 def _ensure_bootstrap_exists():
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("SELECT 1 FROM users WHERE role='admin' LIMIT 1")
-    if not cur.fetchone():
+    if not db.query_one("SELECT 1 FROM users WHERE role='admin' LIMIT 1"):
         _insert_bootstrap_account()
         print(" Bootstrap admin/admin added (no admin found).")
-    conn.close()
 
 def backup_db() -> None:
     """
-    Copy users.db into utils/backup/ with a timestamped filename.
+    Copy users.db into utils/backup/ with a timestamped filename (online
+    backup, so commits still in the WAL are included).
     Afterward, prune old backups so only the newest MAX_BACKUPS remain.
     """
     # ── 1. create fresh backup 
     ts  = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    dst = os.path.join(BACKUP_DIR, f"users_{ts}.sqlite")
-    shutil.copy2(DB_PATH, dst)
+    backup_dir = _backup_dir()
+    dst = os.path.join(backup_dir, f"users_{ts}.sqlite")
+    with db.connection() as src, closing(sqlite3.connect(dst)) as out:
+        src.backup(out)
     print(f"Database backed up → {dst}")
 
     # ── 2. prune anything beyond MAX_BACKUPS 
-    backups = sorted(glob.glob(os.path.join(BACKUP_DIR, "users_*.sqlite")))         # glob.glob(...) returns a list of matching filenames
+    backups = sorted(glob.glob(os.path.join(backup_dir, "users_*.sqlite")))         # glob.glob(...) returns a list of matching filenames
     while len(backups) > MAX_BACKUPS:                                               # sorted(...) puts them in ascending order → oldest file is first.
         oldest = backups.pop(0)          # first element = oldest thanks to sort()
         try:
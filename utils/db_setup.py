@@ -7,17 +7,16 @@ SQLite-based user store for the Secure Chat App.
 • Automatically creates users.db on first run.
 • Stores salted / PBKDF2-HMAC-SHA-256 password hashes.
 • Provides `verify_credentials()` for the server.
+• Connections come from utils.db (pooled, WAL).
 """
-import sqlite3
 import os
 import hashlib
 import hmac
 import secrets
-from pathlib import Path
+
+from utils import db
 
 # ---------- Configuration ----------
-_DB_DIR   = Path(__file__).resolve().parent      # utils/
-DB_PATH   = _DB_DIR / "users.db"
 _ROUNDS   = 100_000                              # PBKDF2 iterations
 _SALT_LEN = 16                                   # bytes
 # -----------------------------------
@@ -43,10 +42,12 @@ def init_user_db() -> None:
     Create `users.db` and insert the three default users the first time
     the server starts.
     """
-    first_time = not DB_PATH.exists()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    first_time = not db.DB_PATH.exists()            # read per call: callers may repoint it
+    with db.transaction() as cur:
+        _create_schema(cur, first_time)
+
 
+def _create_schema(cur, first_time: bool) -> None:
     cur.execute(
         """CREATE TABLE IF NOT EXISTS users (
                id       INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,6 +69,20 @@ def init_user_db() -> None:
     )
 """)
 
+    # columns added after the first release: the 3-column table above wins on a
+    # fresh file, so role / USB columns come from here too; last_login /
+    # last_seen are bookkeeping written by utils.writebehind
+    have = {r[1] for r in cur.execute("PRAGMA table_info(users)")}
+    for col, decl in (("role", "TEXT NOT NULL DEFAULT 'user'"),
+                      ("usb_serial", "TEXT"),
+                      ("usb_hash", "TEXT"),
+                      ("usb_fail_count", "INTEGER DEFAULT 0"),
+                      ("usb_locked_until", "INTEGER DEFAULT 0"),
+                      ("last_login", "INTEGER DEFAULT 0"),
+                      ("last_seen", "INTEGER DEFAULT 0")):
+        if col not in have:
+            cur.execute(f"ALTER TABLE users ADD COLUMN {col} {decl}")
+
     if first_time:
         # Default passwords are `<username>123` – change them as you like
         initial_users = ["jamal", "ahmad", "mubarak"]
@@ -75,16 +90,9 @@ def init_user_db() -> None:
             "INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
             [(u, _hash_password(f"{u}123")) for u in initial_users],
         )
-        conn.commit()
-
-    conn.close()
 
 
 def verify_credentials(username: str, password: str) -> bool:
     """Return True if username/password are correct."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT password FROM users WHERE username=?", (username,))
-    row = cur.fetchone()
-    conn.close()
+    row = db.query_one("SELECT password FROM users WHERE username=?", (username,))
     return bool(row) and _verify_password(row[0], password) #_verify_password(row[0], password)  //  user exists and the password hash matches → returns True
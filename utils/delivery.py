@@ -0,0 +1,93 @@
+# utils/delivery.py
+"""
+Sequence numbers, duplicate detection and resend for private messages.
+
+Each sender numbers its CIPH frames with a rising seq (utils.wire:
+OP_SCIPH, v1 "CIPH <from> <to> <seq> <b64>").  The server acknowledges
+them cumulatively – "ACK <seq>" / OP_ACK means every sequenced frame of
+this connection up to seq was routed, queued or dropped as a duplicate –
+at most once per batch of messages or per delay, never per message.
+
+• first_seq(): senders start from the clock (ms << 10), so a restarted
+  client keeps numbering above everything it sent before without
+  storing anything
+• RetransmitBuffer: the sender's unacknowledged frames, oldest first;
+  ack() forgets everything up to a seq, the rest is replayed after a
+  reconnect
+• SeqWindow: a receiver's (and the server's) view of one sender – the
+  highest seq seen plus a `bits`-wide bitmap of the ones just below it;
+  accept() is False for a repeat and for anything older than the window.
+  The clock seeding means another device, or a clock stepped back, can
+  number below a window, so windows are per sending session: the server
+  starts a new one at every full login (a resume keeps it) and a
+  receiver whenever the sender's public key changes
+"""
+from __future__ import annotations
+import threading, time
+from collections import OrderedDict
+
+WINDOW_BITS  = 1024
+MAX_UNACKED  = 4096                 # resend buffer; the oldest is given up beyond this
+
+
+def first_seq() -> int:
+    return int(time.time() * 1000) << 10
+
+
+class SeqWindow:
+    """accept(seq) → True the first time a seq is seen (sliding bitmap)."""
+
+    __slots__ = ("top", "bits", "size")
+
+    def __init__(self, size: int = WINDOW_BITS):
+        self.top, self.bits, self.size = 0, 0, size
+
+    def accept(self, seq: int) -> bool:
+        if seq > self.top:
+            shift = seq - self.top
+            self.bits = ((self.bits << shift) | 1) & ((1 << self.size) - 1) if shift < self.size else 1
+            self.top = seq
+            return True
+        back = self.top - seq
+        if back >= self.size or self.bits >> back & 1:
+            return False
+        self.bits |= 1 << back
+        return True
+
+
+class RetransmitBuffer:
+    """add(seq, item) / ack(seq) / pending(); thread-safe."""
+
+    def __init__(self, limit: int = MAX_UNACKED):
+        self.limit = limit
+        self._items: OrderedDict[int, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, seq: int, item) -> bool:
+        """Keep `item` until acknowledged; False if the oldest had to be given up."""
+        with self._lock:
+            self._items[seq] = item
+            if len(self._items) <= self.limit:
+                return True
+            self._items.popitem(last=False)
+            return False
+
+    def ack(self, seq: int) -> int:
+        """Everything up to `seq` arrived; returns how many were dropped."""
+        n = 0
+        with self._lock:
+            while self._items:
+                first = next(iter(self._items))
+                if first > seq:
+                    break
+                del self._items[first]
+                n += 1
+        return n
+
+    def pending(self) -> list[tuple[int, object]]:
+        """(seq, item) for each unacknowledged frame, oldest first."""
+        with self._lock:
+            return list(self._items.items())
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,101 @@
+# utils/framing.py
+"""
+Length-prefixed framing for the Secure-Chat wire protocol.
+
+Every frame on the wire is a 4-byte big-endian length followed by that
+many payload bytes.  encode_frame() builds that once per outgoing frame
+and write_frames() coalesces several into one write.  FrameReader pulls large chunks with recv_into() into
+one reusable bytearray and slices as many complete frames out of it as it
+holds, so a burst of small frames costs one SSL read instead of two per
+frame and no per-frame allocations.
+"""
+from __future__ import annotations
+import socket
+
+_HDR = 4
+_DEFAULT_BUF = 16 * 1024 + _HDR            # one full TLS record plus a header
+
+
+class FrameReader:
+    """
+    Per-connection buffered frame decoder.
+
+    read_frame() returns a memoryview into the internal buffer; it is only
+    valid until the next read_frame()/read_bytes() call.  Callers that
+    need to keep a frame around must copy it (bytes(frame)).
+    """
+
+    def __init__(self, sock: socket.socket, max_len: int,
+                 bufsize: int = _DEFAULT_BUF):
+        self._sock = sock
+        self._max_len = max_len
+        self._bufsize = max(bufsize, _HDR)
+        self._buf = bytearray(self._bufsize)
+        self._view = memoryview(self._buf)
+        self._start = 0                        # first unparsed byte
+        self._end = 0                          # end of received data
+
+    def read_frame(self) -> memoryview | None:
+        """Next frame payload, or None on EOF / invalid length."""
+        while True:
+            avail = self._end - self._start
+            if avail >= _HDR:
+                length = int.from_bytes(self._view[self._start:self._start + _HDR], "big")
+                if length <= 0 or length > self._max_len:
+                    return None
+                if avail >= _HDR + length:
+                    begin = self._start + _HDR
+                    self._start = begin + length
+                    return self._view[begin:self._start]
+                need = _HDR + length
+            else:
+                need = _HDR
+            if not self._fill(need):
+                return None
+
+    def read_bytes(self) -> bytes:
+        """read_frame() as an owned bytes object (b"" on EOF / error)."""
+        frame = self.read_frame()
+        return bytes(frame) if frame is not None else b""
+
+    def _fill(self, need: int) -> bool:
+        """Make room for `need` bytes from _start, then recv_into once."""
+        if self._start + need > len(self._buf):
+            pending = self._end - self._start
+            if need > len(self._buf):
+                # oversize frame: fresh buffer (views handed out still
+                # reference the old one, so it cannot be resized in place)
+                buf = bytearray(need)
+                buf[:pending] = self._view[self._start:self._end]
+                self._buf, self._view = buf, memoryview(buf)
+            else:
+                self._buf[:pending] = self._buf[self._start:self._end]
+            self._start, self._end = 0, pending
+        elif self._start == self._end:
+            self._start = self._end = 0         # empty – rewind for free
+            if len(self._buf) > self._bufsize:  # drop an oversize buffer
+                self._buf = bytearray(self._bufsize)
+                self._view = memoryview(self._buf)
+
+        n = self._sock.recv_into(self._view[self._end:])
+        if not n:
+            return False
+        self._end += n
+        return True
+
+
+# ── encoding ─────────────────────────────────────────────────────────
+def encode_frame(payload) -> bytes:
+    """
+    Wire form (length header + payload) of one frame.  Build it once and
+    hand the same object to every recipient of a fan-out.
+    """
+    return len(payload).to_bytes(_HDR, "big") + payload
+
+
+def write_frames(sock: socket.socket, wires: list[bytes]) -> None:
+    """
+    Send several encoded frames with a single write so small frames share
+    TLS records (SSLSocket has no sendmsg/writev, so this joins once).
+    """
+    sock.sendall(wires[0] if len(wires) == 1 else b"".join(wires))
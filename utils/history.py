@@ -0,0 +1,406 @@
+# utils/history.py
+"""
+Server-side scrollback of relayed ciphertext, per conversation.
+
+The server never sees plaintext, so history is the relayed blobs as they
+were: a private message (CIPH) is kept once for the pair of users, a
+broadcast (BCAST, or an ENV envelope with all its wrapped keys) in the
+shared room.  Per conversation a directory of segments, each three files
+side by side (column layout):
+
+• <seq>.ts   – one 8-byte timestamp (unix ms) per record; strictly
+  rising inside a conversation, so a timestamp also names one record
+• <seq>.off  – one 4-byte position per record in the data file
+• <seq>.dat  – the records, already in the form a HISTORY reply carries:
+      u32 length | u64 unix ms | u8 kind | u8 len | sender | payload
+  kind C = private blob, B = broadcast blob, E = envelope (see
+  envelope_payload()); length covers everything after itself
+
+A segment is closed at `segment_bytes`.  The first / last timestamp of
+every segment stay in memory (the sparse index), so a page query picks
+its segment without touching the others, then binary-searches the
+memory-mapped .ts column and returns ONE slice of the memory-mapped data
+file – records are never parsed on the server.  Paging back through 10k
+messages is a handful of such slices, not a scan.
+
+Appends go to the page cache; sync() fsyncs what was written since the
+last call (the server calls it once a second).  expire() drops segments
+older than `ttl`; a conversation keeps at most `max_segments`.
+"""
+from __future__ import annotations
+import mmap, os, struct, threading, time
+from collections import OrderedDict
+
+from utils.wire import get_varint, put_varint
+
+SEGMENT_BYTES = 4 * 1024 * 1024
+MAX_SEGMENTS  = 32                  # per conversation (≈ 128 MiB)
+TTL_SECS      = 30 * 24 * 3600
+PAGE_BYTES    = 60 * 1024           # one reply frame must fit the client's 64 KiB limit
+MAX_OPEN      = 256                 # conversations kept open (mapped) at once
+
+KIND_CIPHER, KIND_BCAST, KIND_ENV = b"C", b"B", b"E"
+ROOM = "Everyone"                   # peer name that addresses the shared room
+
+_REC = struct.Struct(">IQcB")       # length, unix ms, kind, sender length
+_TS  = struct.Struct(">Q")
+_OFF = struct.Struct(">I")
+
+
+def conversation(user: str, peer: str) -> str:
+    """Key of the conversation `user` has with `peer` (ROOM = the broadcast room)."""
+    if peer == ROOM:
+        return "*"
+    a, b = sorted((user, peer))
+    return f"{a}\n{b}"
+
+
+def envelope_payload(wraps, body) -> bytes:
+    """KIND_ENV payload: varint n | (varint len | name | varint len | wrapped key) * n | body."""
+    out = bytearray(put_varint(len(wraps)))
+    for name, wrapped in wraps:
+        raw = name.encode()
+        out += put_varint(len(raw)) + raw + put_varint(len(wrapped)) + bytes(wrapped)
+    return bytes(out + body)
+
+
+def parse_envelope_payload(payload) -> tuple[list[tuple[str, bytes]], bytes]:
+    n, p = get_varint(payload, 0)
+    wraps = []
+    for _ in range(n):
+        ln, p = get_varint(payload, p)
+        name = bytes(payload[p:p + ln]).decode(); p += ln
+        ln, p = get_varint(payload, p)
+        wraps.append((name, bytes(payload[p:p + ln]))); p += ln
+    return wraps, bytes(payload[p:])
+
+
+def iter_records(buf):
+    """(unix_ms, kind, sender, payload) for each record of a HISTORY reply body, oldest first."""
+    view, p = memoryview(buf), 0
+    while p + _REC.size <= len(view):
+        length, ts, kind, slen = _REC.unpack_from(view, p)
+        a = p + _REC.size
+        end = p + 4 + length
+        if end > len(view):
+            raise ValueError("truncated history record")
+        yield ts, kind, bytes(view[a:a + slen]).decode(), bytes(view[a + slen:end])
+        p = end
+
+
+def _read_at(fd: int, n: int, pos: int) -> bytes:
+    os.lseek(fd, pos, os.SEEK_SET)                  # (no os.pread on Windows)
+    return os.read(fd, n)
+
+
+def _map(path: str, length: int) -> mmap.mmap:
+    with open(path, "rb") as fh:                    # the mapping outlives the handle
+        return mmap.mmap(fh.fileno(), length, access=mmap.ACCESS_READ)
+
+
+class _Segment:
+    __slots__ = ("seq", "base", "count", "size", "first_ts", "last_ts",
+                 "_fds", "_maps", "_mapped_count")
+
+    def __init__(self, cdir: str, seq: int):
+        self.seq = seq
+        self.base = os.path.join(cdir, f"{seq:08d}")
+        self.count = self.size = self.first_ts = self.last_ts = 0
+        self._fds = None                # (dat, off, ts) while this is the segment appended to
+        self._maps = None               # (ts, off, dat) views covering _mapped_count records
+        self._mapped_count = 0
+
+    def _path(self, ext: str) -> str:
+        return f"{self.base}.{ext}"
+
+    def load(self) -> "_Segment":
+        """Sparse-index entry of a closed segment: count and first / last timestamp."""
+        n = os.path.getsize(self._path("ts")) // _TS.size
+        self.size = os.path.getsize(self._path("dat"))
+        if n:
+            with open(self._path("ts"), "rb") as fh:
+                self.first_ts = _TS.unpack(fh.read(_TS.size))[0]
+                fh.seek((n - 1) * _TS.size)
+                self.last_ts = _TS.unpack(fh.read(_TS.size))[0]
+        self.count = n
+        return self
+
+    def open(self) -> "_Segment":
+        """Open for appending; cut the columns back to the last whole record."""
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        fds = tuple(os.open(self._path(ext), flags, 0o600) for ext in ("dat", "off", "ts"))
+        dat, off, ts = fds
+        size = os.fstat(dat).st_size
+        count = min(os.fstat(off).st_size // _OFF.size, os.fstat(ts).st_size // _TS.size)
+        end = 0
+        while count:
+            pos = _OFF.unpack(_read_at(off, _OFF.size, (count - 1) * _OFF.size))[0]
+            if pos + 4 <= size:
+                end = pos + 4 + _OFF.unpack(_read_at(dat, 4, pos))[0]
+                if end <= size:
+                    break
+            count -= 1
+        else:
+            end = 0
+        for fd, length in ((dat, end), (off, count * _OFF.size), (ts, count * _TS.size)):
+            if os.fstat(fd).st_size != length:
+                os.ftruncate(fd, length)
+            os.lseek(fd, length, os.SEEK_SET)
+        self._fds, self.size, self.count = fds, end, count
+        if count:
+            self.first_ts = _TS.unpack(_read_at(ts, _TS.size, 0))[0]
+            self.last_ts = _TS.unpack(_read_at(ts, _TS.size, (count - 1) * _TS.size))[0]
+        return self
+
+    def append(self, rec: bytes, ts: int) -> None:
+        dat, off, tsf = self._fds
+        os.write(dat, rec)                          # columns last: a torn append is cut at open
+        os.write(off, _OFF.pack(self.size))
+        os.write(tsf, _TS.pack(ts))
+        if not self.count:
+            self.first_ts = ts
+        self.last_ts = ts
+        self.size += len(rec)
+        self.count += 1
+
+    def views(self) -> tuple[mmap.mmap, mmap.mmap, mmap.mmap]:
+        """(ts, off, dat) mapped up to the current record count."""
+        if self._maps is None or self._mapped_count < self.count:
+            self._unmap()
+            self._maps = (_map(self._path("ts"), self.count * _TS.size),
+                          _map(self._path("off"), self.count * _OFF.size),
+                          _map(self._path("dat"), self.size))
+            self._mapped_count = self.count
+        return self._maps
+
+    def seal(self) -> None:
+        """No more appends: keep the views, drop the file handles."""
+        if self._fds is not None:
+            for fd in self._fds:
+                os.close(fd)
+            self._fds = None
+
+    def sync(self) -> None:
+        if self._fds is not None:
+            for fd in self._fds:
+                os.fsync(fd)
+
+    def _unmap(self) -> None:
+        if self._maps is not None:
+            for m in self._maps:
+                m.close()
+            self._maps, self._mapped_count = None, 0
+
+    def close(self) -> None:
+        self._unmap()
+        self.seal()
+
+    def remove(self) -> None:
+        self.close()
+        for ext in ("dat", "off", "ts"):
+            try:
+                os.remove(self._path(ext))
+            except FileNotFoundError:
+                pass
+
+
+def _first_at_or_after(ts_map, count: int, ts: int) -> int:
+    """Binary search in a mapped .ts column."""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _TS.unpack_from(ts_map, mid * _TS.size)[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class _Conversation:
+    """One conversation's segments (use under .lock)."""
+
+    def __init__(self, cdir: str):
+        self.dir = cdir
+        self.lock = threading.Lock()
+        self.live = True                # False once evicted from HistoryStore._open
+        seqs = sorted(int(n[:-3]) for n in os.listdir(cdir)
+                      if n.endswith(".ts") and n[:-3].isdigit()) if os.path.isdir(cdir) else []
+        self.segments = [_Segment(cdir, s).load() for s in seqs[:-1]]
+        if seqs:
+            self.segments.append(_Segment(cdir, seqs[-1]).open())
+
+    @property
+    def last_ts(self) -> int:
+        return self.segments[-1].last_ts if self.segments else 0
+
+    def active(self, segment_bytes: int, max_segments: int) -> _Segment:
+        seg = self.segments[-1] if self.segments else None
+        if seg is not None and (not seg.count or seg.size < segment_bytes):
+            return seg
+        os.makedirs(self.dir, exist_ok=True)
+        if seg is not None:
+            seg.seal()
+        new = _Segment(self.dir, seg.seq + 1 if seg else 0).open()
+        self.segments.append(new)
+        while len(self.segments) > max_segments:
+            self.segments.pop(0).remove()
+        return new
+
+    def close(self) -> None:
+        for seg in self.segments:
+            seg.close()
+        self.segments = []
+        self.live = False
+
+
+class HistoryStore:
+    """append() / page() / sync() / expire(); thread-safe."""
+
+    def __init__(self, root: str, segment_bytes: int = SEGMENT_BYTES,
+                 max_segments: int = MAX_SEGMENTS, ttl: float = TTL_SECS,
+                 page_bytes: int = PAGE_BYTES, max_open: int = MAX_OPEN):
+        self.root, self.segment_bytes, self.max_segments = root, segment_bytes, max_segments
+        self.ttl, self.page_bytes, self.max_open = ttl, page_bytes, max_open
+        self._open: OrderedDict[str, _Conversation] = OrderedDict()    # LRU
+        self._dirty: set[_Segment] = set()
+        self._lock = threading.Lock()
+
+    def _dir(self, conv: str) -> str:
+        return os.path.join(self.root, conv.encode().hex())     # any name → safe file name
+
+    def _locked(self, conv: str, create: bool) -> _Conversation | None:
+        """The conversation with its lock held (caller releases), or None."""
+        while True:
+            evicted = []
+            with self._lock:
+                c = self._open.get(conv)
+                if c is None:
+                    if not create and not os.path.isdir(self._dir(conv)):
+                        return None
+                    c = self._open[conv] = _Conversation(self._dir(conv))
+                    while len(self._open) > self.max_open:
+                        evicted.append(self._open.popitem(last=False)[1])
+                else:
+                    self._open.move_to_end(conv)
+            for old in evicted:
+                with old.lock:
+                    self._dirty.difference_update(old.segments)
+                    for seg in old.segments:
+                        seg.sync()
+                    old.close()
+            c.lock.acquire()
+            if c.live:
+                return c
+            c.lock.release()            # evicted meanwhile – look again
+
+    # ── writer ─────────────────────────────────────────────────────
+    def append(self, conv: str, sender: str, kind: bytes, payload) -> int:
+        """Keep one relayed message; returns its timestamp (0 if too big to page)."""
+        name = sender.encode()
+        size = _REC.size + len(name) + len(payload)
+        if size > self.page_bytes:
+            return 0
+        c = self._locked(conv, True)
+        try:
+            ts = max(int(time.time() * 1000), c.last_ts + 1)
+            seg = c.active(self.segment_bytes, self.max_segments)
+            seg.append(_REC.pack(size - 4, ts, kind, len(name)) + name + bytes(payload), ts)
+        finally:
+            c.lock.release()
+        with self._lock:
+            self._dirty.add(seg)
+        return ts
+
+    def sync(self) -> int:
+        """fsync every segment appended to since the last call; returns how many."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for seg in dirty:
+            try:
+                seg.sync()
+            except OSError:                         # sealed / removed meanwhile
+                pass
+        return len(dirty)
+
+    # ── reader ─────────────────────────────────────────────────────
+    def page(self, conv: str, before_ts: int, limit: int) -> tuple[int, int, bytes]:
+        """
+        Up to `limit` records older than `before_ts` (unix ms), at most
+        `page_bytes` in all, as (count, oldest ts, records oldest first).
+        Pass the oldest ts back as `before_ts` for the page before.
+        """
+        c = self._locked(conv, False)
+        if c is None:
+            return 0, 0, b""
+        try:
+            chunks, count, oldest = [], 0, 0
+            budget = self.page_bytes
+            for seg in reversed(c.segments):
+                if limit <= 0:
+                    break
+                if not seg.count or seg.first_ts >= before_ts:
+                    continue                        # all of it is newer
+                ts_map, off_map, dat_map = seg.views()
+                n = seg.count
+                k = n if seg.last_ts < before_ts else _first_at_or_after(ts_map, n, before_ts)
+                end = seg.size if k == n else _OFF.unpack_from(off_map, k * _OFF.size)[0]
+                j = max(0, k - limit)
+                if end - _OFF.unpack_from(off_map, j * _OFF.size)[0] > budget:
+                    lo, hi = j, k                   # first record that still fits
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        if end - _OFF.unpack_from(off_map, mid * _OFF.size)[0] > budget:
+                            lo = mid + 1
+                        else:
+                            hi = mid
+                    j, limit = lo, 0                # page full
+                if j == k:
+                    break
+                start = _OFF.unpack_from(off_map, j * _OFF.size)[0]
+                chunks.append(dat_map[start:end])
+                count += k - j
+                limit -= k - j
+                budget -= end - start
+                oldest = _TS.unpack_from(ts_map, j * _TS.size)[0]
+                if j > 0:
+                    break
+            chunks.reverse()
+            return count, oldest, b"".join(chunks)
+        finally:
+            c.lock.release()
+
+    # ── housekeeping ───────────────────────────────────────────────
+    def expire(self) -> int:
+        """Drop segments older than `ttl`; returns how many."""
+        cutoff, dropped = int((time.time() - self.ttl) * 1000), 0
+        try:
+            names = [n for n in os.listdir(self.root) if not n.startswith(".")]
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            try:
+                conv = bytes.fromhex(name).decode()
+            except ValueError:
+                continue
+            c = self._locked(conv, False)
+            if c is None:
+                continue
+            try:
+                # the segment written to stays until it is closed
+                while len(c.segments) > 1 and c.segments[0].last_ts < cutoff:
+                    seg = c.segments.pop(0)
+                    with self._lock:
+                        self._dirty.discard(seg)
+                    seg.remove()
+                    dropped += 1
+            finally:
+                c.lock.release()
+        return dropped
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            convs, self._open = list(self._open.values()), OrderedDict()
+        for c in convs:
+            with c.lock:
+                c.close()
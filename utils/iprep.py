@@ -0,0 +1,178 @@
+# utils/iprep.py
+"""
+IP reputation for the Secure-Chat server, checked right after accept() –
+a refused peer never gets a TLS handshake.
+
+• rules file, one entry per line ("#" starts a comment):
+      deny  203.0.113.0/24
+      allow 203.0.113.7          (bare address = /32 or /128)
+      198.51.100.0/22            (no verb = deny)
+  the longest matching prefix decides; allow entries also exempt an
+  address from temporary blocks
+• rules live in a path-compressed binary trie (one per address family):
+  a lookup walks at most one node per prefix bit, so its cost depends on
+  the prefix length, not on how many prefixes are loaded
+• reload_if_changed() re-reads the file when its mtime changes and swaps
+  the tries in one assignment, so lookups never see a half-built trie
+• block(ip, secs): temporary entries fed by the login / USB lock-outs,
+  bounded (oldest dropped first) and expired by sweep()
+"""
+from __future__ import annotations
+import os, socket, threading, time
+from collections import OrderedDict
+
+MAX_TEMP_BLOCKS = 100_000
+
+
+class _Node:
+    __slots__ = ("key", "plen", "value", "kids")
+
+    def __init__(self, key: int, plen: int, value=None):
+        self.key, self.plen, self.value = key, plen, value
+        self.kids = [None, None]
+
+
+class CidrTrie:
+    """Longest-prefix match over `width`-bit addresses (32 or 128)."""
+
+    def __init__(self, width: int):
+        self.width = width
+        self.root = _Node(0, 0)
+        self.size = 0
+
+    def _bit(self, key: int, pos: int) -> int:
+        return (key >> (self.width - 1 - pos)) & 1
+
+    def _mask(self, key: int, plen: int) -> int:
+        return key >> (self.width - plen) << (self.width - plen) if plen else 0
+
+    def insert(self, key: int, plen: int, value) -> None:
+        key, node = self._mask(key, plen), self.root
+        while True:
+            if node.plen == plen:
+                self.size += node.value is None
+                node.value = value
+                return
+            b = self._bit(key, node.plen)
+            child = node.kids[b]
+            if child is None:
+                node.kids[b] = _Node(key, plen, value)
+                self.size += 1
+                return
+            limit = min(child.plen, plen)
+            diff = (child.key ^ key) >> (self.width - limit)
+            common = limit - diff.bit_length()
+            if common == child.plen:
+                node = child
+                continue
+            mid = _Node(self._mask(key, common), common)        # split the edge
+            node.kids[b] = mid
+            mid.kids[self._bit(child.key, common)] = child
+            if common == plen:
+                mid.value = value
+            else:
+                mid.kids[self._bit(key, common)] = _Node(key, plen, value)
+            self.size += 1
+            return
+
+    def lookup(self, addr: int):
+        """Value of the longest prefix containing `addr`, or None."""
+        node, best, width = self.root, self.root.value, self.width
+        while node.plen < width:
+            node = node.kids[(addr >> (width - 1 - node.plen)) & 1]
+            if node is None or (addr ^ node.key) >> (width - node.plen):
+                break
+            if node.value is not None:
+                best = node.value
+        return best
+
+
+def _parse(ip: str) -> tuple[int, int]:
+    """(family width, address as int) for a dotted-quad or IPv6 string."""
+    if ":" in ip:
+        return 128, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    return 32, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+
+
+def load_rules(path: str) -> dict[int, CidrTrie]:
+    """Rules file → {32: trie, 128: trie} with True = allow, False = deny."""
+    tries = {32: CidrTrie(32), 128: CidrTrie(128)}
+    with open(path, encoding="utf-8") as fh:
+        for lineno, line in enumerate(fh, 1):
+            words = line.split("#", 1)[0].split()
+            if not words:
+                continue
+            verb, cidr = (words[0].lower(), words[1]) if len(words) > 1 else ("deny", words[0])
+            if verb not in ("allow", "deny"):
+                raise ValueError(f"{path}:{lineno}: expected 'allow' or 'deny', got {verb!r}")
+            addr, _, plen = cidr.partition("/")
+            try:
+                width, key = _parse(addr)
+            except OSError:
+                raise ValueError(f"{path}:{lineno}: bad address {addr!r}") from None
+            plen = int(plen) if plen.isdigit() else width if not plen else -1
+            if not 0 <= plen <= width:
+                raise ValueError(f"{path}:{lineno}: bad prefix length in {cidr!r}")
+            tries[width].insert(key, plen, verb == "allow")
+    return tries
+
+
+class IPReputation:
+    """allowed(ip) / block(ip, secs) / reload_if_changed() / sweep(); thread-safe."""
+
+    def __init__(self, path: str | None = None, max_temp: int = MAX_TEMP_BLOCKS):
+        self.path, self.max_temp = path, max_temp
+        self._tries: dict[int, CidrTrie] = {32: CidrTrie(32), 128: CidrTrie(128)}
+        self._mtime = None
+        self._temp: OrderedDict[str, float] = OrderedDict()     # ip -> blocked until
+        self._lock = threading.Lock()
+        self.reload_if_changed()
+
+    def rule_count(self) -> int:
+        return sum(t.size for t in self._tries.values())
+
+    def reload_if_changed(self) -> bool:
+        """
+        Re-read the rules file if it changed; True when new rules are in force.
+        A malformed file raises ValueError and the previous rules stay.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime if self.path else None
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime                  # a broken file is reported once, not every poll
+        self._tries = load_rules(self.path) if mtime is not None else \
+            {32: CidrTrie(32), 128: CidrTrie(128)}
+        return True
+
+    def allowed(self, ip: str) -> bool:
+        """False if `ip` is denied by a rule or temporarily blocked."""
+        try:
+            width, addr = _parse(ip)
+        except OSError:
+            return True
+        verdict = self._tries[width].lookup(addr)
+        if verdict is not None:
+            return verdict
+        with self._lock:
+            until = self._temp.get(ip)
+        return until is None or until <= time.monotonic()
+
+    def block(self, ip: str, secs: float) -> None:
+        """Refuse `ip` at accept() for `secs` seconds (unless an allow rule covers it)."""
+        with self._lock:
+            self._temp.pop(ip, None)
+            self._temp[ip] = time.monotonic() + secs
+            while len(self._temp) > self.max_temp:
+                self._temp.popitem(last=False)
+
+    def sweep(self) -> int:
+        """Drop expired temporary blocks; returns how many."""
+        now = time.monotonic()
+        with self._lock:
+            dead = [ip for ip, until in self._temp.items() if until <= now]
+            for ip in dead:
+                del self._temp[ip]
+        return len(dead)
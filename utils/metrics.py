@@ -0,0 +1,77 @@
+# utils/metrics.py
+"""
+In-process counters for the Secure-Chat server.
+
+• incr(name)           – monotonically increasing counter
+• observe(name, secs)  – latency sample → count / avg / p50 / p99 / max
+• set_gauge(name, v)   – last-value gauge (queue depths, in-flight work …)
+• clear_gauge(name)    – forget a gauge (client went away)
+• snapshot()           – plain dict, safe to log or show in a GUI
+• start_reporter()     – daemon thread that logs a snapshot periodically
+"""
+from __future__ import annotations
+import threading, time
+from collections import deque
+
+_SAMPLES = 1024                                   # recent samples kept per latency
+
+_lock     = threading.Lock()
+_counters: dict[str, int] = {}
+_gauges:   dict[str, float] = {}
+_latency:  dict[str, list] = {}                   # name -> [count, total, max, deque]
+
+
+def incr(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def clear_gauge(name: str) -> None:
+    with _lock:
+        _gauges.pop(name, None)
+
+
+def observe(name: str, secs: float) -> None:
+    with _lock:
+        st = _latency.get(name)
+        if st is None:
+            st = _latency[name] = [0, 0.0, 0.0, deque(maxlen=_SAMPLES)]
+        st[0] += 1
+        st[1] += secs
+        st[2] = max(st[2], secs)
+        st[3].append(secs)
+
+
+def _summary(count: int, total: float, peak: float, recent) -> dict:
+    ordered = sorted(recent)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+    return {"count": count, "avg_ms": 1000 * total / count if count else 0.0,
+            "p50_ms": 1000 * pick(0.50), "p99_ms": 1000 * pick(0.99),
+            "max_ms": 1000 * peak}
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        gauges   = dict(_gauges)
+        latency  = {k: (c, t, m, list(d)) for k, (c, t, m, d) in _latency.items()}
+    return {"counters": counters, "gauges": gauges,
+            "latency": {k: _summary(*v) for k, v in latency.items()}}
+
+
+def start_reporter(logger, interval: float = 60.0) -> threading.Thread:
+    """Log snapshot() every `interval` seconds (no-op while nothing recorded)."""
+    def _run():
+        while True:
+            time.sleep(interval)
+            snap = snapshot()
+            if any(snap.values()):
+                logger.info("metrics %s", snap)
+    t = threading.Thread(target=_run, daemon=True, name="metrics")
+    t.start()
+    return t
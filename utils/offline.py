@@ -0,0 +1,355 @@
+# utils/offline.py
+"""
+Store-and-forward queue for private messages to users who are offline.
+
+The server only ever holds ciphertext, so a record is an opaque blob plus
+the sender's name, a timestamp and the sender's sequence number (0 when
+the frame had none; utils.delivery).  Per recipient:
+
+• a directory of append-only segments, <base>.log, named by the stream
+  offset of their first byte; a segment is closed at `segment_bytes`
+• beside each log a compact index, <base>.idx: one 4-byte record
+  position per record, memory-mapped – it gives record counts without
+  reading the log and lets a torn tail be cut off on start-up
+• a cursor file with the acknowledged stream offset; ack() moves it and
+  deletes every segment that lies wholly behind it
+• appends go straight to the page cache; sync() fsyncs every segment
+  written since the last call, so one fsync covers a whole group of
+  records (the server calls it once a second)
+• read() walks a memory-mapped segment from any offset and returns up
+  to `max_bytes` of records for one large batched write
+• expire() drops segments whose newest record is older than `ttl`
+• at most `max_user_bytes` unacknowledged bytes per recipient; append()
+  refuses beyond that
+• at most `max_open` queues keep their files open (2 fds per segment);
+  the least recently used one is synced and closed, and reopened from
+  disk on its next use
+"""
+from __future__ import annotations
+import mmap, os, struct, threading, time
+from collections import OrderedDict
+
+SEGMENT_BYTES  = 4 * 1024 * 1024
+MAX_USER_BYTES = 64 * 1024 * 1024
+TTL_SECS       = 7 * 24 * 3600
+READ_BYTES     = 256 * 1024
+MAX_OPEN       = 64                 # recipients' queues kept open at once
+
+_HDR = struct.Struct(">IqHQ")           # blob length, unix ms, sender length, seq
+_IDX = struct.Struct(">I")              # record position inside its segment
+
+
+def _read_at(fd: int, n: int, pos: int) -> bytes:
+    os.lseek(fd, pos, os.SEEK_SET)                  # (no os.pread on Windows)
+    return os.read(fd, n)
+
+
+class _Segment:
+    __slots__ = ("base", "log_path", "idx_path", "size", "count",
+                 "_log_fd", "_idx_fd", "_map", "_idx_map")
+
+    def __init__(self, qdir: str, base: int):
+        self.base = base
+        self.log_path = os.path.join(qdir, f"{base:016x}.log")
+        self.idx_path = os.path.join(qdir, f"{base:016x}.idx")
+        self.size = self.count = 0
+        self._log_fd = self._idx_fd = None
+        self._map = self._idx_map = None
+
+    def open(self) -> "_Segment":
+        """Open (creating if needed); drop a record torn by a crash mid-append."""
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        self._log_fd = os.open(self.log_path, flags, 0o600)
+        self._idx_fd = os.open(self.idx_path, flags, 0o600)
+        log_size = os.fstat(self._log_fd).st_size
+        idx = _read_at(self._idx_fd, os.fstat(self._idx_fd).st_size, 0)
+        count, end = len(idx) // _IDX.size, 0
+        while count:
+            pos = _IDX.unpack_from(idx, (count - 1) * _IDX.size)[0]
+            if pos + _HDR.size <= log_size:
+                blen, _, slen, _ = _HDR.unpack(_read_at(self._log_fd, _HDR.size, pos))
+                end = pos + _HDR.size + slen + blen
+                if end <= log_size:
+                    break
+            count -= 1
+        else:
+            end = 0
+        if end != log_size:
+            os.ftruncate(self._log_fd, end)
+        if count * _IDX.size != len(idx):
+            os.ftruncate(self._idx_fd, count * _IDX.size)
+        self.size, self.count = end, count
+        os.lseek(self._log_fd, end, os.SEEK_SET)
+        os.lseek(self._idx_fd, count * _IDX.size, os.SEEK_SET)
+        return self
+
+    def append(self, rec: bytes) -> None:
+        os.write(self._log_fd, rec)
+        os.write(self._idx_fd, _IDX.pack(self.size))
+        self.size += len(rec)
+        self.count += 1
+
+    def _mapped(self, fd, current, length):
+        if current is not None and len(current) >= length:
+            return current
+        if current is not None:
+            current.close()
+        return mmap.mmap(fd, length, access=mmap.ACCESS_READ)
+
+    def view(self) -> mmap.mmap:
+        self._map = self._mapped(self._log_fd, self._map, self.size)
+        return self._map
+
+    def first_record_from(self, pos: int) -> int:
+        """Number of the first record at or after byte `pos` (binary search in the index)."""
+        if pos <= 0:
+            return 0
+        if pos >= self.size:
+            return self.count
+        self._idx_map = self._mapped(self._idx_fd, self._idx_map, self.count * _IDX.size)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _IDX.unpack_from(self._idx_map, mid * _IDX.size)[0] < pos:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def mtime(self) -> float:
+        return os.fstat(self._log_fd).st_mtime
+
+    def sync(self) -> None:
+        os.fsync(self._log_fd)
+        os.fsync(self._idx_fd)
+
+    def close(self) -> None:
+        for m in (self._map, self._idx_map):
+            if m is not None:
+                m.close()
+        for fd in (self._log_fd, self._idx_fd):
+            if fd is not None:
+                os.close(fd)
+        self._map = self._idx_map = self._log_fd = self._idx_fd = None
+
+    def remove(self) -> None:
+        self.close()
+        for path in (self.log_path, self.idx_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class _Queue:
+    """One recipient's segments and cursor (use under .lock)."""
+
+    def __init__(self, qdir: str):
+        self.dir = qdir
+        self.lock = threading.Lock()
+        self.live = True                # False once dropped from OfflineQueue._queues
+        os.makedirs(qdir, exist_ok=True)
+        try:
+            with open(os.path.join(qdir, "cursor"), "rb") as fh:
+                self.cursor = int.from_bytes(fh.read(8), "big")
+        except FileNotFoundError:
+            self.cursor = 0
+        bases = sorted(int(n[:-4], 16) for n in os.listdir(qdir) if n.endswith(".log"))
+        self.segments = [_Segment(qdir, b).open() for b in bases]
+        self._drop_acked()
+
+    @property
+    def end(self) -> int:
+        last = self.segments[-1] if self.segments else None
+        return last.base + last.size if last else self.cursor
+
+    def _drop_acked(self) -> list[_Segment]:
+        gone = []
+        while self.segments and self.segments[0].base + self.segments[0].size <= self.cursor:
+            seg = self.segments.pop(0)
+            seg.remove()
+            gone.append(seg)
+        return gone
+
+    def set_cursor(self, offset: int) -> list[_Segment]:
+        self.cursor = offset
+        tmp = os.path.join(self.dir, "cursor.tmp")
+        with open(tmp, "wb") as fh:
+            fh.write(offset.to_bytes(8, "big"))
+        os.replace(tmp, os.path.join(self.dir, "cursor"))
+        return self._drop_acked()
+
+    def close(self) -> None:
+        for seg in self.segments:
+            seg.close()
+        self.segments = []
+        self.live = False
+
+
+class OfflineQueue:
+    """append() / read() / ack() / pending() / sync() / expire(); thread-safe."""
+
+    def __init__(self, root: str, segment_bytes: int = SEGMENT_BYTES,
+                 max_user_bytes: int = MAX_USER_BYTES, ttl: float = TTL_SECS,
+                 max_open: int = MAX_OPEN):
+        self.root, self.segment_bytes = root, segment_bytes
+        self.max_user_bytes, self.ttl, self.max_open = max_user_bytes, ttl, max_open
+        self._queues: OrderedDict[str, _Queue] = OrderedDict()     # LRU
+        self._dirty: set[_Segment] = set()
+        self._lock = threading.Lock()
+
+    def _dir(self, user: str) -> str:
+        return os.path.join(self.root, user.encode().hex())     # any name → safe file name
+
+    def _locked_queue(self, user: str, create: bool) -> _Queue | None:
+        """The recipient's queue with its lock held (caller releases), or None."""
+        while True:
+            evicted = []
+            with self._lock:
+                q = self._queues.get(user)
+                if q is None:
+                    if not create and not os.path.isdir(self._dir(user)):
+                        return None
+                    q = self._queues[user] = _Queue(self._dir(user))
+                    while len(self._queues) > self.max_open:
+                        evicted.append(self._queues.popitem(last=False)[1])
+                else:
+                    self._queues.move_to_end(user)
+            for old in evicted:
+                with old.lock:
+                    with self._lock:
+                        self._dirty.difference_update(old.segments)
+                    for seg in old.segments:
+                        seg.sync()
+                    old.close()
+            q.lock.acquire()
+            if q.live:
+                return q
+            q.lock.release()            # evicted meanwhile – look again
+
+    # ── producer ───────────────────────────────────────────────────
+    def append(self, recipient: str, sender: str, blob, seq: int = 0) -> bool:
+        """Queue one ciphertext; False if the recipient's queue is full."""
+        name = sender.encode()
+        rec = _HDR.pack(len(blob), int(time.time() * 1000), len(name), seq) + name + bytes(blob)
+        q = self._locked_queue(recipient, True)
+        try:
+            if q.end - q.cursor + len(rec) > self.max_user_bytes:
+                return False
+            seg = q.segments[-1] if q.segments else None
+            if seg is None or (seg.count and seg.size + len(rec) > self.segment_bytes):
+                seg = _Segment(q.dir, q.end).open()
+                q.segments.append(seg)
+            seg.append(rec)
+        finally:
+            q.lock.release()
+        with self._lock:
+            self._dirty.add(seg)
+        return True
+
+    def sync(self) -> int:
+        """fsync every segment appended to since the last call; returns how many."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for seg in dirty:
+            try:
+                seg.sync()
+            except (OSError, TypeError):            # removed (acked / expired) meanwhile
+                pass
+        return len(dirty)
+
+    # ── consumer ───────────────────────────────────────────────────
+    def pending(self, recipient: str) -> int:
+        """Records not acknowledged yet."""
+        q = self._locked_queue(recipient, False)
+        if q is None:
+            return 0
+        try:
+            return sum(seg.count - seg.first_record_from(q.cursor - seg.base)
+                       for seg in q.segments)
+        finally:
+            q.lock.release()
+
+    def read(self, recipient: str, offset: int | None = None,
+             max_bytes: int = READ_BYTES) -> tuple[list[tuple[int, str, bytes, int]], int]:
+        """
+        Records from stream `offset` (default: the cursor) as
+        [(unix_ms, sender, blob, seq)], at least one and about `max_bytes` in all,
+        plus the offset just past them (pass it to the next read / to ack()).
+        """
+        q = self._locked_queue(recipient, False)
+        if q is None:
+            return [], 0
+        try:
+            pos = q.cursor if offset is None else max(offset, q.cursor)
+            out, budget = [], max_bytes
+            for seg in q.segments:
+                if pos >= seg.base + seg.size:
+                    continue
+                m, p = seg.view(), pos - seg.base
+                while p < seg.size and budget > 0:
+                    blen, ts, slen, seq = _HDR.unpack_from(m, p)
+                    a = p + _HDR.size
+                    out.append((ts, m[a:a + slen].decode(), m[a + slen:a + slen + blen], seq))
+                    p = a + slen + blen
+                    budget -= p - (a - _HDR.size)
+                pos = seg.base + p
+                if budget <= 0:
+                    break
+            return out, pos
+        finally:
+            q.lock.release()
+
+    def ack(self, recipient: str, offset: int) -> None:
+        """Everything before stream `offset` was delivered."""
+        q = self._locked_queue(recipient, False)
+        if q is None:
+            return
+        try:
+            if offset > q.cursor:
+                gone = q.set_cursor(min(offset, q.end))
+            else:
+                gone = []
+        finally:
+            q.lock.release()
+        with self._lock:
+            self._dirty.difference_update(gone)
+
+    # ── housekeeping ───────────────────────────────────────────────
+    def expire(self) -> int:
+        """Drop segments older than `ttl` and forget idle queues; returns segments dropped."""
+        cutoff, dropped = time.time() - self.ttl, 0
+        try:
+            names = [n for n in os.listdir(self.root) if not n.startswith(".")]
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            try:
+                user = bytes.fromhex(name).decode()
+            except ValueError:
+                continue
+            q = self._locked_queue(user, False)
+            if q is None:
+                continue
+            try:
+                while q.segments and q.segments[0].mtime() < cutoff:
+                    seg = q.segments[0]
+                    gone = q.set_cursor(max(q.cursor, seg.base + seg.size))
+                    dropped += len(gone)
+                    with self._lock:
+                        self._dirty.difference_update(gone)
+                if not q.segments:
+                    with self._lock:
+                        self._queues.pop(user, None)
+                    q.close()
+            finally:
+                q.lock.release()
+        return dropped
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            queues, self._queues = list(self._queues.values()), OrderedDict()
+        for q in queues:
+            with q.lock:
+                q.close()
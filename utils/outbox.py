@@ -0,0 +1,212 @@
+# utils/outbox.py
+"""
+Per-connection outbound queues for the Secure-Chat server.
+
+Routers never write to a client socket themselves: they put() an encoded
+frame into the client's Outbox and move on.  put() never blocks – when
+the queue is full the frame is refused – so one client with a full TCP
+window can no longer stall routing for everyone else.
+
+• ThreadOutbox – deque + dedicated writer thread (threaded engine)
+• StreamOutbox – the asyncio transport buffer is the queue and the event
+                 loop is the writer (asyncio engine)
+
+Both track how long they have been above their high-water mark
+(over_since) so the server can evict slow consumers, and count bytes
+accepted (mark()) and handed to the socket (written()) so a caller can
+tell when what it queued has been flushed.
+"""
+from __future__ import annotations
+import asyncio, socket, struct, threading, time
+from collections import deque
+
+from utils.framing import write_frames
+
+MAX_QUEUE_BYTES  = 1024 * 1024        # hard cap – put() refuses beyond this
+HIGH_WATER_BYTES = 256 * 1024         # "slow consumer" threshold
+_WRITE_CHUNK     = 64 * 1024          # bytes coalesced into one write
+
+
+class ThreadOutbox:
+    """Bounded frame queue drained by its own writer thread."""
+
+    def __init__(self, sock: socket.socket, name: str,
+                 max_bytes: int = MAX_QUEUE_BYTES,
+                 high_water: int = HIGH_WATER_BYTES):
+        self.sock = sock
+        self.name = name
+        self.max_bytes = max_bytes
+        self.high_water = high_water
+        self.over_since: float | None = None    # monotonic time we crossed high_water
+        self.dropped = 0
+        self._q: deque[bytes] = deque()
+        self._bytes = 0                         # queued + being written
+        self._accepted = self._written = 0      # running totals, see mark()/written()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(target=self._run, daemon=True,
+                                        name=f"writer-{name}")
+        self._writer.start()
+
+    # ── router side ────────────────────────────────────────────────
+    def put(self, wire: bytes) -> bool:
+        """Queue one encoded frame; False if closed or over max_bytes."""
+        with self._cond:
+            if self._closed:
+                return False
+            if self._bytes + len(wire) > self.max_bytes:
+                self.dropped += 1
+                return False
+            self._q.append(wire)
+            self._bytes += len(wire)
+            self._accepted += len(wire)
+            if self._bytes > self.high_water and self.over_since is None:
+                self.over_since = time.monotonic()
+            self._cond.notify()
+            return True
+
+    def put_many(self, wires: list[bytes]) -> bool:
+        """Queue all of `wires` or none of them."""
+        size = sum(map(len, wires))
+        with self._cond:
+            if self._closed:
+                return False
+            if self._bytes + size > self.max_bytes:
+                self.dropped += len(wires)
+                return False
+            self._q.extend(wires)
+            self._bytes += size
+            self._accepted += size
+            if self._bytes > self.high_water and self.over_since is None:
+                self.over_since = time.monotonic()
+            self._cond.notify()
+            return True
+
+    def mark(self) -> int:
+        """Bytes accepted so far; written() reaches it once they are all sent."""
+        with self._cond:
+            return self._accepted
+
+    def written(self) -> int:
+        """Bytes handed to the socket so far."""
+        with self._cond:
+            return self._written
+
+    def depth(self) -> int:
+        """Bytes queued or being written."""
+        with self._cond:
+            return self._bytes
+
+    def close(self) -> None:
+        """Stop the writer and wake a reader blocked on the socket."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def abort(self) -> None:
+        """close(), but reset the connection instead of draining kernel buffers."""
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                 struct.pack("ii", 1, 0))
+        except OSError:
+            pass
+        self.close()
+
+    # ── writer thread ──────────────────────────────────────────────
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._q and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                batch, size = [], 0
+                while self._q and size < _WRITE_CHUNK:
+                    w = self._q.popleft()
+                    batch.append(w); size += len(w)
+            try:
+                write_frames(self.sock, batch)  # small frames share TLS records
+            except OSError:
+                self.close()
+                return
+            with self._cond:
+                self._bytes -= size
+                self._written += size
+                if self._bytes <= self.high_water:
+                    self.over_since = None
+
+
+class StreamOutbox:
+    """asyncio flavour: the transport's write buffer is the bounded queue."""
+
+    def __init__(self, writer: asyncio.StreamWriter, name: str,
+                 max_bytes: int = MAX_QUEUE_BYTES,
+                 high_water: int = HIGH_WATER_BYTES):
+        self.writer = writer
+        self.name = name
+        self.max_bytes = max_bytes
+        self.high_water = high_water
+        self.over_since: float | None = None
+        self.dropped = 0
+        self._accepted = 0
+        self._loop = asyncio.get_running_loop()
+        self._transport = writer.transport
+
+    def put(self, wire: bytes) -> bool:
+        """Event-loop thread only (all asyncio-engine routing runs there)."""
+        if self._transport.is_closing():
+            return False
+        buffered = self._transport.get_write_buffer_size()
+        if buffered + len(wire) > self.max_bytes:
+            self.dropped += 1
+            return False
+        self.writer.write(wire)                 # transport joins queued writes
+        self._accepted += len(wire)
+        if buffered + len(wire) > self.high_water:
+            if self.over_since is None:
+                self.over_since = time.monotonic()
+        else:
+            self.over_since = None
+        return True
+
+    def put_many(self, wires: list[bytes]) -> bool:
+        """One write, so all of `wires` or none of them."""
+        return self.put(wires[0] if len(wires) == 1 else b"".join(wires))
+
+    def mark(self) -> int:
+        return self._accepted
+
+    def written(self) -> int:
+        """Bytes accepted and no longer in the transport buffer."""
+        return self._accepted - self._transport.get_write_buffer_size()
+
+    def depth(self) -> int:
+        """Bytes sitting in the transport buffer (also clears over_since once drained)."""
+        buffered = self._transport.get_write_buffer_size()
+        if buffered <= self.high_water:
+            self.over_since = None
+        return buffered
+
+    def close(self) -> None:
+        """Safe from any thread (the eviction sweeper is not on the loop)."""
+        self._loop.call_soon_threadsafe(self.writer.close)
+
+    def abort(self) -> None:
+        """Drop the connection without flushing what is still buffered."""
+        self._loop.call_soon_threadsafe(self._abort)
+
+    def _abort(self) -> None:
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                struct.pack("ii", 1, 0))
+            except OSError:
+                pass
+        self._transport.abort()
@@ -0,0 +1,57 @@
+# utils/puzzle.py
+"""
+Hash-based client puzzle in front of the password check.
+
+Each login costs the server a full PBKDF2, so under credential stuffing
+from many addresses the auth pool (utils.auth_pool) fills up.  While it
+is loaded the server asks every new connection for a little work first:
+
+• challenge: 16 random bytes + difficulty `bits`, fresh per connection
+• answer:    a counter n with SHA-256(nonce ‖ n) starting with `bits` zero bits
+• verify:    one SHA-256 – microseconds; solving costs ~2**bits hashes
+• difficulty() maps auth-pool load to bits: 0 (off) below `min_load`,
+  then rising linearly to `max_bits` at a full queue
+"""
+from __future__ import annotations
+import hashlib, os
+
+NONCE_LEN = 16
+MIN_LOAD  = 0.25                 # auth-pool load (pending / max) that turns puzzles on
+MIN_BITS  = 12                   # ~4k hashes, a few ms in CPython
+MAX_BITS  = 22                   # ~4M hashes, a few seconds
+
+
+def difficulty(load: float, min_load: float = MIN_LOAD,
+               min_bits: int = MIN_BITS, max_bits: int = MAX_BITS) -> int:
+    """Zero-bit count to demand at auth-pool `load` (0.0 … 1.0); 0 = no puzzle."""
+    if load < min_load:
+        return 0
+    frac = min(1.0, (load - min_load) / (1.0 - min_load)) if min_load < 1 else 1.0
+    return min_bits + round((max_bits - min_bits) * frac)
+
+
+def new_nonce() -> bytes:
+    return os.urandom(NONCE_LEN)
+
+
+def _leading_zero_ok(digest: bytes, bits: int) -> bool:
+    return int.from_bytes(digest[:8], "big") >> (64 - bits) == 0
+
+
+def check(nonce: bytes, bits: int, answer: int) -> bool:
+    """True if `answer` solves (nonce, bits)."""
+    if not 0 <= answer < 1 << 64:
+        return False
+    return _leading_zero_ok(hashlib.sha256(nonce + answer.to_bytes(8, "big")).digest(), bits)
+
+
+def solve(nonce: bytes, bits: int) -> int:
+    """Brute-force an answer (client side)."""
+    prefix = hashlib.sha256(nonce)
+    n = 0
+    while True:
+        h = prefix.copy()
+        h.update(n.to_bytes(8, "big"))
+        if _leading_zero_ok(h.digest(), bits):
+            return n
+        n += 1
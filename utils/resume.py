@@ -0,0 +1,71 @@
+# utils/resume.py
+"""
+Session-resumption tokens for the Secure-Chat server.
+
+After a full login (password + USB + KEYPUB) the server hands the client
+a token.  A client that drops can present it on a fresh connection
+instead of its credentials and is back online in one round trip – no
+PBKDF2, no USB check, no key re-exchange.
+
+• token = base64url(nonce ‖ HMAC-SHA256(secret, nonce ‖ username)[:16])
+• the secret is random per server run, so a restart invalidates all tokens
+• single use: redeem() removes the entry, the new session gets a new token
+• short-lived: the TTL clock starts when the holder goes offline (release())
+• bounded: at most max_tokens entries, oldest evicted first
+"""
+from __future__ import annotations
+import base64, hashlib, hmac, os, threading, time
+from collections import OrderedDict
+
+RESUME_TTL_SECS = 120                 # how long after a disconnect a token still works
+MAX_TOKENS      = 10_000
+_NONCE_LEN = _MAC_LEN = 16
+
+
+class ResumeTokens:
+    """Issue / redeem single-use resume tokens; thread-safe."""
+
+    def __init__(self, ttl: float = RESUME_TTL_SECS, max_tokens: int = MAX_TOKENS):
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self._secret = os.urandom(32)
+        # nonce -> [username, state, expires_at or None while the holder is online]
+        self._live: OrderedDict[bytes, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _mac(self, nonce: bytes, username: str) -> bytes:
+        return hmac.new(self._secret, nonce + username.encode(), hashlib.sha256).digest()[:_MAC_LEN]
+
+    def issue(self, username: str, state) -> tuple[str, bytes]:
+        """New token for `username` carrying `state` (not None); returns (token, token_id)."""
+        nonce = os.urandom(_NONCE_LEN)
+        token = base64.urlsafe_b64encode(nonce + self._mac(nonce, username)).decode()
+        with self._lock:
+            self._live[nonce] = [username, state, None]
+            while len(self._live) > self.max_tokens:
+                self._live.popitem(last=False)
+        return token, nonce
+
+    def release(self, token_id: bytes) -> None:
+        """The holder went offline: the token now expires after `ttl` seconds."""
+        with self._lock:
+            entry = self._live.get(token_id)
+            if entry is not None:
+                entry[2] = time.monotonic() + self.ttl
+
+    def redeem(self, username: str, token: str):
+        """State stored at issue() if the token is genuine, unused and unexpired, else None."""
+        try:
+            raw = base64.urlsafe_b64decode(token.encode())
+        except ValueError:
+            return None
+        nonce, mac = raw[:_NONCE_LEN], raw[_NONCE_LEN:]
+        if len(mac) != _MAC_LEN or not hmac.compare_digest(mac, self._mac(nonce, username)):
+            return None
+        with self._lock:
+            entry = self._live.pop(nonce, None)
+        if entry is None or entry[0] != username:
+            return None
+        if entry[2] is not None and time.monotonic() > entry[2]:
+            return None
+        return entry[1]
@@ -0,0 +1,122 @@
+# utils/throttle.py
+"""
+Failed-login throttle for the Secure-Chat server, bounded in memory.
+
+• buckets per source IP and per subnet (/24 for IPv4, /64 for IPv6):
+  `max_fails` bad passwords lock an IP, `subnet_max_fails` lock its subnet,
+  both for `lock_secs`; a good password clears only the IP bucket
+• counts are forgotten `fail_window` seconds after the last failure
+• expiry: every bucket in a lane ("counting" or "locked") has the same
+  TTL, so each lane is an OrderedDict kept in expiry order – a timer
+  wheel whose slots are one queue per TTL; sweep() pops expired buckets
+  off the front, so idle ones vanish without anyone looking them up
+• hard cap of `max_entries` buckets; when full the oldest counting bucket
+  goes first, locked ones only when nothing else is left
+• `stripes` independent shards, each with its own lock, so concurrent
+  logins from different addresses do not serialize
+"""
+from __future__ import annotations
+import ipaddress, math, threading, time
+from collections import OrderedDict
+
+MAX_FAILS        = 3
+SUBNET_MAX_FAILS = 30
+LOCK_SECS        = 300
+FAIL_WINDOW_SECS = 900
+MAX_ENTRIES      = 100_000
+STRIPES          = 16
+
+
+def subnet_of(ip: str) -> str:
+    """Aggregate bucket key: "a.b.c.0/24" or the /64 prefix of an IPv6 address."""
+    if ":" not in ip:
+        return ip.rsplit(".", 1)[0] + ".0/24"
+    try:
+        return ipaddress.IPv6Address(ip).packed[:8].hex() + "::/64"
+    except ValueError:
+        return ip
+
+
+class _Stripe:
+    __slots__ = ("lock", "counting", "locked")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counting: OrderedDict[str, list] = OrderedDict()   # key -> [fails, expires]
+        self.locked:   OrderedDict[str, float] = OrderedDict()  # key -> locked_until
+
+    def __len__(self) -> int:
+        return len(self.counting) + len(self.locked)
+
+
+class LoginThrottle:
+    """locked(ip) / register_fail(ip) / clear(ip) / sweep(); thread-safe."""
+
+    def __init__(self, max_fails: int = MAX_FAILS, subnet_max_fails: int = SUBNET_MAX_FAILS,
+                 lock_secs: float = LOCK_SECS, fail_window: float = FAIL_WINDOW_SECS,
+                 max_entries: int = MAX_ENTRIES, stripes: int = STRIPES):
+        self.max_fails, self.subnet_max_fails = max_fails, subnet_max_fails
+        self.lock_secs, self.fail_window = lock_secs, fail_window
+        self._per_stripe = max(1, max_entries // stripes)
+        self._stripes = [_Stripe() for _ in range(stripes)]
+
+    def _stripe(self, key: str) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    # ── lookups ────────────────────────────────────────────────────
+    def _wait(self, key: str, now: float) -> float:
+        st = self._stripe(key)
+        with st.lock:
+            until = st.locked.get(key, 0.0)
+        return until - now
+
+    def locked(self, ip: str) -> int:
+        """Seconds until `ip` may try again (0 = not locked)."""
+        now = time.monotonic()
+        return max(0, math.ceil(max(self._wait(ip, now), self._wait(subnet_of(ip), now))))
+
+    # ── updates ────────────────────────────────────────────────────
+    def _fail(self, key: str, limit: int, now: float) -> int:
+        """Count one failure on `key`; returns tries left (0 = locked now or already)."""
+        st = self._stripe(key)
+        with st.lock:
+            if st.locked.get(key, 0.0) > now:
+                return 0
+            e = st.counting.pop(key, None)
+            fails = e[0] + 1 if e is not None and e[1] > now else 1
+            if fails >= limit:
+                st.locked.pop(key, None)
+                st.locked[key] = now + self.lock_secs            # back of the lane
+                return 0
+            st.counting[key] = [fails, now + self.fail_window]
+            while len(st) > self._per_stripe:
+                (st.counting or st.locked).popitem(last=False)
+            return limit - fails
+
+    def register_fail(self, ip: str) -> int:
+        """Count a bad password from `ip`; tries left before it is locked (0 = locked)."""
+        now = time.monotonic()
+        net_left = self._fail(subnet_of(ip), self.subnet_max_fails, now)
+        ip_left = self._fail(ip, self.max_fails, now)
+        return ip_left if net_left else 0
+
+    def clear(self, ip: str) -> None:
+        """Good password: forget the IP's failures (its subnet keeps counting)."""
+        st = self._stripe(ip)
+        with st.lock:
+            st.counting.pop(ip, None)
+
+    # ── expiry ─────────────────────────────────────────────────────
+    def sweep(self) -> int:
+        """Drop every expired bucket; returns how many."""
+        now, dropped = time.monotonic(), 0
+        for st in self._stripes:
+            with st.lock:
+                while st.counting and next(iter(st.counting.values()))[1] <= now:
+                    st.counting.popitem(last=False);  dropped += 1
+                while st.locked and next(iter(st.locked.values())) <= now:
+                    st.locked.popitem(last=False);  dropped += 1
+        return dropped
+
+    def __len__(self) -> int:
+        return sum(len(st) for st in self._stripes)
@@ -2,18 +2,30 @@ import os
 import ssl
 from cryptography import x509
 from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
 from cryptography.hazmat.backends import default_backend
 import datetime
+import time
+
+# TLS 1.3 session tickets handed to each client after a full handshake;
+# a reconnect that offers one skips the certificate signature.  0 = off.
+SESSION_TICKETS = 2
+TICKET_ROTATE_SECS = 12 * 3600      # TicketRotator: new ticket key this often
+
+# Server certificate key: an ECDSA P-256 or Ed25519 signature per full
+# handshake costs a fraction of an RSA-2048 one.
+CERT_KEY_TYPES = ("rsa", "ecdsa", "ed25519")
 
 # Dynamically determine the directory of this script (ensures portability across different systems)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CERT_DIR = os.path.join(BASE_DIR, "cert")
 
-def ensure_cert_in_cert_dir(cert_filename="server_cert.pem", key_filename="server_key.pem"):
+def ensure_cert_in_cert_dir(cert_filename="server_cert.pem", key_filename="server_key.pem",
+                            key_type="rsa"):
     """
     Ensures that the SSL certificate and key exist in the designated certificate directory.
-    If they do not exist, a new self-signed certificate is generated.
+    If they do not exist, a new self-signed certificate is generated with a `key_type`
+    key (see CERT_KEY_TYPES).  An existing pair is kept whatever its type – clients pin it.
 
     Returns:
         Tuple[str, str]: Paths to the certificate and key files.
@@ -33,13 +45,14 @@ def ensure_cert_in_cert_dir(cert_filename="server_cert.pem", key_filename="serve
     # If certificate or key is missing, generate new ones
     if not os.path.exists(cert_path) or not os.path.exists(key_path):
         print("  Certificates not found. Generating new ones...")
-        generate_self_signed_cert(cert_path, key_path)
+        generate_self_signed_cert(cert_path, key_path, key_type)
     else:
         print(f" Certificates already exist: {cert_path}, {key_path}")
 
     return cert_path, key_path
 
-def configure_tls_context(certfile, keyfile, purpose, cafile=None):
+def configure_tls_context(certfile, keyfile, purpose, cafile=None,
+                          session_tickets=SESSION_TICKETS):
     """
     Configures a TLS context using the provided certificate and key files.
 
@@ -48,6 +61,8 @@ def configure_tls_context(certfile, keyfile, purpose, cafile=None):
         keyfile (str): Path to the private key file.
         purpose (ssl.Purpose): The intended use of the SSL context (SERVER_AUTH or CLIENT_AUTH).
         cafile (str, optional): Path to the CA file for verifying certificates (default is None).
+        session_tickets (int, optional): Server only – resumption tickets issued per
+            full handshake (0 disables resumption).
 
     Returns:
         ssl.SSLContext: Configured TLS context.
@@ -68,6 +83,7 @@ def configure_tls_context(certfile, keyfile, purpose, cafile=None):
             ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
             ctx.load_cert_chain(certfile, keyfile)
             ctx.verify_mode = ssl.CERT_OPTIONAL     # ready for mTLS later
+            ctx.num_tickets = session_tickets
 
         # ── Hardening common to both roles ────────────────────────────
         ctx.minimum_version = ssl.TLSVersion.TLSv1_3
@@ -91,13 +107,52 @@ def configure_tls_context(certfile, keyfile, purpose, cafile=None):
     except Exception as e:
         raise RuntimeError(f"Failed to configure TLS context: {e}")
 
-def generate_self_signed_cert(cert_path, key_path):
+class TicketRotator:
+    """
+    Server contexts whose session-ticket key changes every `rotate_secs`.
+
+    OpenSSL draws a random ticket key per SSLContext and Python offers no
+    call to replace it, so rotating means building a fresh context; tickets
+    issued under the old key simply fall back to a full handshake.  The
+    remaining keyword arguments go to configure_tls_context().
+    """
+
+    def __init__(self, rotate_secs=TICKET_ROTATE_SECS, **ctx_kwargs):
+        self.rotate_secs = rotate_secs
+        self._kwargs = ctx_kwargs
+        self._ctx = configure_tls_context(**ctx_kwargs)
+        self._born = time.monotonic()
+
+    def current(self):
+        """Context for the next connection (rebuilt once it is too old)."""
+        if self.rotate_secs and time.monotonic() - self._born >= self.rotate_secs:
+            self._ctx = configure_tls_context(**self._kwargs)
+            self._born = time.monotonic()
+        return self._ctx
+
+def _new_cert_key(key_type):
+    """(private key, signature hash) for a new certificate of `key_type`."""
+    if key_type == "rsa":
+        key = rsa.generate_private_key(
+            public_exponent=65537,  # Standard value for security
+            key_size=2048,  # 2048-bit key size (secure and efficient)
+            backend=default_backend()
+        )
+        return key, hashes.SHA256()
+    if key_type == "ecdsa":
+        return ec.generate_private_key(ec.SECP256R1()), hashes.SHA256()
+    if key_type == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate(), None    # Ed25519 hashes internally
+    raise ValueError(f"unknown certificate key type {key_type!r} (one of {CERT_KEY_TYPES})")
+
+def generate_self_signed_cert(cert_path, key_path, key_type="rsa"):
     """
     Generates a self-signed SSL certificate and saves it to the specified paths.
 
     Args:
         cert_path (str): Path where the certificate should be saved.
         key_path (str): Path where the private key should be saved.
+        key_type (str, optional): "rsa" (2048-bit), "ecdsa" (P-256) or "ed25519".
     """
     """
         What is an X.509 certificate?
@@ -108,14 +163,9 @@ def generate_self_signed_cert(cert_path, key_path):
         Common applications of X.509 certificates include SSL/TLS and HTTPS for authenticated and encrypted web browsing, signed and encrypted email via the S/MIME protocol, code signing, document signing, client authentication, and government-issued electronic ID.
 
     """
+    # Generate the private key (an unknown key_type raises ValueError)
+    key, digest = _new_cert_key(key_type)
     try:
-        # Generate an RSA private key
-        key = rsa.generate_private_key(
-            public_exponent=65537,  # Standard value for security
-            key_size=2048,  # 2048-bit key size (secure and efficient)
-            backend=default_backend()
-        )
-
         # Define the subject and issuer (same for a self-signed certificate)
         subject = issuer = x509.Name([
             x509.NameAttribute(x509.NameOID.COMMON_NAME, u'localhost')
@@ -130,7 +180,7 @@ def generate_self_signed_cert(cert_path, key_path):
             .serial_number(x509.random_serial_number())  # Generate a unique serial number
             .not_valid_before(datetime.datetime.utcnow())  # Certificate starts being valid immediately
             .not_valid_after(datetime.datetime.utcnow() + datetime.timedelta(days=365))  # Valid for 1 year
-            .sign(key, hashes.SHA256(), default_backend())  # Sign the certificate with SHA-256
+            .sign(key, digest, default_backend())  # Sign the certificate (SHA-256 unless Ed25519)
         )
 
         # Save the private key to the specified path
@@ -138,7 +188,9 @@ def generate_self_signed_cert(cert_path, key_path):
             key_file.write(
                 key.private_bytes(
                     encoding=serialization.Encoding.PEM,
-                    format=serialization.PrivateFormat.TraditionalOpenSSL,
+                    # Ed25519 has no "traditional" encoding
+                    format=(serialization.PrivateFormat.TraditionalOpenSSL if key_type == "rsa"
+                            else serialization.PrivateFormat.PKCS8),
                     encryption_algorithm=serialization.NoEncryption(),  # No password protection
                 )
             )
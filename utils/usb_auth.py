@@ -1,7 +1,7 @@
 # usb_auth.py
-import os, time, hashlib, logging, win32api, win32file, sqlite3
+import os, time, hashlib, logging, win32api, win32file
 from tkinter import messagebox
-from utils.db_setup import DB_PATH
+from utils import db
 
 
 MAX_FAILS = 3
@@ -21,9 +21,7 @@ def _find_key_file(serial: str) -> str | None:
     return None
 
 def authenticate(username: str) -> bool:
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("SELECT usb_serial, usb_hash, usb_fail_count, usb_locked_until FROM users WHERE username=?", (username,))
-    row = cur.fetchone(); conn.close()
+    row = db.query_one("SELECT usb_serial, usb_hash, usb_fail_count, usb_locked_until FROM users WHERE username=?", (username,))
     if not row or not row[0]:
         messagebox.showerror("USB", "No USB key registered for this user."); return False
 
@@ -42,30 +40,23 @@ def authenticate(username: str) -> bool:
         return _fail(username, fails, "USB key authentication failed.")
 
     # success
-    _reset_fails(username)
+    if fails or locked_until:
+        _reset_fails(username)
     return True
 
 def _fail(user, fails, msg):
     messagebox.showerror("USB", msg)
     fails += 1
     lock = int(time.time()) + LOCK_SECS if fails >= MAX_FAILS else 0
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("UPDATE users SET usb_fail_count=?, usb_locked_until=? WHERE username=?", (fails % MAX_FAILS, lock, user))
-    conn.commit(); conn.close()
+    db.execute("UPDATE users SET usb_fail_count=?, usb_locked_until=? WHERE username=?", (fails % MAX_FAILS, lock, user))
     return False
 
 def _reset_fails(user):
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("UPDATE users SET usb_fail_count=0, usb_locked_until=0 WHERE username=?", (user,))
-    conn.commit(); conn.close()
+    db.execute("UPDATE users SET usb_fail_count=0, usb_locked_until=0 WHERE username=?", (user,))
 
 def is_locked_out(username: str) -> bool:
     """Check if user is currently locked out for USB attempts."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT usb_locked_until FROM users WHERE username=?", (username,))
-    row = cur.fetchone()
-    conn.close()
+    row = db.query_one("SELECT usb_locked_until FROM users WHERE username=?", (username,))
     if not row:
         return False
     locked_until = row[0] or 0
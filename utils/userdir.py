@@ -0,0 +1,175 @@
+# utils/userdir.py
+"""
+In-memory copy of the `users` table for the Secure-Chat server.
+
+A login used to read the same row twice (password, then USB); now both
+checks read a UserRecord from here and touch SQLite only when something
+changed:
+
+• change log: triggers on `users` stamp every inserted / updated / deleted
+  username into `user_changes` with a rising seq, so edits made by other
+  processes (admin.py, manage_users.py, the GUI) are recorded in the file
+• poll: `PRAGMA data_version` on the directory's own connection changes
+  only when another connection committed; it costs no table reads and is
+  asked at most every `poll_secs` (and on a lookup miss)
+• reload: when it did change, only the rows with seq > last seen are
+  re-read; a full load happens once, on first use
+• write-through: the server's own writes update the record with put();
+  values not yet flushed (utils.writebehind) are laid over every row read
+  from disk so they are not lost on a reload.  `snapshot()` is taken
+  before the read: a value committed by a flush after it is already in
+  the snapshot, so a row read just before that commit cannot win
+"""
+from __future__ import annotations
+import threading, time
+from dataclasses import dataclass
+from pathlib import Path
+
+from utils import db, metrics
+
+POLL_SECS = 0.5
+
+_CHANGE_LOG = (
+    """CREATE TABLE IF NOT EXISTS user_changes (
+           username TEXT PRIMARY KEY,
+           seq      INTEGER NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS user_changes_seq ON user_changes(seq)",
+    """CREATE TRIGGER IF NOT EXISTS users_log_ins AFTER INSERT ON users BEGIN
+           INSERT OR REPLACE INTO user_changes
+               VALUES (NEW.username, (SELECT IFNULL(MAX(seq), 0) + 1 FROM user_changes));
+       END""",
+    # bookkeeping-only updates (last_login / last_seen) are not logged
+    """CREATE TRIGGER IF NOT EXISTS users_log_upd
+           AFTER UPDATE OF username, password, role, usb_serial, usb_hash,
+                           usb_fail_count, usb_locked_until ON users BEGIN
+           INSERT OR REPLACE INTO user_changes
+               VALUES (OLD.username, (SELECT IFNULL(MAX(seq), 0) + 1 FROM user_changes));
+           INSERT OR REPLACE INTO user_changes
+               VALUES (NEW.username, (SELECT IFNULL(MAX(seq), 0) + 1 FROM user_changes));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS users_log_del AFTER DELETE ON users BEGIN
+           INSERT OR REPLACE INTO user_changes
+               VALUES (OLD.username, (SELECT IFNULL(MAX(seq), 0) + 1 FROM user_changes));
+       END""",
+)
+
+_COLUMNS = "username, password, role, usb_serial, usb_hash, usb_fail_count, usb_locked_until"
+
+
+def install_change_log(conn) -> None:
+    """Create the user_changes table and its triggers (idempotent)."""
+    for ddl in _CHANGE_LOG:
+        conn.execute(ddl)
+
+
+@dataclass(frozen=True)
+class UserRecord:
+    username: str
+    password: bytes                 # salt + PBKDF2 hash (utils.db_setup)
+    role: str
+    usb_serial: str | None
+    usb_hash: str | None
+    usb_fail_count: int
+    usb_locked_until: int
+
+    @classmethod
+    def from_row(cls, row) -> "UserRecord":
+        name, pw, role, serial, digest, fails, locked = row
+        return cls(name, pw, role, serial, digest, fails or 0, locked or 0)
+
+
+class UserDirectory:
+    """get(username) / put(record) / refresh(); thread-safe."""
+
+    def __init__(self, path: str | Path | None = None, poll_secs: float = POLL_SECS,
+                 snapshot=None):
+        self.path, self.poll_secs = path, poll_secs
+        self.snapshot = snapshot or (lambda: lambda rec: rec)   # → overlay(rec) for one read
+        self._users: dict[str, UserRecord] = {}
+        self._conn = None
+        self._version = None            # PRAGMA data_version last seen
+        self._seq = 0                   # highest user_changes.seq applied
+        self._polled = 0.0
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """(Re)read the whole table, e.g. after the file was restored from a backup."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = db.connect(self.path)
+            install_change_log(self._conn)
+            self._version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            overlay = self.snapshot()
+            self._conn.execute("BEGIN")
+            try:
+                self._seq = self._conn.execute(
+                    "SELECT IFNULL(MAX(seq), 0) FROM user_changes").fetchone()[0]
+                rows = self._conn.execute(f"SELECT {_COLUMNS} FROM users").fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+            self._users = {r[0]: overlay(UserRecord.from_row(r)) for r in rows}
+            self._polled = time.monotonic()
+
+    def refresh(self, force: bool = False) -> int:
+        """Apply rows other connections changed; returns how many were re-read."""
+        if self._conn is None:
+            self.load()
+            return len(self._users)
+        now = time.monotonic()
+        if not force and now - self._polled < self.poll_secs:
+            return 0
+        if not self._lock.acquire(blocking=force):
+            return 0                    # another thread is already polling
+        try:
+            self._polled = now
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return 0
+            self._version = version
+            overlay = self.snapshot()   # before the read – see the module docstring
+            self._conn.execute("BEGIN")
+            try:
+                changed = self._conn.execute(
+                    "SELECT username, seq FROM user_changes WHERE seq > ?", (self._seq,)).fetchall()
+                fresh = {}
+                for name, seq in changed:
+                    row = self._conn.execute(f"SELECT {_COLUMNS} FROM users WHERE username=?",
+                                             (name,)).fetchone()
+                    fresh[name] = UserRecord.from_row(row) if row else None
+                    self._seq = max(self._seq, seq)
+            finally:
+                self._conn.execute("COMMIT")
+            for name, rec in fresh.items():
+                if rec is None:
+                    self._users.pop(name, None)
+                else:                   # overlay now, under the lock put() also takes
+                    self._users[name] = overlay(rec)
+            metrics.incr("userdir.reloaded", len(fresh))
+            return len(fresh)
+        finally:
+            self._lock.release()
+
+    def get(self, username: str) -> UserRecord | None:
+        """Current record for `username`, or None if there is no such user."""
+        self.refresh()
+        rec = self._users.get(username)
+        if rec is None:
+            self.refresh(force=True)    # maybe added a moment ago
+            rec = self._users.get(username)
+        return rec
+
+    def put(self, rec: UserRecord) -> None:
+        """Record a change this process has written (or is about to write) itself."""
+        with self._lock:
+            self._users[rec.username] = rec
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __len__(self) -> int:
+        return len(self._users)
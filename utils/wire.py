@@ -0,0 +1,251 @@
+# utils/wire.py
+"""
+Secure-Chat wire protocol v2 (binary), shared by server and clients.
+
+v1 frames are ASCII ("CIPH alice bob <base64>").  v2 is negotiated with
+a `HELLO 2` frame before the credentials and only changes the chat phase:
+
+    op (1 byte) | fields …
+
+    OP_PING    –
+    OP_CIPH    varint sender_id | varint recipient_id | raw ciphertext
+    OP_BCAST   varint sender_id | raw ciphertext
+    OP_USERS   varint seq | (varint id | varint len | utf-8 name) *   – presence snapshot
+    OP_PRESENCE varint seq | (varint id | varint len | utf-8 name) *  – delta, len 0 = left
+    OP_KEYPUB  varint id | compact public key (SEC1 point or raw X25519)
+    OP_KEYDIR  varint epoch | varint since | varint version |
+               (varint id | varint len | name | varint len | key) *
+    OP_ENV     varint sender_id | varint n | (varint id | varint len | wrapped key) * n | body
+    OP_SCIPH   varint sender_id | varint recipient_id | varint seq | raw ciphertext
+    OP_ACK     varint seq                                   – server → sender, cumulative
+    OP_V1PEERS varint id *                                  – these online users speak v1
+
+OP_ENV carries one message encrypted once for many recipients
+(security.seal_envelope).  The client sends every recipient's wrapped
+key in one frame; the server forwards each recipient the same body with
+only its own entry (n = 1).  The v1 form is
+"ENV <sender> <b64 body> <name>:<b64 key>,<name>:<b64 key>,…".
+
+OP_SCIPH is OP_CIPH with the sender's sequence number (v1: a fourth
+field, "CIPH <from> <to> <seq> <b64>"; the v1 ack is "ACK <seq>").  The
+server acknowledges in batches and drops repeats; v2 receivers drop them
+too (utils.delivery).  v1 sessions always receive the 4-field CIPH, so
+legacy clients keep parsing it.
+
+v1 clients cannot read envelopes.  The server tells v2 clients which
+online users are on v1 (OP_V1PEERS at login, then one entry per v1
+login; a presence "left" ends it), and senders give those a per-peer
+CIPH instead; the server never forwards a v2 ENV to a v1 session.
+
+Keys: the server keeps a versioned key directory.  At login a v2 client
+sends "KEYPUB <b64 key> <epoch>:<version>" with the directory version it
+last saw and receives the keys changed since (everything if the epoch –
+one per server run – differs) as OP_KEYDIR bundles, split so each fits
+one frame; chunk k+1's `since` is chunk k's `version`.  Later changes
+arrive as one-entry OP_KEYDIR deltas; a client only advances its version
+when `since` is not ahead of it.  An entry with an empty key is a
+tombstone: the user went offline and the key is no longer published.
+
+Presence: a snapshot at login, then one OP_PRESENCE delta per debounce
+window, each with the next seq.  A client that sees a gap sends a bare
+OP_USERS (USERS_REQ) and gets a fresh snapshot.
+
+User IDs are handed out by the server for the lifetime of the process
+and never reused, so a client can keep its id → name map across USERS
+updates.  Opcodes stay below 0x20, so a v2 frame can never be mistaken
+for an ASCII v1 frame and one dispatcher can serve both.
+"""
+from __future__ import annotations
+
+PROTO_V1 = 1
+PROTO_V2 = 2
+
+OP_PING   = 0x01
+OP_CIPH   = 0x02
+OP_BCAST  = 0x03
+OP_USERS  = 0x04
+OP_KEYPUB = 0x05
+OP_ENV    = 0x06
+OP_PRESENCE = 0x07
+OP_KEYDIR = 0x08
+OP_SCIPH  = 0x09
+OP_ACK    = 0x0A
+OP_V1PEERS = 0x0B
+
+_OP_LIMIT = 0x20                      # first byte below this ⇒ v2 frame
+
+
+def is_v2(frame) -> bool:
+    return len(frame) > 0 and frame[0] < _OP_LIMIT
+
+
+# ── varints (LEB128, unsigned) ──────────────────────────────────────
+def put_varint(n: int) -> bytes:
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def get_varint(buf, pos: int) -> tuple[int, int]:
+    """(value, next_pos); raises ValueError on truncated input."""
+    shift = value = 0
+    while True:
+        if pos >= len(buf) or shift > 63:
+            raise ValueError("bad varint")
+        b = buf[pos]; pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+# ── encoders (payloads; frame them with utils.framing.encode_frame) ─
+def cipher(sender_id: int, recipient_id: int, blob) -> bytes:
+    return bytes((OP_CIPH,)) + put_varint(sender_id) + put_varint(recipient_id) + blob
+
+
+def cipher_seq(sender_id: int, recipient_id: int, seq: int, blob) -> bytes:
+    return bytes((OP_SCIPH,)) + put_varint(sender_id) + put_varint(recipient_id) + put_varint(seq) + blob
+
+
+def ack(seq: int) -> bytes:
+    return bytes((OP_ACK,)) + put_varint(seq)
+
+
+def v1_peers(ids) -> bytes:
+    return bytes((OP_V1PEERS,)) + b"".join(put_varint(uid) for uid in ids)
+
+
+def bcast(sender_id: int, blob) -> bytes:
+    return bytes((OP_BCAST,)) + put_varint(sender_id) + blob
+
+
+def _named_ids(op: int, seq: int, pairs) -> bytes:
+    out = bytearray((op,)) + put_varint(seq)
+    for uid, name in pairs:
+        raw = name.encode()
+        out += put_varint(uid) + put_varint(len(raw)) + raw
+    return bytes(out)
+
+
+def users(seq: int, pairs) -> bytes:
+    """pairs: iterable of (id, name)."""
+    return _named_ids(OP_USERS, seq, pairs)
+
+
+def presence(seq: int, changes) -> bytes:
+    """changes: iterable of (id, name) for joins and (id, "") for leaves."""
+    return _named_ids(OP_PRESENCE, seq, changes)
+
+
+def keypub(uid: int, pem: bytes) -> bytes:
+    return bytes((OP_KEYPUB,)) + put_varint(uid) + pem
+
+
+def env(sender_id: int, wraps, body) -> bytes:
+    """wraps: iterable of (recipient_id, wrapped_key)."""
+    wraps = list(wraps)
+    out = bytearray((OP_ENV,)) + put_varint(sender_id) + put_varint(len(wraps))
+    for rid, wk in wraps:
+        out += put_varint(rid) + put_varint(len(wk)) + wk
+    out += body
+    return bytes(out)
+
+
+def keydir(epoch: int, since: int, version: int, entries) -> bytes:
+    """entries: iterable of (id, name, key)."""
+    out = bytearray((OP_KEYDIR,)) + put_varint(epoch) + put_varint(since) + put_varint(version)
+    for uid, name, key in entries:
+        raw = name.encode()
+        out += put_varint(uid) + put_varint(len(raw)) + raw + put_varint(len(key)) + key
+    return bytes(out)
+
+
+PING = bytes((OP_PING,))
+USERS_REQ = bytes((OP_USERS,))            # client → server: send me a snapshot
+
+
+# ── decoders ────────────────────────────────────────────────────────
+def parse_cipher(frame) -> tuple[int, int, memoryview]:
+    sid, pos = get_varint(frame, 1)
+    rid, pos = get_varint(frame, pos)
+    return sid, rid, memoryview(frame)[pos:]
+
+
+def parse_cipher_seq(frame) -> tuple[int, int, int, memoryview]:
+    sid, pos = get_varint(frame, 1)
+    rid, pos = get_varint(frame, pos)
+    seq, pos = get_varint(frame, pos)
+    return sid, rid, seq, memoryview(frame)[pos:]
+
+
+def parse_ack(frame) -> int:
+    return get_varint(frame, 1)[0]
+
+
+def parse_v1_peers(frame) -> list[int]:
+    ids, pos = [], 1
+    while pos < len(frame):
+        uid, pos = get_varint(frame, pos)
+        ids.append(uid)
+    return ids
+
+
+def parse_bcast(frame) -> tuple[int, memoryview]:
+    sid, pos = get_varint(frame, 1)
+    return sid, memoryview(frame)[pos:]
+
+
+def parse_users(frame) -> tuple[int, list[tuple[int, str]]]:
+    """(seq, [(id, name)]); also parses OP_PRESENCE, where name "" means left."""
+    seq, pos = get_varint(frame, 1)
+    pairs = []
+    while pos < len(frame):
+        uid, pos = get_varint(frame, pos)
+        n, pos = get_varint(frame, pos)
+        pairs.append((uid, bytes(frame[pos:pos + n]).decode()))
+        pos += n
+    return seq, pairs
+
+
+parse_presence = parse_users
+
+
+def parse_keypub(frame) -> tuple[int, bytes]:
+    uid, pos = get_varint(frame, 1)
+    return uid, bytes(frame[pos:])
+
+
+def parse_env(frame) -> tuple[int, list[tuple[int, memoryview]], memoryview]:
+    view = memoryview(frame)
+    sid, pos = get_varint(frame, 1)
+    n, pos = get_varint(frame, pos)
+    wraps = []
+    for _ in range(n):
+        rid, pos = get_varint(frame, pos)
+        size, pos = get_varint(frame, pos)
+        if pos + size > len(frame):
+            raise ValueError("truncated envelope")
+        wraps.append((rid, view[pos:pos + size]))
+        pos += size
+    return sid, wraps, view[pos:]
+
+
+def parse_keydir(frame) -> tuple[int, int, int, list[tuple[int, str, bytes]]]:
+    """(epoch, since, version, [(id, name, key)])."""
+    epoch, pos = get_varint(frame, 1)
+    since, pos = get_varint(frame, pos)
+    version, pos = get_varint(frame, pos)
+    entries = []
+    while pos < len(frame):
+        uid, pos = get_varint(frame, pos)
+        n, pos = get_varint(frame, pos)
+        name = bytes(frame[pos:pos + n]).decode(); pos += n
+        n, pos = get_varint(frame, pos)
+        if pos + n > len(frame):
+            raise ValueError("truncated key directory")
+        entries.append((uid, name, bytes(frame[pos:pos + n]))); pos += n
+    return epoch, since, version, entries
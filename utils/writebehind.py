@@ -0,0 +1,107 @@
+# utils/writebehind.py
+"""
+Write-behind buffer for per-user bookkeeping columns in users.db.
+
+USB fail counters / lock-outs and last-login / last-seen stamps used to
+cost one committed write each, so a storm of bad USB attempts meant one
+commit (and sync) per attempt.  Now:
+
+• update(username, col=value, …) only records the latest value per
+  (user, column) in memory – repeated changes to one row coalesce
+• flush() writes everything pending in ONE transaction; the server calls
+  it from its once-a-second sweeper and at shutdown, so commits are
+  bounded by the flush rate whatever the attempt rate
+• the in-memory value is what counts: snapshot() freezes pending (and
+  in-flight) values into an overlay for rows re-read from disk, so
+  utils.userdir never hands out a counter older than the one buffered
+• a failed flush puts its batch back (newer updates win) and re-raises
+
+An edit from another process to the same columns inside the same flush
+window is overwritten by the buffered value.
+"""
+from __future__ import annotations
+import threading, time
+from dataclasses import fields, replace
+from pathlib import Path
+
+from utils import db, metrics
+
+COLUMNS = ("usb_fail_count", "usb_locked_until", "last_login", "last_seen")
+
+
+class WriteBehind:
+    """update(user, **cols) / snapshot() / overlay(record) / flush(); thread-safe."""
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = path
+        self._pending: dict[str, dict[str, int]] = {}
+        self._inflight: dict[str, dict[str, int]] = {}   # taken by a flush, not yet committed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def update(self, username: str, **cols: int) -> None:
+        bad = set(cols) - set(COLUMNS)
+        if bad:
+            raise ValueError(f"not a write-behind column: {', '.join(sorted(bad))}")
+        with self._lock:
+            self._pending.setdefault(username, {}).update(cols)
+
+    def snapshot(self):
+        """
+        overlay(rec) over the values buffered right now.  Take it before
+        reading rows: a flush that commits afterwards only writes values it
+        already holds, and clearing them from here no longer matters.
+        """
+        with self._lock:
+            held = {user: {**cols, **self._pending.get(user, {})}
+                    for user, cols in self._inflight.items()}
+            for user, cols in self._pending.items():
+                held.setdefault(user, cols.copy())
+
+        def overlay(rec):
+            cols = held.get(rec.username)
+            if not cols:
+                return rec
+            names = {f.name for f in fields(rec)}
+            cols = {k: v for k, v in cols.items() if k in names}
+            return replace(rec, **cols) if cols else rec
+        return overlay
+
+    def overlay(self, rec):
+        """`rec` (a dataclass row, e.g. userdir.UserRecord) with buffered values applied."""
+        return self.snapshot()(rec)
+
+    def flush(self) -> int:
+        """Write all pending values in one transaction; returns rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return 0
+            t0 = time.perf_counter()
+            groups: dict[tuple, list] = {}           # column set -> [(values…, username)]
+            for user, cols in batch.items():
+                names = tuple(sorted(cols))
+                groups.setdefault(names, []).append((*(cols[n] for n in names), user))
+            try:
+                with db.transaction(self.path) as conn:
+                    for names, rows in groups.items():
+                        sets = ", ".join(f"{n}=?" for n in names)
+                        conn.executemany(f"UPDATE users SET {sets} WHERE username=?", rows)
+            except BaseException:
+                with self._lock:
+                    for user, cols in batch.items():
+                        self._pending[user] = {**cols, **self._pending.get(user, {})}
+                    self._inflight = {}
+                raise
+            with self._lock:
+                self._inflight = {}
+            metrics.incr("writebehind.flushes")
+            metrics.incr("writebehind.rows", len(batch))
+            metrics.observe("writebehind.flush", time.perf_counter() - t0)
+            return len(batch)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)